@@ -0,0 +1,393 @@
+import os
+import json
+import hashlib
+import threading
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+from master_cache import CACHE_DIR, SEAT_SEP, SEATS_COL, data_version, prefix_matches, row_digest, seated_mask
+from sheets import HAND_ID_COL
+
+# 物化統計表：日 / 月 / 年 / 全部 四個粒度，每個時段記住
+#   total  各人總分          hands  局數            days  有打牌嘅日數 (日粒度係 1)
+#   wins   各人食糊次數      feeds  各人出統次數    zimo  各人自摸次數
+#   hist   各人單局得分 → 次數 (用嚟喺刪除之後都攞得返準確嘅最大單局；輪流上枱嘅枱只計有落枱嗰啲局)
+# Master Record 只 append 嘅話只加新行；計分頁 append / undo / 改動就直接加減嗰一局，
+# 所有總結 widget 都變成查表。
+
+GRAINS = ("day", "month", "year", "all")
+SAVE_INTERVAL = 5.0
+
+
+def _periods(day):
+    return [("day", day), ("month", day[:7]), ("year", day[:4]), ("all", "all")]
+
+
+class Aggregates:
+    def __init__(self, players, cache_dir=CACHE_DIR):
+        self.players = list(players)
+        digest = hashlib.sha1(json.dumps(self.players).encode("utf-8")).hexdigest()[:12]
+        self.path = os.path.join(cache_dir, f"aggregates_{digest}.json")
+        self._lock = threading.RLock()
+        self.tables = {g: {} for g in GRAINS}
+        # rows / digest / version：同步到 Master Record 邊一行 (digest 見 master_cache.row_digest)
+        # reconcile：改過 Master 已經有嘅日子，Master 下次變版本就成個重建對返
+        self.meta = {"rows": 0, "digest": "0", "version": None, "last_day": None, "reconcile": False}
+        # 已經計咗入嚟、但 Master Record 未有嘅局 (今日分頁)：HandID → row
+        self.live = {}
+        self._saved_at = float("-inf")
+        self._timer = None
+        self._load()
+
+    # --- 持久化 ---
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("players") != self.players:
+            return
+        self.tables = data["tables"]
+        self.meta = data["meta"]
+        self.live = data["live"]
+
+    def save(self, force=False):
+        # 磁碟只係暖啟動用：寫入頻密時最多每 SAVE_INTERVAL 秒寫一次，
+        # 間隔入面嘅改動由一個 timer 喺間隔完咗之後補寫 (一輪寫入最尾嗰幾局唔會漏)
+        with self._lock:
+            now = time.monotonic()
+            wait = self._saved_at + SAVE_INTERVAL - now
+            if not force and wait > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self._trailing_save)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._saved_at = now
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            body = json.dumps({"players": self.players, "tables": self.tables,
+                               "meta": self.meta, "live": self.live}, ensure_ascii=False)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(body)
+            os.replace(tmp, self.path)
+
+    def _trailing_save(self):
+        with self._lock:
+            self._timer = None
+            self.save(force=True)
+
+    # --- 單局加減 ---
+    def _bucket(self):
+        n = len(self.players)
+        return {"total": [0] * n, "hands": 0, "days": 0, "wins": [0] * n, "feeds": [0] * n,
+                "zimo": [0] * n, "hist": [{} for _ in range(n)]}
+
+    def row_from(self, day, rec):
+        """
+        一局 (dict / Series，有玩家分數同 Winner / Loser / Method) → 內部用嘅 row。
+        有 Seats 欄就用佢分邊個落枱；冇就當有分數欄嘅玩家有落枱 (計分頁只傳落枱嗰幾個)。
+        """
+        seats = rec.get(SEATS_COL)
+        if isinstance(seats, str):
+            seated = [p in seats.split(SEAT_SEP) for p in self.players]
+        else:
+            seated = [p in rec for p in self.players]
+        return {"day": day, "scores": [int(rec.get(p, 0) or 0) for p in self.players],
+                "winner": str(rec.get("Winner", "")), "loser": str(rec.get("Loser", "")),
+                "method": str(rec.get("Method", "")), "seated": seated}
+
+    def apply(self, row, sign=1):
+        """加 (sign=1) 或者減 (sign=-1) 一局"""
+        with self._lock:
+            idx = {p: i for i, p in enumerate(self.players)}
+            w, l = idx.get(row["winner"], -1), idx.get(row["loser"], -1)
+            # 舊版 live 記錄冇 seated：當全部人有落枱
+            seated = row.get("seated") or [True] * len(self.players)
+            for grain, key in _periods(row["day"]):
+                b = self.tables[grain].setdefault(key, self._bucket())
+                b["hands"] += sign
+                for i, s in enumerate(row["scores"]):
+                    b["total"][i] += sign * s
+                    if not seated[i]:
+                        continue
+                    h = b["hist"][i]
+                    h[str(s)] = h.get(str(s), 0) + sign
+                    if h[str(s)] <= 0:
+                        del h[str(s)]
+                if w >= 0:
+                    b["wins"][w] += sign
+                    if row["method"] == "自摸":
+                        b["zimo"][w] += sign
+                if l >= 0 and row["method"] == "出統":
+                    b["feeds"][l] += sign
+            # 日數：某日由 0 局變 1 局 (或者相反) 先會變
+            day = self.tables["day"][row["day"]]
+            if (sign > 0 and day["hands"] == 1) or (sign < 0 and day["hands"] == 0):
+                for grain, key in _periods(row["day"]):
+                    self.tables[grain][key]["days"] += sign
+            for grain, key in _periods(row["day"]):
+                if self.tables[grain][key]["hands"] <= 0:
+                    del self.tables[grain][key]
+
+    # --- 批量建立 (向量化) ---
+    def _tables_from(self, df):
+        """由一批局 (標準型別) 計出四個粒度嘅統計表"""
+        tables = {g: {} for g in GRAINS}
+        if df.empty:
+            return tables
+        dates = df['Date']
+        y, m, d = dates.dt.year.to_numpy(), dates.dt.month.to_numpy(), dates.dt.day.to_numpy()
+        day_key = (y * 10000 + m * 100 + d).astype("int64")
+        keys = {"day": day_key, "month": day_key // 100, "year": day_key // 10000,
+                "all": np.zeros(len(df), dtype="int64")}
+        fmt = {"day": lambda k: f"{k // 10000:04d}-{k // 100 % 100:02d}-{k % 100:02d}",
+               "month": lambda k: f"{k // 100:04d}-{k % 100:02d}",
+               "year": lambda k: f"{k:04d}", "all": lambda k: "all"}
+        scores = df[self.players].to_numpy(dtype="int64")
+        lo = int(scores.min())
+        span = int(scores.max()) - lo + 1
+        n = len(self.players)
+        winner = pd.Categorical(df['Winner'], categories=self.players).codes.astype("int64")
+        loser = pd.Categorical(df['Loser'], categories=self.players).codes.astype("int64")
+        method = df['Method'].astype(str).to_numpy()
+        seated = seated_mask(df, self.players) if SEATS_COL in df.columns else None
+        for grain, key in keys.items():
+            uniq, inv = np.unique(key, return_inverse=True)
+            k = len(uniq)
+            total = np.zeros((k, n), dtype="int64")
+            np.add.at(total, inv, scores)
+            hands = np.bincount(inv, minlength=k)
+            count = lambda mask, who: np.bincount(inv[mask] * n + who[mask], minlength=k * n).reshape(k, n)
+            wins = count(winner >= 0, winner)
+            feeds = count((loser >= 0) & (method == "出統"), loser)
+            zimo = count((winner >= 0) & (method == "自摸"), winner)
+            # (時段, 日子) / (時段, 分數) 砌成一個 int64 再 unique，比二維 unique 快好多
+            days = np.bincount(np.unique(inv * 100_000_000 + day_key) // 100_000_000, minlength=k)
+            hist = [[{} for _ in range(n)] for _ in range(k)]
+            for i in range(n):
+                sel = slice(None) if seated is None else seated[:, i]
+                pairs, counts = np.unique(inv[sel] * span + (scores[sel, i] - lo), return_counts=True)
+                for pair, c in zip(pairs.tolist(), counts.tolist()):
+                    hist[pair // span][i][str(pair % span + lo)] = c
+            table = tables[grain]
+            for j, u in enumerate(uniq.tolist()):
+                table[fmt[grain](u)] = {"total": total[j].tolist(), "hands": int(hands[j]), "days": int(days[j]),
+                                        "wins": wins[j].tolist(), "feeds": feeds[j].tolist(),
+                                        "zimo": zimo[j].tolist(), "hist": hist[j]}
+        return tables
+
+    def _merge(self, tables):
+        """將一批新局嘅統計表加入現有嘅；日數只計之前未出現過嘅日子"""
+        new_days = Counter(p for k in tables["day"] if k not in self.tables["day"] for p in _periods(k))
+        for grain in GRAINS:
+            mine = self.tables[grain]
+            for key, b in tables[grain].items():
+                days = new_days[(grain, key)]
+                cur = mine.get(key)
+                if cur is None:
+                    mine[key] = dict(b, days=days)
+                    continue
+                cur["hands"] += b["hands"]
+                cur["days"] += days if grain != "day" else 0
+                for field in ("total", "wins", "feeds", "zimo"):
+                    cur[field] = [a + c for a, c in zip(cur[field], b[field])]
+                for h, add in zip(cur["hist"], b["hist"]):
+                    for s, c in add.items():
+                        h[s] = h.get(s, 0) + c
+
+    # --- 同 Master Record 同步 ---
+    def sync(self, frame):
+        """追到 frame 最新一行；live 入面已經計過嘅局 (按 HandID) 會略過"""
+        with self._lock:
+            version = data_version(frame)
+            if self.meta["version"] == version:
+                return
+            n = self.meta["rows"]
+            ids = frame[HAND_ID_COL].astype(str) if HAND_ID_COL in frame.columns else None
+            if (n and not self.meta.get("reconcile") and "digest" in self.meta
+                    and prefix_matches(frame, n, int(self.meta["digest"], 16), self.meta["version"])):
+                digest = (int(self.meta["digest"], 16) + row_digest(frame.iloc[n:], n)) % 2 ** 64
+                tail = frame.iloc[n:]
+                tail_ids = ids.iloc[n:] if ids is not None else None
+                if tail_ids is not None and self.live:
+                    seen = tail_ids.isin(self.live.keys()).to_numpy()
+                    for hid in tail_ids[seen]:
+                        self.live.pop(hid, None)
+                    tail = tail[~seen]
+                self._merge(self._tables_from(tail[tail['Date'].notna()]))
+            else:
+                # 舊數據改咗 (或者改過 Master 已有嘅日子)：成個重建，再加返未入 Master 嘅 live 局
+                digest = row_digest(frame)
+                self.tables = self._tables_from(frame[frame['Date'].notna()])
+                if ids is not None:
+                    for hid in set(self.live) & set(ids):
+                        self.live.pop(hid)
+                for row in self.live.values():
+                    self.apply(row)
+            self.meta.update(rows=len(frame), version=version, digest=f"{digest:016x}", reconcile=False,
+                             last_day=frame['Date'].max().strftime("%Y-%m-%d") if len(frame) else None)
+            self.save(force=True)
+
+    def reconcile_day(self, day, frame):
+        """
+        Master Record 未有嘅日子 (例如今日分頁)：用分頁內容對一次 live，
+        其他裝置加 / 刪嘅局都會計返啱。冇 HandID 嘅舊行用「分頁#行號」做識別 (同合併流程一致)。
+        """
+        with self._lock:
+            if self.meta["last_day"] and day <= self.meta["last_day"]:
+                return
+            current = {}
+            for i, rec in enumerate(frame.to_dict("records")):
+                hid = rec.get(HAND_ID_COL)
+                hid = str(hid) if hid is not None and not pd.isna(hid) and str(hid) else f"{day}#{i + 2}"
+                current[hid] = self.row_from(day, rec)
+            known = {h: r for h, r in self.live.items() if r["day"] == day}
+            changed = False
+            for hid in set(known) - set(current):
+                self.apply(self.live.pop(hid), -1)
+                changed = True
+            for hid, row in current.items():
+                if hid in known and known[hid] == row:
+                    continue
+                if hid in known:
+                    self.apply(known[hid], -1)
+                self.apply(row)
+                self.live[hid] = row
+                changed = True
+            if changed:
+                self.save()
+
+    # --- 查表 ---
+    def lookup(self, grain, key):
+        """返回 DataFrame (index = 玩家)：total / wins / feeds / zimo / max，加 hands / days 喺 attrs"""
+        with self._lock:
+            b = self.tables[grain].get(key) or self._bucket()
+            out = pd.DataFrame({"total": b["total"], "wins": b["wins"], "feeds": b["feeds"], "zimo": b["zimo"],
+                                "max": [max(map(int, h), default=0) for h in b["hist"]]}, index=self.players)
+            out.attrs.update(hands=b["hands"], days=b["days"])
+            return out
+
+    def table(self, grain, field="total"):
+        """某粒度所有時段 (新到舊)：total / wins / feeds / zimo 係 時段 × 玩家，hands / days 係 Series"""
+        with self._lock:
+            keys = sorted(self.tables[grain], reverse=True)
+            rows = [self.tables[grain][k][field] for k in keys]
+        if field in ("hands", "days"):
+            return pd.Series(rows, index=keys, dtype="int64")
+        return pd.DataFrame(rows, index=keys, columns=self.players, dtype="int64")
+
+    def periods(self, grain):
+        with self._lock:
+            return sorted(self.tables[grain], reverse=True)
+
+
+class AggregatingStore:
+    """
+    包住一個 HandStore：append / delete / update_cell 成功之後即刻更新物化統計，
+    day_frame 讀到嘅當日分頁會同 live 對一次。其他方法原封不動交俾內層 store。
+    """
+
+    SCORE_FIELDS = ("Winner", "Loser", "Method", "Fan")
+
+    def __init__(self, store, aggregates):
+        self.store = store
+        self.aggregates = aggregates
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def _version(self):
+        version = getattr(self.store, "version", None)
+        return version() if version is not None else None
+
+    def _after_write(self, before, day=None):
+        meta = self.aggregates.meta
+        # SQLite：統計表寫之前已經係最新版本嘅話，寫完都係最新，唔使等下次 sync 重建；
+        # 不過 rows / digest 已經唔係新內容，之後版本再變 (其他 process 寫入) 就要成個重建，唔可以當 append
+        if before is not None and meta["version"] == before:
+            meta.update(version=self._version(), rows=0)
+        # Sheets：改咗 Master Record 已經有嘅日子，Master 仲係舊內容；下次 Master 變版本就對返
+        if self._track() and day is not None and meta["last_day"] and day <= meta["last_day"]:
+            meta["reconcile"] = True
+        self.aggregates.save()
+
+    def _track(self):
+        # 有自己版本號嘅後端 (SQLite) 唔使記 live，全歷史本身已經包含新局
+        return getattr(self.store, "version", None) is None
+
+    def _key(self, day, hand_id, hint):
+        # 冇 HandID 嘅舊行喺 live 入面用「分頁#行號」
+        return hand_id or (f"{day}#{hint}" if hint else None)
+
+    def _counted(self, day, hand_id):
+        # Sheets：Master Record 未有嘅日子，只有 live 入面嘅局先計過 (例如未讀過分頁就被刪)
+        meta = self.aggregates.meta
+        return (not self._track() or hand_id in self.aggregates.live
+                or bool(meta["last_day"] and day <= meta["last_day"]))
+
+    def _current(self, day, hand_id, expected):
+        # expected 有齊分數同 Winner / Loser / Method 就唔使再讀分頁
+        needed = self.aggregates.players + ["Winner", "Loser", "Method"]
+        if expected and all(c in expected for c in needed):
+            return self.aggregates.row_from(day, expected)
+        df = self.store.day_frame(day, ttl=0)
+        if hand_id and HAND_ID_COL in df.columns:
+            hit = df[df[HAND_ID_COL].astype(str) == str(hand_id)]
+            if len(hit):
+                return self.aggregates.row_from(day, hit.iloc[0])
+        return None
+
+    def day_frame(self, day, ttl=5, kind="read"):
+        df = self.store.day_frame(day, ttl=ttl, kind=kind)
+        if self._track():
+            self.aggregates.reconcile_day(day, df)
+        elif self.aggregates.meta["version"] != self._version():
+            # SQLite：全歷史喺本地，版本唔同就直接追
+            self.aggregates.sync(self.store.master_frame())
+        return df
+
+    def append(self, day, entry):
+        before = self._version()
+        hand_id, hint = self.store.append(day, entry)
+        row = self.aggregates.row_from(day, entry)
+        self.aggregates.apply(row)
+        if self._track():
+            self.aggregates.live[hand_id] = row
+        self._after_write(before)
+        return hand_id, hint
+
+    def delete(self, day, hand_id=None, hint=None, expected=None):
+        key = self._key(day, hand_id, hint)
+        row = self._current(day, hand_id, expected) if self._counted(day, key) else None
+        before = self._version()
+        out = self.store.delete(day, hand_id, hint=hint, expected=expected)
+        if row is not None:
+            self.aggregates.apply(row, -1)
+            self.aggregates.live.pop(key, None)
+            self._after_write(before, day)
+        return out
+
+    def update_cell(self, day, column, value, hand_id=None, hint=None, expected=None):
+        affects = column in self.aggregates.players or column in self.SCORE_FIELDS
+        key = self._key(day, hand_id, hint)
+        row = self._current(day, hand_id, expected) if affects and self._counted(day, key) else None
+        before = self._version()
+        out = self.store.update_cell(day, column, value, hand_id, hint=hint, expected=expected)
+        if row is not None:
+            new = dict(row, scores=list(row["scores"]))
+            if column in self.aggregates.players:
+                new["scores"][self.aggregates.players.index(column)] = int(value)
+            elif column != "Fan":
+                new[column.lower()] = str(value)
+            self.aggregates.apply(row, -1)
+            self.aggregates.apply(new)
+            if key in self.aggregates.live:
+                self.aggregates.live[key] = new
+            self._after_write(before, day)
+        return out
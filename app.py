@@ -1,6 +1,7 @@
+import time
 import streamlit as st
-import pandas as pd
-from utils import load_master_data
+from metrics import get_metrics
+from routes import DEFAULT_PAGE, PAGES, load_view
 
 # --- 1. 頁面配置 ---
 st.set_page_config(
@@ -10,84 +11,132 @@ st.set_page_config(
 )
 
 # --- 2. 常數與全域配置 ---
-# 這是你的 Spreadsheet ID
-SHEET_ID = "12rjgnWh2gMQ05TsFR6aCCn7QXB6rpa-Ylb0ma4Cs3E4"
-
-# 重點：Master Record 的 GID 必須是 2131114078 (根據你提供的連結)
-# 並且網址必須是 /export?format=csv 才能讓 pd.read_csv 讀到正確的欄位
-MASTER_GID = "2131114078" 
-CSV_URL = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid={MASTER_GID}"
+# Spreadsheet ID / Master Record GID 同 CSV 匯出網址喺 utils.py 定義 (只有一份)
+from utils import MASTER_CSV_URL
+CSV_URL = MASTER_CSV_URL
 
+# 預設枱嘅玩家 (Master Record 嘅欄)；其他枱嘅名單喺 .streamlit/groups.json (見 groups.py)
 PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
 
-# --- 3. 數據初始化 ---
-# 呼叫你 utils.py 裡的 load_master_data
-df_master = load_master_data(CSV_URL, "Master Record", PLAYERS)
-
-# --- 4. 路由狀態管理 ---
+# --- 3. 路由狀態管理 ---
 if 'page' not in st.session_state:
-    st.session_state.page = "📊 總體概況"
+    st.session_state.page = DEFAULT_PAGE
 
-# --- 5. 側邊欄導航 ---
+# --- 4. 側邊欄導航 ---
 with st.sidebar:
     st.markdown("# 🀄 G 啦，雀神終端")
     st.info("量化麻將數據監控系統")
     st.markdown("---")
-    
-    # 導覽按鈕
-    if st.button("📊 總體概況", use_container_width=True, type="primary" if st.session_state.page == "📊 總體概況" else "secondary"):
-        st.session_state.page = "📊 總體概況"
-        st.rerun()
-        
-    if st.button("🧮 快速計分", use_container_width=True, type="primary" if st.session_state.page == "🧮 快速計分" else "secondary"):
-        st.session_state.page = "🧮 快速計分"
-        st.rerun()
 
-    if st.button("🔍 今日戰局復盤", use_container_width=True, type="primary" if st.session_state.page == "🔍 今日戰局復盤" else "secondary"):
-        st.session_state.page = "🔍 今日戰局復盤"
-        st.rerun()
+    # 揀枱：每張枱有自己嘅名單、計分紀錄同快取 (只有一張枱就唔顯示)
+    from utils import DEFAULT_GROUP, get_groups
+    groups = get_groups(tuple(PLAYERS))
+    if len(groups) > 1:
+        st.selectbox("🀄 枱", list(groups), key="group")
+    group = groups.get(st.session_state.get("group"), groups[DEFAULT_GROUP])
+    st.session_state.active_group = group
+    PLAYERS = group.roster
+    if group.csv_url:
+        CSV_URL = group.csv_url
 
-    if st.button("🧠 專業量化分析", use_container_width=True, type="primary" if st.session_state.page == "🧠 專業量化分析" else "secondary"):
-        st.session_state.page = "🧠 專業量化分析"
-        st.rerun()
-        
-    if st.button("📜 歷史紀錄", use_container_width=True, type="primary" if st.session_state.page == "📜 歷史紀錄" else "secondary"):
-        st.session_state.page = "📜 歷史紀錄"
-        st.rerun()
+    # 導覽按鈕
+    for name in PAGES:
+        if st.button(name, use_container_width=True, type="primary" if st.session_state.page == name else "secondary"):
+            st.session_state.page = name
+            st.rerun()
 
     st.markdown("---")
-    
+
+# --- 5. 按頁面載入數據 ---
+# 只有宣告咗需要 Master Record 嘅頁面先會讀取 (計分頁唔會)
+page = PAGES[st.session_state.page]
+args = []
+metrics = get_metrics()
+load_started = time.perf_counter()
+if "master" in page["needs"]:
+    from audit import FLAGGED, get_audit
+    from utils import consolidate_daily_tabs, load_master_data, storage_backend
+    df_master = load_master_data(CSV_URL, "Master Record", PLAYERS)
+    args.append(df_master)
+
     # --- Debug 與 日期顯示 ---
-    if not df_master.empty:
-        # 如果欄位名稱還是連在一起，這裡會印出錯誤
-        if 'Date' in df_master.columns:
-            try:
-                last_date = df_master['Date'].iloc[-1].strftime('%Y-%m-%d')
-                st.caption(f"📅 數據同步至: {last_date}")
-            except:
-                st.caption(f"📅 數據讀取成功")
+    with st.sidebar:
+        if not df_master.empty:
+            # 如果欄位名稱還是連在一起，這裡會印出錯誤
+            if 'Date' in df_master.columns:
+                try:
+                    last_date = df_master['Date'].iloc[-1].strftime('%Y-%m-%d')
+                    st.session_state.last_synced = last_date
+                    st.caption(f"📅 數據同步至: {last_date}")
+                except:
+                    st.caption(f"📅 數據讀取成功")
+            else:
+                st.error("❌ CSV 欄位解析失敗")
+                # 輔助偵錯：顯示目前讀到的第一個欄位名稱是什麼
+                st.write(f"目前讀到的標題是: {df_master.columns[0]}")
         else:
-            st.error("❌ CSV 欄位解析失敗")
-            # 輔助偵錯：顯示目前讀到的第一個欄位名稱是什麼
-            st.write(f"目前讀到的標題是: {df_master.columns[0]}")
-    else:
-        st.warning("⚠️ 無法載入數據，請檢查權限")
+            st.warning("⚠️ 無法載入數據，請檢查權限")
+
+    # 數據核對 (audit.py)：合計唔係 0、分數同番數 / 方式對唔上、重複等有問題嘅局 (只核對新增嘅行)
+    if not df_master.empty:
+        audit_counts, audit_issues = get_audit(df_master, PLAYERS)
+        with st.sidebar:
+            if audit_counts[FLAGGED]:
+                with st.expander(f"⚠️ 數據核對：{audit_counts[FLAGGED]} 局有問題"):
+                    st.dataframe(audit_counts[audit_counts > 0], use_container_width=True)
+                    st.dataframe(audit_issues, hide_index=True, use_container_width=True)
+            else:
+                st.caption(f"✅ 數據核對：{len(df_master)} 局冇問題")
+
+    # 每日分頁 → Master Record (SQLite 後端本身已經係全歷史，唔使合併)
+    if storage_backend(group) == "sheets":
+        with st.sidebar:
+            if st.button("📥 合併每日分頁", use_container_width=True):
+                try:
+                    with st.spinner("合併中..."):
+                        res = consolidate_daily_tabs(PLAYERS)
+                    st.toast(f"已合併 {res['tabs']} 個分頁，新增 {res['rows']} 局"
+                             + (f"，更新 {res['updated']} 局、刪除 {res['deleted']} 局" if res["updated"] or res["deleted"] else ""))
+                    if res["rows"] or res["updated"] or res["deleted"]:
+                        st.rerun()
+                except Exception as e:
+                    st.error(f"合併失敗: {e}")
+            # 未合併嘅分頁 (包括今日) 先核對，有問題喺分頁改好先合併
+            if st.button("🔍 核對每日分頁", use_container_width=True):
+                from utils import audit_daily_tabs
+                try:
+                    with st.spinner("核對中..."):
+                        tab_counts, tab_issues = audit_daily_tabs(PLAYERS)
+                    if tab_counts[FLAGGED]:
+                        st.warning(f"每日分頁有 {tab_counts[FLAGGED]} 局有問題")
+                        st.dataframe(tab_issues, hide_index=True, use_container_width=True)
+                    else:
+                        st.toast("每日分頁冇問題")
+                except Exception as e:
+                    st.error(f"核對失敗: {e}")
+elif "history" in page["needs"]:
+    from utils import load_history
+    history = load_history(CSV_URL, PLAYERS)
+    args.append(history)
+    last_date = history.last_date()
+    if last_date is not None:
+        st.session_state.last_synced = last_date.strftime('%Y-%m-%d')
+    with st.sidebar:
+        st.caption(f"📅 數據同步至: {st.session_state.get('last_synced', '-')}")
+elif st.session_state.get('last_synced'):
+    with st.sidebar:
+        st.caption(f"📅 數據同步至: {st.session_state.last_synced}")
+
+metrics.observe("page_seconds", time.perf_counter() - load_started, page=st.session_state.page, stage="data")
 
 # --- 6. 導入視圖 (Views) ---
-# 注意：這些 function 需在對應的 views/ 檔案中定義
-from views.dashboard import show_dashboard
-from views.calculator import show_calculator
-from views.history import show_history
-from views.pro_analysis import show_pro_analysis 
-from views.daily_analysis import show_daily_analysis
+# 只 import 當前頁面嘅模組
+with metrics.timer("page_seconds", page=st.session_state.page, stage="render"):
+    load_view(st.session_state.page)(*args, PLAYERS)
 
-if st.session_state.page == "📊 總體概況":
-    show_dashboard(df_master, PLAYERS)
-elif st.session_state.page == "🧮 快速計分":
-    show_calculator(PLAYERS)
-elif st.session_state.page == "🔍 今日戰局復盤":
-    show_daily_analysis(PLAYERS)
-elif st.session_state.page == "🧠 專業量化分析":
-    show_pro_analysis(df_master, PLAYERS)
-elif st.session_state.page == "📜 歷史紀錄":
-    show_history(df_master, PLAYERS)
+# --- 7. 效能監控 (隱藏：網址加 ?admin=1) ---
+from views.admin import admin_enabled, show_admin_panel
+if admin_enabled():
+    show_admin_panel()
+# 定期寫 Prometheus text / JSON 去 .cache/metrics.*
+metrics.export()
@@ -0,0 +1,75 @@
+"""
+比較每局上傳嘅延遲：舊做法 (讀成張分頁 + 成張覆寫) vs HandSheet.append (單行 append)。
+append 嘅 header 讀取 (每個分頁 / process 只讀一次) 分開報告 (header_requests / header_ms)，唔計入每局數字。
+
+    python -m benchmarks.bench_append
+"""
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_sheet import FakeWorksheet
+from scheduler import Scheduler, set_scheduler
+from sheets import HandSheet, daily_header
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+SIZES = [0, 50, 100, 200, 300, 400, 500]
+
+
+def _entry(i):
+    return {"Date": "20:15", "Martin": 16, "Lok": -16, "Stephen": 0, "Fongka": 0,
+            "Winner": "Martin", "Loser": "Lok", "Method": "出統", "Fan": 3,
+            "Remark": f"hand {i}"}
+
+
+def _prefill(n):
+    header = daily_header(PLAYERS)
+    return [header] + [[_entry(i).get(c, "") for c in header] for i in range(n)]
+
+
+def legacy_submit(ws, entry):
+    rows = ws.get_all_values()
+    header = rows[0]
+    rows.append([entry.get(c, "") for c in header])
+    ws.clear()
+    ws.update("A1", rows)
+
+
+def append_submit(sheet, entry):
+    sheet.append(entry)
+
+
+def run():
+    # 假 sheet 唔使限速
+    set_scheduler(Scheduler(rate_per_min=10**9, burst=10**9))
+    results = []
+    for n in SIZES:
+        for name in ("legacy", "append"):
+            ws = FakeWorksheet("2024-01-01", _prefill(n))
+            sheet = HandSheet(ws, PLAYERS)
+            row = {"path": name, "rows": n}
+            if name == "append":
+                # 第一次用分頁先讀 header：由零開始計，分開報告
+                ws.requests, ws.cells, ws.simulated_s = 0, 0, 0.0
+                t0 = time.perf_counter()
+                sheet.header()
+                row.update(header_requests=ws.requests, header_cells=ws.cells,
+                           header_ms=round(ws.simulated_s * 1000 + (time.perf_counter() - t0) * 1000, 2))
+            ws.requests, ws.cells, ws.simulated_s = 0, 0, 0.0
+            t0 = time.perf_counter()
+            if name == "legacy":
+                legacy_submit(ws, _entry(n))
+            else:
+                append_submit(sheet, _entry(n))
+            cpu_ms = (time.perf_counter() - t0) * 1000
+            row.update(requests=ws.requests, cells=ws.cells, latency_ms=round(ws.simulated_s * 1000 + cpu_ms, 2))
+            results.append(row)
+    return results
+
+
+if __name__ == "__main__":
+    for r in run():
+        print(json.dumps(r, ensure_ascii=False))
@@ -0,0 +1,170 @@
+"""
+每日分頁合併：並發讀取 vs 逐個讀取，第二次執行 (checkpoint) 嘅成本，同埋一個分頁改過之後 Master 讀幾多格。
+用 FakeWorksheet 模擬每個請求嘅 RTT (sleep=True)，唔使網絡。
+開頭先核對正確性：人手合併過 (冇 HandID) 嘅舊分頁唔會再加一次、Sheets 將日期格式化唔算改過、合併咗嘅分頁改過會更新、
+今日分頁 Undo 再加局之後新局照樣合併。
+
+    python -m benchmarks.bench_consolidate --days 60 --hands 40
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_sheet import FakeWorksheet
+from benchmarks.generator import generate_hands
+import consolidate
+from consolidate import Consolidator
+from scheduler import Scheduler, set_scheduler
+from sheets import WorksheetRegistry, daily_header
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+
+
+class FakeSpreadsheet:
+    def __init__(self, tabs):
+        self.tabs = tabs
+
+    def worksheets(self):
+        return list(self.tabs.values())
+
+
+def build(days, hands):
+    df = generate_hands(days * hands, PLAYERS, seed=0)
+    header = daily_header(PLAYERS)
+    tabs = {"Master Record": FakeWorksheet("Master Record", [header], sleep=True)}
+    for day, g in df.groupby(df["Date"].dt.strftime("%Y-%m-%d")):
+        g = g.assign(Date=g["Date"].dt.strftime("%H:%M"))
+        tabs[day] = FakeWorksheet(day, [header] + g[header].astype(str).values.tolist(), sleep=True)
+    return tabs
+
+
+def check(ckpt):
+    header = daily_header(PLAYERS)
+    tabs = build(30, 20)
+    for ws in tabs.values():
+        ws.sleep = False
+    days = sorted(t for t in tabs if t != "Master Record")
+    # 頭三日係舊分頁 (冇 HandID)，之前人手抄咗入 Master (日期格式、數字格式都唔同，冇 HandID)
+    id_col = header.index("HandID")
+    for day in days[:3]:
+        for row in tabs[day].rows[1:]:
+            row[id_col] = ""
+            y, m, d = day.split("-")
+            tabs["Master Record"].rows.append([f"{y}/{int(m)}/{int(d)} {row[0]}:00"] + [f"{v}.0" for v in row[1:5]]
+                                              + row[5:id_col] + [""])
+    manual = len(tabs["Master Record"].rows) - 1
+    registry = WorksheetRegistry(lambda: FakeSpreadsheet(tabs))
+    c = Consolidator(registry, PLAYERS, checkpoint_path=ckpt)
+    # 數 Master 全讀咗幾多次：第一次之後只應該讀要合併嗰幾日嘅行
+    full_reads = []
+    read_all = tabs["Master Record"].get_all_values
+    tabs["Master Record"].get_all_values = lambda **kw: full_reads.append(1) or read_all(**kw)
+    first = c.run()
+    assert first["rows"] == sum(len(tabs[d].rows) - 1 for d in days[3:]), first
+    assert first["duplicates"] == manual, first
+
+    # USER_ENTERED 寫入之後 Sheets 會格式化日期 / 時間 (加秒)：再讀返唔應該當成改過
+    for row in tabs["Master Record"].rows[1 + manual:]:
+        row[0] += ":00"
+    for row in tabs[days[4]].rows[1:]:
+        row[0] += ":00"
+
+    # 合併咗嘅分頁喺 app 改咗一局、刪咗一局：標記 dirty，下次更新 / 刪返 Master
+    day = days[4]
+    edited, removed = tabs[day].rows[1], tabs[day].rows[2]
+    edited[header.index("Remark")] = "改過"
+    del tabs[day].rows[2]
+    c.mark_dirty(day)
+    second = c.run()
+    assert second["updated"] == 1 and second["deleted"] == 1 and second["rows"] == 0, second
+    master = tabs["Master Record"].rows
+    assert any(r[id_col] == edited[id_col] and r[header.index("Remark")] == "改過" for r in master)
+    assert not any(r[id_col] == removed[id_col] for r in master)
+    assert not c.load_checkpoint()["dirty"]
+    assert len(full_reads) == 1, full_reads
+
+    # 今日分頁：合併咗之後 Undo 最後一局再加一局 (行數一樣)，新局都要合併
+    today = consolidate._hk_today()
+    tabs[today] = FakeWorksheet(today, [header] + [list(r) for r in tabs[days[5]].rows[1:4]])
+    for k, row in enumerate(tabs[today].rows[1:]):
+        row[id_col] = f"today{k}"
+    c.run(include_today=True)
+    tabs[today].rows[-1] = tabs[today].rows[-1][:id_col] + ["today-new"]
+    third = c.run(include_today=True)
+    assert third["rows"] == 1 and third["deleted"] == 1, third
+    ids = [r[id_col] for r in master]
+    assert "today-new" in ids and "today2" not in ids
+    assert len(ids) == len(set(i for i in ids if i)) + manual
+    assert len(full_reads) == 1, full_reads
+
+    # 有人喺 Master 中間插咗一行：記低嘅行範圍過時，要改為全讀，唔可以改錯行
+    day = days[6]
+    master.insert(1 + manual, list(master[1 + manual]))
+    master[1 + manual][id_col] = "manual-insert"
+    tabs[day].rows[1][header.index("Remark")] = "再改"
+    c.mark_dirty(day)
+    fourth = c.run()
+    assert fourth["updated"] == 1 and fourth["deleted"] == 0 and fourth["rows"] == 0, fourth
+    assert len(full_reads) == 2, full_reads
+    assert sum(r[header.index("Remark")] == "再改" for r in master) == 1
+    assert master[1 + manual][id_col] == "manual-insert"
+
+    # 一次刪幾局：連續嘅行一個 delete_rows 請求搞掂
+    day = days[5]
+    gone = [tabs[day].rows[k][id_col] for k in (1, 2, 3, 5)]
+    del tabs[day].rows[5], tabs[day].rows[1:4]
+    deletes = []
+    delete_rows = tabs["Master Record"].delete_rows
+    tabs["Master Record"].delete_rows = lambda *a: deletes.append(a) or delete_rows(*a)
+    c.mark_dirty(day)
+    fifth = c.run()
+    assert fifth["deleted"] == 4 and len(deletes) == 2, (fifth, deletes)
+    assert not any(r[id_col] in gone for r in master)
+    print("ok: hand-merged legacy days skipped; edited / deleted / undo-then-append hands reconciled; "
+          "contiguous deletions sent as one request; "
+          "Master read in full only on the first run and after an outside insert")
+
+
+def run(days, hands, workers, ckpt):
+    tabs = build(days, hands)
+    registry = WorksheetRegistry(lambda: FakeSpreadsheet(tabs))
+    c = Consolidator(registry, PLAYERS, checkpoint_path=ckpt, max_workers=workers)
+    t0 = time.perf_counter()
+    first = c.run()
+    first_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    second = c.run()
+    second_s = time.perf_counter() - t0
+    master = tabs["Master Record"]
+    # 一個分頁改過再合併：Master 只讀嗰日嘅行
+    c.mark_dirty(sorted(t for t in tabs if t != "Master Record")[0])
+    master.cells = 0
+    t0 = time.perf_counter()
+    c.run()
+    dirty_s = time.perf_counter() - t0
+    return {"workers": workers, "days": days, "hands": days * hands,
+            "first_s": round(first_s, 3), "merged": first["rows"], "master_rows": len(master.rows) - 1,
+            "second_s": round(second_s, 3), "second_tabs": second["tabs"],
+            "dirty_s": round(dirty_s, 3), "dirty_master_cells": master.cells}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--hands", type=int, default=40)
+    args = parser.parse_args(argv)
+    set_scheduler(Scheduler(rate_per_min=10**9, burst=10**9))
+    with tempfile.TemporaryDirectory() as d:
+        check(os.path.join(d, "check.json"))
+        for workers in (1, 4, 8):
+            row = run(args.days, args.hands, workers, os.path.join(d, f"ckpt_{workers}.json"))
+            print(json.dumps(row), flush=True)
+
+
+if __name__ == "__main__":
+    main()
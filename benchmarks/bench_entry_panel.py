@@ -0,0 +1,73 @@
+"""
+量度計分頁錄入 fragment (views.calculator.entry_panel) 每次互動嘅時間：
+用 streamlit.testing 嘅 AppTest 淨係行 entry_panel，輪流撳贏家 / 輸家掣、轉方式、拉番數，
+記低 entry_panel_seconds (fragment 入面 server 端嘅時間，app 實際運行都係記呢個) 同 AppTest 成個 run 嘅時間。
+目標係每次互動 50ms 以內；唔包括網絡同手機 render。
+
+    python -m benchmarks.bench_entry_panel --clicks 40
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import get_metrics
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+TARGET_S = 0.050
+
+
+def panel():
+    from views.calculator import entry_panel
+    entry_panel(["Martin", "Lok", "Stephen", "Fongka"], "2024-01-01")
+
+
+def fragment_times():
+    """(entry_panel 行咗幾多次, 總秒數)"""
+    rows = [t for t in get_metrics().snapshot()["timings"] if t["name"] == "entry_panel_seconds"]
+    return (rows[0]["count"], rows[0]["sum"]) if rows else (0, 0.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clicks", type=int, default=40)
+    args = parser.parse_args(argv)
+
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_function(panel, default_timeout=30)
+    at.run()
+    assert not at.exception, at.exception
+    inner, outer = [], []
+    for k in range(args.clicks):
+        step = k % 4
+        if step == 0:
+            at.button(key=f"win_{PLAYERS[k // 4 % len(PLAYERS)]}").click()
+        elif step == 1:
+            at.radio[0].set_value(["出統", "自摸", "包自摸"][k // 4 % 3])
+        elif step == 2:
+            at.select_slider[0].set_value(3 + k % 11)
+        else:
+            keys = [b.key for b in at.button if b.key and b.key.startswith("lose_") and not b.disabled]
+            if keys:
+                at.button(key=keys[k // 4 % len(keys)]).click()
+        before = fragment_times()
+        t0 = time.perf_counter()
+        at.run()
+        outer.append(time.perf_counter() - t0)
+        after = fragment_times()
+        assert not at.exception, at.exception
+        assert after[0] == before[0] + 1, "entry_panel did not run exactly once"
+        inner.append(after[1] - before[1])
+    median = lambda v: sorted(v)[len(v) // 2]
+    row = {"clicks": args.clicks, "fragment_median_ms": round(median(inner) * 1000, 2),
+           "fragment_max_ms": round(max(inner) * 1000, 2), "apptest_run_median_ms": round(median(outer) * 1000, 2),
+           "target_ms": TARGET_S * 1000}
+    print(json.dumps(row))
+    assert median(inner) < TARGET_S, "entry_panel over the 50ms target"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+多張枱：每張枱一個 SQLite 長表 (hand, player, delta)，名單輪流上枱。
+量度長表 vs 寬表 (名單每人一欄) 嘅儲存行數、讀返寬表嘅時間，
+同埋幾張枱嘅指標 / 評分 / 資金流向分開 thread 同時計 vs 逐張計 (結果要一樣，而且唔會共用快取)。
+
+    python -m benchmarks.bench_groups --groups 4 --roster 8 --hands 100000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indicators
+import ratings
+import transfers
+from benchmarks.generator import generate_hands
+from groups import Group
+from master_cache import SEAT_SEP, SEATS_COL, coerce_types
+from storage import SQLiteStore
+
+SEATS = ["S1", "S2", "S3", "S4"]
+
+
+def rotating_frame(hands, roster, seed):
+    """generate_hands 嘅四人局，每局隨機揀四個名單上嘅人落枱"""
+    df = generate_hands(hands, SEATS, seed=seed)
+    rng = np.random.default_rng(seed)
+    pick = np.sort(np.argsort(rng.random((hands, len(roster))), axis=1)[:, :4], axis=1)
+    names = np.array(roster)
+    rename = lambda col: names[pick[np.arange(hands), col]]
+    seat_of = {s: i for i, s in enumerate(SEATS)}
+    out = df.drop(columns=SEATS).copy()
+    for col in ("Winner", "Loser"):
+        codes = df[col].map(seat_of)
+        out[col] = np.where(codes.notna(), rename(codes.fillna(0).astype(int).to_numpy()), df[col])
+    wide = np.zeros((hands, len(roster)), dtype='int64')
+    np.put_along_axis(wide, pick, df[SEATS].to_numpy(dtype='int64'), axis=1)
+    out = out.assign(**{p: wide[:, i] for i, p in enumerate(roster)})
+    out[SEATS_COL] = [SEAT_SEP.join(names[s]) for s in pick]
+    return coerce_types(out, roster)
+
+
+def analyse(frame, roster, cache_dir):
+    # 每次量度用新嘅 checkpoint 資料夾，唔好讀到上一輪寫低嘅狀態
+    frame = frame.copy(deep=False)
+    frame.attrs['cache_dir'] = cache_dir
+    return (indicators.get_indicators(frame, roster)["summary"],
+            ratings.get_ratings(frame, roster)[0],
+            transfers.get_transfers(frame, roster).matrix()[0])
+
+
+def clear_memos():
+    for mod in (indicators, ratings, transfers):
+        mod._memo.clear()
+    indicators._states.clear()
+    ratings._states.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=4)
+    parser.add_argument("--roster", type=int, default=8)
+    parser.add_argument("--hands", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as d:
+        frames = {}
+        for g in range(args.groups):
+            roster = [f"G{g}P{i}" for i in range(args.roster)]
+            group = Group(f"table{g}", roster)
+            path = os.path.join(d, group.slug, "hands.db")
+            store = SQLiteStore(path, roster, seats=group.seats, name=group.slug)
+            t0 = time.perf_counter()
+            store.import_frame(rotating_frame(args.hands, roster, seed=g))
+            imported = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            frame = store.master_frame()
+            read = time.perf_counter() - t0
+            frames[group.slug] = (frame, roster)
+            deltas = store._db.execute("SELECT COUNT(*) FROM deltas").fetchone()[0]
+            print(json.dumps({"group": group.slug, "hands": len(frame), "long_rows": deltas,
+                              "wide_cells": len(frame) * len(roster), "import_s": round(imported, 2),
+                              "read_wide_s": round(read, 3)}))
+
+        # 暖身一次 (import / 第一次配置記憶體唔計入時間)
+        first = next(iter(frames.values()))
+        analyse(first[0].iloc[:1000], first[1], os.path.join(d, "warmup"))
+        clear_memos()
+        t0 = time.perf_counter()
+        serial = {slug: analyse(f, r, os.path.join(d, slug, "serial")) for slug, (f, r) in frames.items()}
+        serial_s = time.perf_counter() - t0
+
+        clear_memos()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.groups) as pool:
+            futures = {slug: pool.submit(analyse, f, r, os.path.join(d, slug, "parallel"))
+                       for slug, (f, r) in frames.items()}
+            parallel = {slug: fut.result() for slug, fut in futures.items()}
+        parallel_s = time.perf_counter() - t0
+
+        for slug in frames:
+            for a, b in zip(serial[slug], parallel[slug]):
+                assert np.allclose(a.to_numpy(dtype='float64'), b.to_numpy(dtype='float64'), equal_nan=True), slug
+            # 每張枱嘅 checkpoint 喺自己嘅資料夾
+            assert any(n.startswith("indicators_") for n in os.listdir(os.path.join(d, slug, "parallel"))), slug
+        print(json.dumps({"groups": args.groups, "serial_s": round(serial_s, 2),
+                          "parallel_s": round(parallel_s, 2), "cpus": os.cpu_count()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Monte Carlo 預測引擎：唔同模擬場數嘅時間，單 process vs process pool；
+順便核對 pool 同單 process 結果一樣 (同一 seed)，同埋期望值 ≈ 每局平均 × 局數。
+
+    python -m benchmarks.bench_simulation --hands 100000 --sessions 10000,100000,400000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generator import generate_hands
+from indicators import score_matrix
+from master_cache import coerce_types
+from simulation import POOL_CELLS, session_length, simulate
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hands", type=int, default=100_000)
+    parser.add_argument("--sessions", default="10000,100000,400000")
+    args = parser.parse_args(argv)
+
+    df = coerce_types(generate_hands(args.hands, PLAYERS, seed=5), PLAYERS)
+    x = score_matrix(df, PLAYERS)
+    hands = session_length(df)
+    for sessions in map(int, args.sessions.split(",")):
+        t0 = time.perf_counter()
+        final, dd = simulate(x, sessions, hands, workers=1)
+        serial = time.perf_counter() - t0
+        row = {"sessions": sessions, "hands": hands, "cells": sessions * hands * len(PLAYERS),
+               "serial_s": round(serial, 3)}
+        if row["cells"] >= POOL_CELLS:
+            t0 = time.perf_counter()
+            pooled = simulate(x, sessions, hands)
+            row["pool_s"] = round(time.perf_counter() - t0, 3)
+            row["cpus"] = os.cpu_count()
+            assert np.array_equal(pooled[0], final) and np.array_equal(pooled[1], dd), "pool result differs"
+        # 期望值：抽樣平均應該貼近 每局平均 × 局數 (誤差 ~ 4 個標準誤差內)
+        se = final.std(axis=0) / np.sqrt(sessions)
+        assert (np.abs(final.mean(axis=0) - x.mean(axis=0) * hands) < 4 * se + 1e-9).all(), "biased mean"
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+量度 app 冷啟動同每次 rerun 嘅時間。
+
+1. 冷啟動 import：每個頁面喺獨立 process 用 AppTest 真係行一次 app.py，記低行完之後載入咗嘅
+   本 repo 模組 (包括 app.py 本身同 render 途中先 import 嘅)，再喺新 process 量度 import 呢組模組嘅時間，
+   同舊做法 (一開波 import 晒所有 view + gspread / google-auth / streamlit_gsheets) 比較
+2. rerun：用 streamlit.testing 嘅 AppTest 跑 app.py，量度每個頁面第一次同第二次執行
+   (離線時 Google 讀寫會失敗，量到嘅係 app 本身嘅開銷)
+
+    python -m benchmarks.bench_startup
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from routes import PAGES
+
+# 舊 app.py 喺路由之前已經 import 晒嘅模組
+EAGER = ["streamlit", "pandas", "gspread", "google.oauth2.service_account", "streamlit_gsheets",
+         "utils", "views.dashboard", "views.calculator", "views.history",
+         "views.pro_analysis", "views.daily_analysis"]
+
+
+def import_time(modules, repeat=3):
+    code = ("import time, importlib; t = time.perf_counter()\n"
+            f"for m in {modules!r}: importlib.import_module(m)\n"
+            "print(time.perf_counter() - t)")
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+        runs.append(float(out.stdout.strip().splitlines()[-1]))
+    return min(runs)
+
+
+# 本 repo 嘅頂層模組 (views 之外)：頁面嘅 import 集合只計呢啲，streamlit 自己嘅模組唔計
+LOCAL = {f[:-3] for f in os.listdir(ROOT) if f.endswith(".py") and f != "app.py"} | {"views"}
+
+GRAPH = """
+import sys, json
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.session_state["page"] = {page!r}
+at.run()
+print(json.dumps(sorted(m for m in sys.modules if m.split(".")[0] in {local!r})))
+"""
+
+
+def page_modules(name):
+    """喺新 process 真係行一次呢頁，返回佢實際載入咗嘅本 repo 模組 (連 streamlit 喺最前)"""
+    code = GRAPH.format(app=os.path.join(ROOT, "app.py"), page=name, local=sorted(LOCAL))
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return ["streamlit"] + [m for m in json.loads(out.stdout.strip().splitlines()[-1]) if m != "views"]
+
+
+def rerun_times(name, reruns=5):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    at.session_state["page"] = name
+    t0 = time.perf_counter()
+    at.run()
+    first = time.perf_counter() - t0
+    times = []
+    for _ in range(reruns):
+        t0 = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - t0)
+    return first, sorted(times)[len(times) // 2]
+
+
+def main():
+    before = import_time(EAGER)
+    for name in PAGES:
+        mods = page_modules(name)
+        row = {"page": name, "import_before_s": round(before, 4),
+               "import_after_s": round(import_time(mods), 4), "modules": mods[1:]}
+        try:
+            first, median = rerun_times(name)
+            row.update({"first_run_s": round(first, 4), "rerun_median_s": round(median, 4)})
+        except ImportError:
+            pass
+        print(json.dumps(row, ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+核對物化統計表：增量 (Master 追加 + 計分頁 append / undo / 改分) 同由頭 groupby 計嘅結果一致。
+
+    python -m benchmarks.check_aggregates
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import aggregates
+from aggregates import GRAINS, Aggregates, AggregatingStore
+from benchmarks.generator import generate_hands
+from master_cache import coerce_types
+from consolidate import Consolidator
+from benchmarks.bench_consolidate import FakeSpreadsheet
+from benchmarks.fake_sheet import FakeWorksheet
+from scheduler import Scheduler, set_scheduler
+from sheets import StaleRowError, WorksheetRegistry, daily_header
+from storage import SheetsStore, SQLiteStore
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+
+
+def reference(df, players):
+    """原本 view 入面嘅 groupby 寫法，每個粒度一份"""
+    day = df['Date'].dt.strftime("%Y-%m-%d")
+    keys = {"day": day, "month": day.str[:7], "year": day.str[:4], "all": pd.Series("all", index=df.index)}
+    out = {}
+    for grain, key in keys.items():
+        g = df.groupby(key)
+        out[grain] = {
+            "total": g[players].sum(),
+            "max": g[players].max(),
+            "hands": g.size(),
+            "days": day.groupby(key).nunique(),
+            "wins": pd.DataFrame({p: (df['Winner'] == p).groupby(key).sum() for p in players}),
+            "feeds": pd.DataFrame({p: ((df['Loser'] == p) & (df['Method'] == "出統")).groupby(key).sum()
+                                   for p in players}),
+            "zimo": pd.DataFrame({p: ((df['Winner'] == p) & (df['Method'] == "自摸")).groupby(key).sum()
+                                  for p in players}),
+        }
+    return out
+
+
+def compare(agg, df, players, label):
+    ref = reference(df, players)
+    for grain in GRAINS:
+        assert set(agg.periods(grain)) == set(ref[grain]["hands"].index), (label, grain, "periods")
+        for field in ("total", "wins", "feeds", "zimo", "hands", "days"):
+            got = agg.table(grain, field).sort_index()
+            want = ref[grain][field].sort_index()
+            assert (got.to_numpy() == want.to_numpy()).all(), (label, grain, field)
+        for key in ref[grain]["max"].index[-3:]:
+            assert (agg.lookup(grain, key)["max"].to_numpy() == ref[grain]["max"].loc[key].to_numpy()).all(), \
+                (label, grain, key, "max")
+
+
+def main():
+    df = coerce_types(generate_hands(20_000, PLAYERS, seed=3), PLAYERS)
+    with tempfile.TemporaryDirectory() as d:
+        # 1. Master Record 分批追加 vs 一次過
+        agg = Aggregates(PLAYERS, cache_dir=d)
+        t0 = time.perf_counter()
+        for stop in range(5_000, len(df) + 1, 5_000):
+            agg.sync(df.iloc[:stop].copy())
+        compare(agg, df, PLAYERS, "incremental sync")
+        compare(Aggregates(PLAYERS, cache_dir=d), df, PLAYERS, "reloaded from disk")
+        print(f"ok: sync in 4 batches ({time.perf_counter() - t0:.2f}s)")
+
+        # 2. 經 SQLite store 寫入：append / undo / 改分
+        store = SQLiteStore(os.path.join(d, "hands.db"), PLAYERS)
+        store.import_frame(df.iloc[:19_000])
+        wrapped = AggregatingStore(store, Aggregates(PLAYERS, cache_dir=os.path.join(d, "sqlite")))
+        wrapped.aggregates.sync(store.master_frame())
+        tail = df.iloc[19_000:].copy()
+        ids = []
+        for rec in tail.to_dict("records"):
+            day = rec['Date'].strftime("%Y-%m-%d")
+            entry = dict(rec, Date=rec['Date'].strftime("%H:%M"))
+            entry.pop("HandID")
+            ids.append((day, wrapped.append(day, entry)[0], rec))
+        for day, hid, rec in ids[-50:]:
+            wrapped.delete(day, hid, expected={p: rec[p] for p in PLAYERS})
+        day, hid, rec = ids[0]
+        wrapped.update_cell(day, PLAYERS[0], int(rec[PLAYERS[0]]) + 1000, hid)
+        frame = store.master_frame()
+        compare(wrapped.aggregates, frame, PLAYERS, "sqlite writes")
+        # 版本一致：之後 sync 唔使重建
+        assert wrapped.aggregates.meta["version"] == store.version()
+        print(f"ok: {len(ids)} appends, 50 undos, 1 edit via SQLite store match a rebuild")
+
+        # Master Record 入面番數 / 備註留空 (CSV 讀返係 NaN)：匯入當 0 / 空字串
+        blank = df.iloc[:3].astype({"Fan": "float64", "Remark": "object"})
+        blank.loc[:, "Fan"], blank.loc[:, "Remark"] = [float("nan"), 5, float("nan")], [float("nan"), "x", None]
+        plain = SQLiteStore(os.path.join(d, "blank.db"), PLAYERS)
+        assert plain.import_frame(blank) == 3
+        got = plain.master_frame()
+        assert got["Fan"].tolist() == [0, 5, 0] and got["Remark"].tolist() == ["", "x", ""], got
+        # 帶微秒嘅時間同 HH:MM / HH:MM:SS 寫入混埋都讀得返；HH:MM:SS 配返嗰日，唔係今日
+        stamped = df.iloc[3:5].assign(Date=[pd.Timestamp("2024-01-01 12:34:00.5"), pd.Timestamp("2024-01-01 13:00")])
+        assert plain.import_frame(stamped) == 2
+        entry = dict(df.iloc[5].drop("HandID"), Date="12:34:56")
+        plain.append("2024-01-01", dict(entry, Date="12:34"))
+        plain.append("2023-06-30", entry)
+        got = plain.master_frame()
+        assert got["Date"].iloc[-4:].astype(str).tolist() == ["2024-01-01 12:34:00", "2024-01-01 13:00:00",
+                                                               "2024-01-01 12:34:00", "2023-06-30 12:34:56"], got
+        assert len(plain.day_frame("2023-06-30")) == 1
+
+        # 3. Sheets：計分頁寫每日分頁 (live)，另一部機直接加一行，之後合併入 Master 再 sync，唔會重複計
+        set_scheduler(Scheduler(rate_per_min=10**9, burst=10**9))
+        header = daily_header(PLAYERS)
+        master_rows = df.iloc[:19_000].assign(Date=df['Date'].iloc[:19_000].dt.strftime("%Y-%m-%d %H:%M"))
+        tabs = {"Master Record": FakeWorksheet("Master Record", [header] + master_rows[header].astype(str).values.tolist())}
+        registry = WorksheetRegistry(lambda: FakeSpreadsheet(tabs))
+
+        def add_tab(title, rows=500, cols=15):
+            tabs[title] = FakeWorksheet(title)
+            return tabs[title]
+
+        FakeSpreadsheet.add_worksheet = lambda self, title, rows, cols: add_tab(title)
+
+        def read_tab(title, ttl=5, kind="read"):
+            values = tabs[title].get_all_values()
+            return pd.DataFrame(values[1:], columns=values[0])
+
+        def read_master():
+            values = tabs["Master Record"].get_all_values()
+            return coerce_types(pd.DataFrame(values[1:], columns=values[0]), PLAYERS)
+
+        agg = Aggregates(PLAYERS, cache_dir=os.path.join(d, "sheets"))
+        sheets = AggregatingStore(SheetsStore(PLAYERS, registry, read_tab, lambda t: None, read_master), agg)
+        agg.sync(read_master())
+        days = set()
+        for rec in tail.to_dict("records"):
+            day = rec['Date'].strftime("%Y-%m-%d")
+            sheets.ensure_day(day)
+            entry = dict(rec, Date=rec['Date'].strftime("%H:%M"))
+            entry.pop("HandID")
+            if day not in days:
+                days.add(day)
+                # 另一部機直接寫入 (唔經呢個 process)
+                tabs[day].append_row([entry.get(c, "") if c != "HandID" else f"other{day}" for c in header])
+                continue
+            hid, row = sheets.append(day, entry)
+        for day in sorted(days)[-3:]:
+            sheets.delete(day, hint=2, expected=None, hand_id=f"other{day}")
+        # 定位完、寫之前另一部機刪咗上面一行：寫入前再核對 HandID，唔會刪 / 改錯隔籬嗰局
+        day = sorted(days)[0]
+        above, mine, below = (list(r) for r in tabs[day].rows[1:4])
+        hand_sheet = registry.hand_sheet(day, PLAYERS)
+        locate = hand_sheet.locate
+        for write in (lambda: sheets.delete(day, mine[-1], hint=3),
+                      lambda: sheets.update_cell(day, "Remark", "x", mine[-1], hint=3)):
+            hand_sheet.locate = lambda *a, **k: (locate(*a, **k), tabs[day].delete_rows(2))[0]
+            try:
+                write()
+                raise AssertionError("wrote to a shifted row")
+            except StaleRowError:
+                pass
+            hand_sheet.locate = locate
+            assert tabs[day].rows[1:3] == [mine, below], "neighbouring hand changed"
+            tabs[day].rows.insert(1, above)
+        for bad in (lambda: sheets.delete(day, None, hint=2), lambda: sheets.update_cell(day, "Remark", "x", "")):
+            try:
+                bad()
+                raise AssertionError("sheet write without a HandID")
+            except ValueError:
+                pass
+        for day in sorted(days):
+            sheets.day_frame(day)
+        Consolidator(registry, PLAYERS, checkpoint_path=os.path.join(d, "ckpt.json")).run()
+        final = read_master()
+        agg.sync(final)
+        compare(agg, final, PLAYERS, "sheets live + consolidate")
+        assert not agg.live, "live rows left after consolidation"
+        print(f"ok: {len(days)} live day tabs reconciled and consolidated without double counting")
+
+        # 4. 喺已經合併咗嘅日子刪一局：Master 仲有嗰行，Master 下次變版本就對返 Master
+        day = sorted(days)[0]
+        values = tabs[day].get_all_values()
+        sheets.delete(day, hand_id=values[1][header.index("HandID")], expected=None)
+        assert agg.meta["reconcile"]
+        tabs["Master Record"].append_row(tabs["Master Record"].get_all_values()[-1])
+        final = read_master()
+        agg.sync(final)
+        compare(agg, final, PLAYERS, "reconciled after deleting a consolidated hand")
+
+        # 5. 尾段儲存：間隔入面最後一次寫入都會喺間隔完咗之後寫落磁碟
+        aggregates.SAVE_INTERVAL = 0.2
+        agg.save(force=True)
+        sheets.delete(day, hand_id=values[3][header.index("HandID")], expected=None)
+        time.sleep(0.5)
+        assert Aggregates(PLAYERS, cache_dir=os.path.join(d, "sheets")).tables == agg.tables, "trailing save missed"
+        print("ok: consolidated-day delete reconciled on the next Master version; trailing save written")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+核對數據核對 (audit.py)：
+1. 向量化檢查同逐局用 scoring.score_hand 寫嘅版本一致 (包括六人名單輪流上枱、新舊兩套番數表)；
+2. 故意整壞嘅局 (合計唔係 0、番數唔啱、贏輸調轉、方式打錯、重複 HandID / 重複舊行) 全部搵到，冇誤報；
+3. 分幾批 sync 同一次過核對結果一樣，而且之後只核對新增嘅行；
+4. 由 Parquet part 檔逐個 chunk 串流核對一千萬局嘅時間 / 記憶體。
+
+    python -m benchmarks.check_audit --hands 10000000
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audit
+from audit import AuditState, check_chunk, parquet_chunks, sync_audit
+from benchmarks.bench_groups import rotating_frame
+from benchmarks.generator import generate_hands
+from master_cache import coerce_types, data_version, format_version, row_digest, seated_mask
+from metrics import get_metrics
+from scoring import METHODS, RULESETS, score_hand
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+PART_ROWS = 1_000_000
+
+
+def reference(df, players):
+    """逐局：落枱嘅人用 score_hand 計，任何一套規則對得上就當啱"""
+    out = {k: [] for k in ("zero_sum", "score", "sign", "unparsed")}
+    seated = seated_mask(df, players)
+    for i, rec in enumerate(df.to_dict("records")):
+        at_table = [p for p, s in zip(players, seated[i]) if s]
+        x = {p: int(rec[p]) for p in players}
+        winner, loser, method = str(rec["Winner"]), str(rec["Loser"]), str(rec["Method"])
+        parsed = winner in players and method in METHODS
+        out["zero_sum"].append(sum(x.values()) != 0)
+        out["unparsed"].append(not parsed and any(x.values()))
+        if not parsed:
+            out["score"].append(False)
+            out["sign"].append(False)
+            continue
+        expected = []
+        for r in RULESETS:
+            res = dict.fromkeys(players, 0)
+            res.update(score_hand(winner, loser if loser in players else None, method, int(rec["Fan"]), at_table, r))
+            res.pop(None, None)
+            expected.append(res)
+        out["score"].append(all(e != x for e in expected))
+        others = [p for p in at_table if p != winner]
+        bad = x[winner] <= 0 or winner not in at_table or any(x[p] > 0 for p in players if p != winner)
+        bad |= any(x[p] != 0 for p in players if p not in at_table)
+        if method == "自摸":
+            bad |= any(x[p] >= 0 for p in others)
+        else:
+            bad |= loser not in at_table or loser == winner or x[loser] >= 0
+        out["sign"].append(bad)
+    return {k: np.array(v) for k, v in out.items()}
+
+
+def corrupt(df, rng, share=0.002, id_pool=None):
+    """
+    隨機揀 share 嘅局整壞，返回 (新 df, {HandID: 預期問題})。
+    id_pool：之前 part 嘅 HandID，用嚟整跨 part 嘅重複。
+    """
+    df = df.copy()
+    for col in ("Winner", "Loser", "Method"):
+        df[col] = df[col].astype(object)
+    n = len(df)
+    # 只揀 4 的倍數嘅行：i + 1 / i + 2 留俾「重複」用，唔會同其他整壞嘅局撞
+    idx = 4 * rng.choice(n // 4, size=max(int(n * share), 12), replace=False)
+    expected = {}
+    for k, i in enumerate(idx):
+        kind = k % 6
+        hand_id = df.at[i, "HandID"]
+        if kind == 0:
+            df.at[i, df.at[i, "Winner"]] += 1
+            expected[hand_id] = {"zero_sum", "score"}
+        elif kind == 1:
+            df.at[i, "Fan"] = 13 if df.at[i, "Fan"] < 10 else 3
+            expected[hand_id] = {"score"}
+        elif kind == 2:
+            if df.at[i, "Method"] == "自摸":
+                df.at[i, "Method"] = "出統"
+                expected[hand_id] = {"score", "sign"}
+            else:
+                df.at[i, "Winner"], df.at[i, "Loser"] = df.at[i, "Loser"], df.at[i, "Winner"]
+                expected[hand_id] = {"score", "sign"}
+        elif kind == 3:
+            df.at[i, "Method"] = "詐糊"
+            expected[hand_id] = {"unparsed"}
+        elif kind == 4:
+            # 重複 HandID：抄之前 part (冇就抄今個 part 第 i + 2 行) 嘅 ID
+            pool = id_pool if id_pool is not None and len(id_pool) else [df.at[i + 2, "HandID"]]
+            df.at[i, "HandID"] = hand_id = pool[rng.integers(len(pool))]
+            expected.setdefault(hand_id + "#dup", {"duplicate"})
+        else:
+            # 冇 HandID 嘅舊行重複：整一對內容一樣、HandID 留空
+            j = i + 1
+            df.loc[j, [c for c in df.columns if c != "HandID"]] = df.loc[i, [c for c in df.columns if c != "HandID"]]
+            df.at[i, "HandID"] = df.at[j, "HandID"] = ""
+            expected[f"blank#{hand_id}"] = {"duplicate"}
+    return df, expected
+
+
+def make_part(k, rows, players=PLAYERS):
+    """第 k 個 part (每個 PART_ROWS 局)；每個 part 各自 generate 會由同一日開始，日期改為跨 part 連續 (每日 400 局)"""
+    df = generate_hands(rows, players, seed=k)
+    first = k * PART_ROWS
+    hand = np.arange(first, first + rows)
+    df["Date"] = pd.Timestamp("1990-01-01 20:00") + pd.to_timedelta(hand // 400, unit="D") \
+        + pd.to_timedelta(hand % 400, unit="m")
+    df["HandID"] = pd.Series(hand).map("{:012x}".format).to_numpy()
+    return df
+
+
+def verify(state, expected, clean_total):
+    """issues 入面有問題嘅局 = 故意整壞嗰啲，每局嘅問題類別對得上"""
+    counts, issues = state.report()
+    assert len(issues) == state.flagged, "raise MAX_ISSUES for this check"
+    labels = {v: k for k, v in audit.CHECKS.items()}
+    found = {}
+    for hand_id, problems in zip(issues["HandID"].astype(object), issues["問題"]):
+        found.setdefault(None if pd.isna(hand_id) else hand_id, []).append({labels[p] for p in problems.split("、")})
+    dup_ids = {k[:-4] for k in expected if k.endswith("#dup")}
+    n_blank = sum(k.startswith("blank#") for k in expected)
+    for hand_id, want in expected.items():
+        if hand_id.endswith("#dup") or hand_id.startswith("blank#"):
+            continue
+        got = found.get(hand_id)
+        assert got and want <= got[0] and got[0] - want <= {"duplicate"}, (hand_id, want, got)
+    for hand_id in dup_ids:
+        assert any("duplicate" in g for g in found.get(hand_id, [])), hand_id
+    blanks = [g for g in found.get(None, [])]
+    assert len(blanks) == n_blank and all(g == {"duplicate"} for g in blanks), (len(blanks), n_blank)
+    stray = set(found) - set(expected) - dup_ids - {None}
+    assert not stray, list(stray)[:5]
+    assert state.rows == clean_total
+    return counts
+
+
+def check_reference():
+    rng = np.random.default_rng(1)
+    fixed = coerce_types(corrupt(make_part(0, 6000), rng)[0], PLAYERS)
+    roster = [f"P{i}" for i in range(6)]
+    rotating = rotating_frame(6000, roster, seed=3)
+    for df, players in ((fixed, PLAYERS), (rotating, roster),
+                        (coerce_types(generate_hands(3000, PLAYERS, seed=4, ruleset="classic"), PLAYERS), PLAYERS)):
+        checks, _ = check_chunk(df, players)
+        ref = reference(df, players)
+        for k, v in ref.items():
+            assert (checks[k] == v).all(), (k, np.flatnonzero(checks[k] != v)[:5])
+    print("reference: vectorised checks match score_hand row by row")
+
+
+def check_incremental(d):
+    rng = np.random.default_rng(2)
+    df, expected = corrupt(make_part(0, 200_000), rng)
+    df = coerce_types(df, PLAYERS)
+    whole = AuditState(PLAYERS)
+    whole.advance(audit.frame_chunks(df, size=30_000))
+    verify(whole, expected, len(df))
+    cache = os.path.join(d, "inc")
+    for end in (50_000, 120_000, 199_000, len(df)):
+        audit._states.clear()
+        counts, issues = sync_audit(df.iloc[:end], PLAYERS, cache)
+    assert counts.equals(whole.report()[0]) and issues.equals(whole.report()[1])
+    # 之後加一局：只核對嗰一局
+    extra = coerce_types(make_part(9, 1), PLAYERS)
+    grown = pd.concat([df, extra], ignore_index=True)
+    # 好似 MasterCache 咁帶住版本 / lineage：唔使重新 hash 舊行
+    grown.attrs.update(version=format_version(len(grown), row_digest(grown)), lineage=(data_version(df),))
+    t0 = time.perf_counter()
+    sync_audit(grown, PLAYERS, cache)
+    state = next(iter(audit._states.values()))
+    assert state.rows == len(grown)
+    print(f"incremental: batches == one pass; +1 hand on {len(df):,} audited in {time.perf_counter() - t0:.3f}s")
+
+    # checkpoint 壞咗：記入 metrics，由頭重建
+    for name in glob.glob(os.path.join(cache, "audit_*.json")):
+        with open(name, "w", encoding="utf-8") as f:
+            f.write("{")
+    errors = lambda: get_metrics().counters[("checkpoint_errors_total", (("state", "audit"),))]
+    before = errors()
+    audit._states.clear()
+    assert sync_audit(grown, PLAYERS, cache)[0].equals(counts) and errors() == before + 1
+
+    # 修正咗一局有問題嘅局 (行數唔變)：要由頭再核對，少咗一局
+    clean = coerce_types(make_part(0, 200_000), PLAYERS)
+    flagged = whole.report()[0][audit.FLAGGED]
+    fixed_id = next(k for k, v in expected.items() if v == {"zero_sum", "score"})
+    i = int(np.flatnonzero(grown["HandID"].astype(object) == fixed_id)[0])
+    fixed = grown.copy()
+    fixed.attrs.clear()
+    fixed.iloc[i] = clean.iloc[i]
+    audit._states.clear()
+    counts, _ = sync_audit(fixed, PLAYERS, cache)
+    assert counts[audit.FLAGGED] == flagged - 1, (counts[audit.FLAGGED], flagged)
+    # 另一行 (冇問題嗰啲) 被改壞：要報返呢一行
+    j = next(k for k in range(1, len(fixed), 4) if k not in (i, i + 1, i + 2) and k - 1 not in (i,)
+             and fixed.iloc[k]["HandID"] == clean.iloc[k]["HandID"] and (fixed.iloc[k] == clean.iloc[k]).all())
+    broken = fixed.copy()
+    broken.iloc[j, broken.columns.get_loc(PLAYERS[0])] += 13
+    counts, issues = sync_audit(broken, PLAYERS, cache)
+    assert counts[audit.FLAGGED] == flagged and broken["HandID"].iloc[j] in set(issues["HandID"]), "edit missed"
+    print("incremental: fixed / newly broken rows above the tail picked up")
+
+    # app 用 MasterCache 嘅 frame：由 Parquet part 檔串流核對，結果一樣
+    paths = []
+    for k, at in enumerate(range(0, len(broken), 70_000)):
+        paths.append(os.path.join(d, f"master-{k:05d}.parquet"))
+        broken.iloc[at:at + 70_000].to_parquet(paths[-1], index=False)
+    streamed = broken.copy()
+    streamed.attrs['parts'] = tuple(paths)
+    audit._states.clear()
+    assert isinstance(audit.master_chunks(streamed, PLAYERS, 100), type(parquet_chunks([], PLAYERS)))
+    s_counts, s_issues = sync_audit(streamed, PLAYERS, os.path.join(d, "parts"))
+    assert s_counts.equals(counts) and s_issues.equals(issues)
+    print("incremental: Parquet part stream == in-memory frame")
+
+
+def bench_stream(d, hands):
+    rng = np.random.default_rng(3)
+    expected, ids, parts = {}, [], (hands + PART_ROWS - 1) // PART_ROWS
+    t0 = time.perf_counter()
+    for k in range(parts):
+        df, bad = corrupt(make_part(k, min(PART_ROWS, hands - k * PART_ROWS)), rng, share=0.0004,
+                          id_pool=np.concatenate(ids) if ids else None)
+        expected.update(bad)
+        ids.append(df["HandID"].to_numpy()[2::4][rng.choice(len(df) // 4, 1000)])
+        coerce_types(df, PLAYERS).to_parquet(os.path.join(d, f"part-{k:05d}.parquet"), index=False)
+    print(f"generated {hands:,} hands in {parts} parts ({time.perf_counter() - t0:.1f}s)")
+
+    paths = sorted(glob.glob(os.path.join(d, "part-*.parquet")))
+    audit.MAX_ISSUES = len(expected) * 3
+    # 計時嗰次唔開 tracemalloc (佢會令 numpy / pandas 慢一倍)；記憶體峰值另外再行一次量
+    state, total, read = audit_parts(paths)
+    counts = verify(state, expected, hands)
+    print(counts.to_string())
+    print(f"full audit of {hands:,} hands: {total:.1f}s ({total - read:.1f}s checks + {read:.1f}s parquet read), "
+          f"seen-ID index {state.seen.nbytes * 2 / 1e6:.0f} MB")
+    # tracemalloc 只計核對期間 (numpy 陣列 + Python 物件) 嘅峰值，唔包括上面產生數據用嘅記憶體
+    tracemalloc.start()
+    traced, total, _ = audit_parts(paths)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert traced.report()[0].equals(counts)
+    print(f"under tracemalloc: {total:.1f}s, peak traced memory {peak / 1e6:.0f} MB")
+
+
+def audit_parts(paths):
+    """由 Parquet part 檔串流核對一次；返回 (state, 總時間, 讀 Parquet 嘅時間)"""
+    state = AuditState(PLAYERS)
+    t0 = time.perf_counter()
+    read = 0.0
+    chunks = parquet_chunks(paths, PLAYERS)
+    while True:
+        r0 = time.perf_counter()
+        chunk = next(chunks, None)
+        read += time.perf_counter() - r0
+        if chunk is None:
+            break
+        state.check(chunk)
+    return state, time.perf_counter() - t0, read
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hands", type=int, default=10_000_000)
+    args = parser.parse_args(argv)
+    check_reference()
+    with tempfile.TemporaryDirectory() as d:
+        check_incremental(d)
+        bench_stream(d, args.hands)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+核對 Master Record 條件請求：本地 http.server 提供 CSV (有 / 冇 ETag + Last-Modified)，
+上游冇改動嗰陣唔會 parse、版本唔變、下游快取 (指標 / 統計表 / 歷史分區) 唔使重算；
+有新行就照常增量同步，重啟之後用 meta.json 入面嘅 validators 繼續發條件請求；
+中間行被改咗 (最後一行照舊) 都會即刻成份重新載入。
+
+    python -m benchmarks.check_conditional_fetch --hands 200000
+"""
+import os
+import io
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregates import Aggregates
+from benchmarks.generator import generate_hands
+from indicators import get_indicators
+from master_cache import HttpCsvUpstream, MasterCache
+from partitions import HistoryPartitions
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+
+
+class CsvServer:
+    """喺背景 thread 行嘅 http.server；validators=False 就唔發 ETag / Last-Modified (亦唔理條件 header)"""
+
+    def __init__(self, body, validators=True):
+        self.body = body
+        self.validators = validators
+        self.modified = time.time()
+        self.hits = {200: 0, 304: 0}
+        self.bytes_sent = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                etag = '"%s"' % hashlib.md5(server.body).hexdigest()
+                modified = formatdate(server.modified, usegmt=True)
+                if server.validators and (self.headers.get("If-None-Match") == etag
+                                          or (self.headers.get("If-None-Match") is None
+                                              and self.headers.get("If-Modified-Since") == modified)):
+                    server.hits[304] += 1
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                server.hits[200] += 1
+                server.bytes_sent += len(server.body)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("Content-Length", str(len(server.body)))
+                if server.validators:
+                    self.send_header("ETag", etag)
+                    self.send_header("Last-Modified", modified)
+                self.end_headers()
+                self.wfile.write(server.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/master.csv"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def update(self, body):
+        self.body = body
+        self.modified += 1
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+def to_csv(df):
+    buf = io.StringIO()
+    df.to_csv(buf, index=False)
+    return buf.getvalue().encode("utf-8")
+
+
+def check(validators, df, cache_dir):
+    label = "with validators" if validators else "without validators"
+    base, extra = df.iloc[:-500], df.iloc[-500:]
+    server = CsvServer(to_csv(base), validators=validators)
+    try:
+        cache = MasterCache(HttpCsvUpstream(server.url), PLAYERS, cache_dir=cache_dir)
+        agg = Aggregates(PLAYERS, cache_dir=cache_dir)
+        hist = HistoryPartitions(PLAYERS, cache_dir=cache_dir)
+
+        t0 = time.perf_counter()
+        frame = cache.refresh()
+        cold_s = time.perf_counter() - t0
+        version = frame.attrs['version']
+        indicators = get_indicators(frame, PLAYERS)
+        agg.sync(frame)
+        hist.sync(frame)
+        assert len(frame) == len(base), (label, "cold rows")
+
+        # 1. 冇改動：parse 次數唔變，同一個 frame / 版本，下游全部命中
+        parsed = cache.stats["parsed"]
+        builds = []
+        agg._tables_from = lambda f, _orig=agg._tables_from: builds.append(1) or _orig(f)
+        t0 = time.perf_counter()
+        for _ in range(5):
+            again = cache.refresh()
+            assert again is frame and again.attrs['version'] == version, (label, "version changed")
+            assert get_indicators(again, PLAYERS) is indicators, (label, "indicator memo missed")
+            agg.sync(again)
+            assert not builds and hist.sync(again) == 0, (label, "downstream rebuilt")
+        warm_s = (time.perf_counter() - t0) / 5
+        assert cache.stats["parsed"] == parsed, (label, "unchanged body was parsed")
+        assert cache.stats["unchanged"] == 5, (label, cache.stats)
+        if validators:
+            assert server.hits[304] == 5, (label, server.hits)
+        print(f"ok [{label}]: cold {cold_s:.3f}s, unchanged refresh {warm_s * 1000:.1f}ms, "
+              f"requests {server.hits}, {server.bytes_sent / 2**20:.1f} MB sent, parsed {cache.stats['parsed']}x")
+
+        # 2. 上游有新行：照常增量同步，版本變
+        server.update(to_csv(df))
+        frame = cache.refresh()
+        assert len(frame) == len(df) and frame.attrs['version'] != version, (label, "tail missed")
+        assert cache.stats["full_reloads"] == 1, (label, "tail caused full reload")
+        version = frame.attrs['version']
+        print(f"ok [{label}]: +{len(extra)} rows picked up incrementally")
+
+        # 3. 重啟 (新 MasterCache 讀磁碟)：用 meta.json 嘅 validators，唔使再下載 / parse
+        before = dict(server.hits)
+        restarted = MasterCache(HttpCsvUpstream(server.url), PLAYERS, cache_dir=cache_dir)
+        frame = restarted.refresh()
+        assert frame.attrs['version'] == version and restarted.stats["parsed"] == 0, (label, restarted.stats)
+        if validators:
+            assert server.hits[304] == before[304] + 1 and server.hits[200] == before[200], (label, server.hits)
+        print(f"ok [{label}]: restart served from disk, version kept, parsed {restarted.stats['parsed']}x")
+
+        # 4. 改咗中間一行 (行數唔變、最後一行一樣)：上次 body 唔再係開頭，即刻成份重新載入，版本跟內容變
+        edited = df.copy()
+        edited.loc[len(df) // 2, "Fan"] = edited.loc[len(df) // 2, "Fan"] % 10 + 3
+        server.update(to_csv(edited))
+        frame = restarted.refresh()
+        assert frame.attrs['version'] != version and restarted.stats["full_reloads"] == 1, (label, restarted.stats)
+        assert frame["Fan"].iloc[len(df) // 2] == edited["Fan"].iloc[len(df) // 2], (label, "mid-sheet edit missed")
+        # 之後冇改動：用返新 validators (304 / 同一個 hash)，唔會卡住舊內容
+        again = restarted.refresh()
+        assert again is frame and restarted.stats["full_reloads"] == 1, (label, "unchanged refresh rebuilt")
+
+        # 5. 唔識核對開頭嘅 upstream (gviz)：靠定期成份核對；內容一樣就照用原本 frame
+        restarted.upstream.checks_prefix = False
+        restarted._verified = 0
+        assert restarted.refresh() is frame and restarted.stats["verified"] == 1, (label, restarted.stats)
+        print(f"ok [{label}]: mid-sheet edit reloaded on next refresh, version changed")
+    finally:
+        server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hands", type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    df = generate_hands(args.hands, PLAYERS, seed=7)
+    for validators in (True, False):
+        with tempfile.TemporaryDirectory() as d:
+            check(validators, df, d)
+
+
+if __name__ == "__main__":
+    main()
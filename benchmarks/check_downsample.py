@@ -0,0 +1,68 @@
+"""
+核對圖表降採樣：每條線唔超過 CHART_POINTS 點，每個玩家嘅最高 / 最低點照樣保留，
+最大回撤同全量差唔遠；順便量度送去瀏覽器嘅數據量 (JSON bytes) 同計算時間。
+
+    python -m benchmarks.check_downsample --hands 1000000
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indicators
+from benchmarks.generator import generate_hands
+from indicators import CHART_POINTS, chart_series, compute_series, get_indicators
+from master_cache import coerce_types
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+
+
+def mdd(a):
+    return (a - np.fmax.accumulate(a, axis=0)).min(axis=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hands", type=int, default=1_000_000)
+    parser.add_argument("--budget", type=int, default=CHART_POINTS)
+    args = parser.parse_args(argv)
+
+    df = coerce_types(generate_hands(args.hands, PLAYERS, seed=11), PLAYERS)
+    series = compute_series(df, PLAYERS)
+    t0 = time.perf_counter()
+    charts = chart_series(series, args.budget)
+    took = time.perf_counter() - t0
+
+    for name, small in charts.items():
+        full = series[name].to_numpy()
+        got = small.to_numpy()
+        assert len(small) <= args.budget, (name, len(small))
+        assert small.index.is_monotonic_increasing, name
+        # 揀出嚟嘅點數值一定同全量一樣
+        assert np.array_equal(got, full[small.index], equal_nan=True), name
+        if name != "sma5":
+            assert np.array_equal(np.nanmax(got, axis=0), np.nanmax(full, axis=0)), (name, "max lost")
+            assert np.array_equal(np.nanmin(got, axis=0), np.nanmin(full, axis=0)), (name, "min lost")
+    eq_full, eq_small = series["equity"].to_numpy(), charts["equity"].to_numpy()
+    err = np.abs(mdd(eq_small) - mdd(eq_full)) / np.abs(mdd(eq_full))
+    print(f"ok: {args.hands} hands -> {len(charts['equity'])} equity / {len(charts['rsi'])} rsi / "
+          f"{len(charts['rolling_sharpe'])} sharpe points in {took * 1000:.1f}ms; "
+          f"extrema kept, MDD error max {err.max():.2%}")
+
+    before = sum(len(series[k].to_json()) for k in charts)
+    after = sum(len(charts[k].to_json()) for k in charts)
+    print(f"chart payload: {before / 2**20:.1f} MB -> {after / 2**10:.0f} KB")
+
+    # 同一數據版本只計一次 (降採樣結果跟指標一齊 memoize)
+    indicators._memo.clear()
+    first = get_indicators(df, PLAYERS)
+    assert get_indicators(df.copy(), PLAYERS)["charts"] is first["charts"]
+    print("ok: charts cached by data version")
+
+
+if __name__ == "__main__":
+    main()
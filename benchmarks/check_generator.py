@@ -0,0 +1,52 @@
+"""
+核對合成對局產生器：一千萬局都要喺 datetime64[ns] 範圍之內，日期跨度有上限，
+時間遞增，分數合計為 0，而且細規模嘅輸出同以前一樣 (三日一場、每場 40 局)。
+
+    python -m benchmarks.check_generator --hands 10000000
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generator import HANDS_PER_DAY, MAX_SESSIONS, generate_hands
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hands", type=int, default=10_000_000)
+    args = parser.parse_args(argv)
+
+    small = generate_hands(HANDS_PER_DAY * 3, PLAYERS)
+    days = small["Date"].dt.normalize().drop_duplicates()
+    assert len(days) == 3 and (days.diff().dropna() == pd.Timedelta(days=3)).all(), days.tolist()
+    assert (small["Date"].dt.second == 0).all()
+    print(f"ok: small runs keep {HANDS_PER_DAY} hands per session, one session every 3 days")
+
+    t0 = time.perf_counter()
+    df = generate_hands(args.hands, PLAYERS)
+    secs = time.perf_counter() - t0
+    dates = df["Date"]
+    assert dates.dtype == "datetime64[ns]" and dates.notna().all()
+    assert dates.is_monotonic_increasing
+    span = dates.iloc[-1] - dates.iloc[0]
+    assert span <= pd.Timedelta(days=3 * MAX_SESSIONS), span
+    # master_cache._row_hashes 等地方會轉成 int64 ns
+    assert (dates.astype("int64").to_numpy() > 0).all()
+    assert (df[PLAYERS].sum(axis=1) == 0).all()
+    assert df["HandID"].is_unique
+    sessions = dates.dt.normalize().nunique()
+    print(f"ok: {len(df):,} hands in {secs:.1f}s on pandas {pd.__version__}; "
+          f"{dates.iloc[0]:%Y-%m-%d} .. {dates.iloc[-1]:%Y-%m-%d}, {sessions:,} sessions, "
+          f"~{len(df) // sessions:,} hands per session")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+核對增量 IndicatorState 同原本 show_dashboard / show_pro_analysis 嘅全量公式結果一致，
+增量圖表點 (ChartPoints) 嘅數值同全量 compute_series 一樣、每條線嘅最高 / 最低點都保留。
+
+最後量度已同步一百萬局之後再加 20 局嘅成本。
+
+    python -m benchmarks.check_indicator_state
+"""
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indicators
+from benchmarks.generator import generate_hands
+from indicators import (ChartPoints, IndicatorState, chart_series, compute_indicators, compute_series,
+                        sync_state)
+from master_cache import SEAT_SEP, SEATS_COL, coerce_types, format_version, row_digest, seated_mask
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+
+
+def reference_summary(df, players):
+    """原本兩個 view 入面逐個玩家計嘅公式 (照抄)"""
+    out = {}
+    for p in players:
+        series = pd.to_numeric(df[p], errors='coerce').fillna(0)
+        price_series = series.cumsum()
+        wins = series[series > 0]
+        losses = series[series < 0]
+        gain = (series.where(series > 0, 0)).rolling(window=5, min_periods=1).mean()
+        loss = (-series.where(series < 0, 0)).rolling(window=5, min_periods=1).mean()
+        rs = gain / loss
+        short_ma = series.tail(3).mean()
+        long_ma = series.mean()
+        out[p] = {
+            "total": series.sum(),
+            "mean": long_ma,
+            "std": series.std(),
+            "skew": series.skew(),
+            "last": series.iloc[-1],
+            "win_rate": (len(wins) / len(series)) * 100,
+            "mdd": (price_series - price_series.cummax()).min(),
+            "pl_ratio": (wins.mean() / abs(losses.mean())) if not losses.empty and losses.mean() != 0 else 0,
+            "sharpe": (series.mean() / series.std()) if series.std() > 0 else 0,
+            "rsi": (100 - (100 / (1 + rs))).iloc[-1],
+            "momentum": short_ma - long_ma,
+            "expected_next": long_ma + (short_ma - long_ma) * 0.3,
+        }
+    return pd.DataFrame(out).T
+
+
+def small_charts(state, budget=200):
+    """細 budget 令分批加入嘅時候真係要合併桶"""
+    state.charts = {k: ChartPoints(state.players, budget) for k in state.charts}
+    return state
+
+
+def check_series(state, df, players, budget=200):
+    full = compute_series(df, players)
+    got = state.series()
+    assert got["form"].equals(full["form"]), "form"
+    assert np.array_equal(got["dist"].to_numpy(), full["dist"].to_numpy()), "dist"
+    for name, small in got["charts"].items():
+        ref = full[name].to_numpy()
+        assert len(small) <= budget and small.index.is_monotonic_increasing, name
+        # 揀出嚟嘅點數值同全量一樣
+        assert np.allclose(small.to_numpy(), ref[small.index], rtol=1e-9, atol=1e-9, equal_nan=True), name
+        if name != "sma5":
+            assert np.array_equal(np.nanmax(small, axis=0), np.nanmax(ref, axis=0)), (name, "max lost")
+            assert np.array_equal(np.nanmin(small, axis=0), np.nanmin(ref, axis=0)), (name, "min lost")
+
+
+def _hands(rng, n):
+    x = rng.choice([-144, -48, -24, -16, -8, 0, 0, 8, 16, 24, 48, 72, 144], size=(n, len(PLAYERS)))
+    return pd.DataFrame(x.astype('float64'), columns=PLAYERS)
+
+
+def check(seed=0, n=2000):
+    rng = np.random.default_rng(seed)
+    df = _hands(rng, n)
+    ref = reference_summary(df, PLAYERS)
+
+    # 隨機切成唔同大細嘅批次逐批加入
+    state = small_charts(IndicatorState(PLAYERS))
+    cuts = np.sort(rng.choice(np.arange(1, n), size=20, replace=False))
+    for chunk in np.split(df.to_numpy(), cuts):
+        state.update(chunk)
+    check_series(state, df, PLAYERS)
+    got = state.summary()
+    for col in ref.columns:
+        assert np.allclose(got[col].astype(float), ref[col].astype(float), rtol=1e-9, atol=1e-9,
+                           equal_nan=True), col
+
+    # 持久化 + 增量同步：先同步一半，再同步全部，結果要同一次過計一樣
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_state(df.iloc[: n // 2], PLAYERS, cache_dir=tmp)
+        synced = sync_state(df, PLAYERS, cache_dir=tmp)
+        assert synced.rows == n
+        check_series(synced, df, PLAYERS, budget=n)
+        # 由 JSON checkpoint 讀返再加局
+        indicators._states.clear()
+        extra = _hands(rng, 300)
+        grown = pd.concat([df, extra], ignore_index=True)
+        check_series(sync_state(grown, PLAYERS, cache_dir=tmp), grown, PLAYERS, budget=indicators.CHART_POINTS)
+        assert np.allclose(synced.summary()["std"], ref["std"].astype(float))
+        # 中間一行被改 (行數、最後一行都唔變)：要由頭重建
+        edited = df.copy()
+        edited.iloc[n // 3, 0] += 100
+        rebuilt = sync_state(edited, PLAYERS, cache_dir=tmp)
+        assert np.isclose(rebuilt.summary()["total"].iloc[0], ref["total"].iloc[0] + 100)
+        # 同一個名單、另一個來源：唔會用到呢個 checkpoint
+        other = df.iloc[: n // 2].copy()
+        other.attrs['source'] = "sqlite:/tmp/other.db"
+        assert sync_state(other, PLAYERS, cache_dir=tmp) is not rebuilt
+        assert len(os.listdir(tmp)) == 2
+    print(f"ok: {n} hands, {len(cuts) + 1} batches, {len(ref.columns)} indicators and chart points match")
+
+
+def check_rotating(seed=0, n=2000, roster=6, seats=4):
+    """輪流上枱：每位玩家只計自己有落枱嗰啲局，同逐個玩家淨攞自己嘅局計原本公式一樣"""
+    rng = np.random.default_rng(seed)
+    names = [f"P{i}" for i in range(roster)]
+    pick = np.argsort(rng.random((n, roster)), axis=1)[:, :seats]
+    seated = np.zeros((n, roster), dtype=bool)
+    np.put_along_axis(seated, pick, True, axis=1)
+    x = rng.choice([-144, -48, -24, -16, -8, 0, 8, 16, 24, 48, 72, 144], size=(n, roster)) * seated
+    df = pd.DataFrame(x.astype('float64'), columns=names)
+    df[SEATS_COL] = [SEAT_SEP.join(p for p, s in zip(names, row) if s) for row in seated]
+    ref = pd.concat([reference_summary(df.loc[seated[:, j], [p]], [p]) for j, p in enumerate(names)])
+
+    state = small_charts(IndicatorState(names))
+    cuts = np.sort(rng.choice(np.arange(1, n), size=20, replace=False))
+    for chunk, mask in zip(np.split(x, cuts), np.split(seated_mask(df, names), cuts)):
+        state.update(chunk, mask)
+    check_series(state, df, names)
+    full = compute_indicators(df, names)
+    for got in (state.summary(), full["summary"]):
+        for col in ref.columns:
+            assert np.allclose(got[col].astype(float), ref[col].astype(float), rtol=1e-9, atol=1e-9,
+                               equal_nan=True), col
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_state(df.iloc[: n // 2], names, cache_dir=tmp)
+        synced = sync_state(df, names, cache_dir=tmp).summary()
+        assert np.allclose(synced["win_rate"], ref["win_rate"].astype(float))
+    # 最近 5 局 / 分布都係每人自己嘅局
+    for j, p in enumerate(names):
+        own = x[seated[:, j], j]
+        assert full["form"][p].tolist() == own[-5:].tolist()
+        assert full["dist"][p].sum() == len(own)
+    print(f"ok: {n} hands, {roster} players / {seats} seats, seated-only indicators match")
+
+
+def bench_append(n=1_000_000, add=20):
+    """已同步 n 局之後再加 add 局：增量同步 + 出圖表點 vs 全量 compute_series + chart_series"""
+    df = coerce_types(generate_hands(n + add, PLAYERS, seed=5), PLAYERS)
+    # 同 MasterCache 一樣喺 attrs 帶住版本 / lineage (增量維護)，唔使每次成份 hash
+    prefix = df.iloc[:n].copy()
+    digest = row_digest(prefix)
+    prefix.attrs['version'] = format_version(n, digest)
+    df.attrs.update(version=format_version(len(df), (digest + row_digest(df.iloc[n:], n)) % 2 ** 64),
+                    lineage=[prefix.attrs['version']])
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        sync_state(prefix, PLAYERS, cache_dir=tmp).series()
+        cold = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        state = sync_state(df, PLAYERS, cache_dir=tmp)
+        got = state.series()
+        warm = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    charts = chart_series(compute_series(df, PLAYERS))
+    full = time.perf_counter() - t0
+    assert np.array_equal(got["charts"]["equity"].iloc[-1], charts["equity"].iloc[-1])
+    print(f"ok: +{add} hands on {n:,}: incremental {warm * 1000:.0f}ms (first sync {cold:.2f}s), "
+          f"full series + charts {full * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    for seed in range(3):
+        check(seed)
+        check_rotating(seed)
+    bench_append()
@@ -0,0 +1,153 @@
+"""
+核對評分系統：
+1. 向量化評分期更新同逐場對局照 Glicko-1 公式寫嘅版本一致 (包括六人名單輪流上枱)；
+2. 分幾批 sync (模擬計分頁陸續加局) 同一次過回填結果一樣，而且只處理新局；
+3. 舊局被改過就重新回填，寫到一半嘅 checkpoint 唔會用；
+4. 回填幾百萬局嘅時間，checkpoint 續計嘅評分走勢同由頭 replay 一樣。
+
+    python -m benchmarks.check_ratings --hands 2000000
+
+預設 2M 局 (pandas 2.2.3)：回填 1,999,800 局 / 2431 個評分期約 4.7s，之後每次 +20 局約 0.1s。
+"""
+import os
+import sys
+import math
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ratings
+from benchmarks.generator import generate_hands
+from master_cache import SEAT_SEP, SEATS_COL, coerce_types, format_version, row_digest, seated_mask
+from ratings import R0, RD0, RD_DRIFT, run_periods, sync_ratings, valid_hands
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+
+
+def reference(df, players):
+    """逐日、逐局、逐對玩家用 Python 計 (Glicko-1 原文公式)"""
+    q = math.log(10) / 400
+    g = lambda rd: 1 / math.sqrt(1 + 3 * q * q * rd * rd / math.pi ** 2)
+    p = len(players)
+    r, rd = [R0] * p, [RD0] * p
+    x = df[players].to_numpy()
+    ok = valid_hands(df, players)
+    seated = seated_mask(df, players)
+    day = df['Date'].dt.normalize().to_numpy()
+    for d in sorted(set(day)):
+        rd = [min(math.sqrt(v * v + RD_DRIFT ** 2), RD0) for v in rd]
+        v_inv, score = [0.0] * p, [0.0] * p
+        for h in np.flatnonzero((day == d) & ok):
+            for i in range(p):
+                for j in range(p):
+                    if i == j or not (seated[h, i] and seated[h, j]):
+                        continue
+                    s = 1.0 if x[h, i] > x[h, j] else 0.5 if x[h, i] == x[h, j] else 0.0
+                    e = 1 / (1 + 10 ** (-g(rd[j]) * (r[i] - r[j]) / 400))
+                    v_inv[i] += q * q * g(rd[j]) ** 2 * e * (1 - e)
+                    score[i] += g(rd[j]) * (s - e)
+        if not any(v_inv):
+            continue
+        new_r = [r[i] + q / (1 / rd[i] ** 2 + v_inv[i]) * score[i] for i in range(p)]
+        rd = [math.sqrt(1 / (1 / rd[i] ** 2 + v_inv[i])) for i in range(p)]
+        r = new_r
+    return np.array(r), np.array(rd)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hands", type=int, default=2_000_000)
+    args = parser.parse_args(argv)
+
+    # 1. 公式
+    small = coerce_types(generate_hands(2_000, PLAYERS, seed=4), PLAYERS)
+    r, rd, *_ = run_periods(np.full(4, R0), np.full(4, RD0), small, PLAYERS)
+    want_r, want_rd = reference(small, PLAYERS)
+    assert np.allclose(r, want_r) and np.allclose(rd, want_rd), (r, want_r)
+    print(f"ok: vectorized periods match per-pair Glicko-1 ({len(small)} hands)")
+
+    # 六人名單：每局隨機四個落枱，冇落枱嘅人分數 0、唔同人比較
+    roster = PLAYERS + ["Eddie", "Ming"]
+    rng = np.random.default_rng(3)
+    seats = np.argsort(rng.random((len(small), len(roster))), axis=1)[:, :4]
+    seats.sort(axis=1)
+    wide = np.zeros((len(small), len(roster)), dtype='int32')
+    np.put_along_axis(wide, seats, small[PLAYERS].to_numpy(), axis=1)
+    names = np.array(roster)
+    winner = names[seats[np.arange(len(small)), pd.Categorical(small['Winner'].astype(str), categories=PLAYERS).codes]]
+    rotating = small.drop(columns=PLAYERS + ['Winner']).assign(
+        Winner=winner, **{p: wide[:, i] for i, p in enumerate(roster)},
+        **{SEATS_COL: [SEAT_SEP.join(names[s]) for s in seats]})
+    rotating = coerce_types(rotating, roster)
+    r, rd, *_ = run_periods(np.full(6, R0), np.full(6, RD0), rotating, roster)
+    want_r, want_rd = reference(rotating, roster)
+    assert np.allclose(r, want_r) and np.allclose(rd, want_rd), (r, want_r)
+    print(f"ok: rotating 6-player roster matches the reference (only seated pairs compared)")
+
+    # 2. 增量 = 一次過
+    df = coerce_types(generate_hands(args.hands, PLAYERS, seed=6), PLAYERS)
+    with tempfile.TemporaryDirectory() as d:
+        cut = len(df) - 200
+        # 好似 MasterCache 咁：每次 append 之後帶住新版本 + 之前嘅版本 (lineage)
+        head = df.iloc[:cut].copy()
+        digest = row_digest(head)
+        head.attrs.update(version=format_version(cut, digest), lineage=())
+        t0 = time.perf_counter()
+        sync_ratings(head, PLAYERS, cache_dir=d)
+        backfill = time.perf_counter() - t0
+        ratings._states.clear()  # 模擬重啟：由磁碟 checkpoint 讀返
+        times, prev = [], head
+        for stop in range(cut + 20, len(df) + 1, 20):
+            frame = df.iloc[:stop].copy()
+            digest = (digest + row_digest(df.iloc[stop - 20:stop], stop - 20)) % 2 ** 64
+            frame.attrs.update(version=format_version(stop, digest),
+                               lineage=(prev.attrs['version'],) + prev.attrs['lineage'])
+            t0 = time.perf_counter()
+            summary, traj, _ = sync_ratings(frame, PLAYERS, cache_dir=d)
+            times.append(time.perf_counter() - t0)
+            prev = frame
+
+        # 3. 已計入嘅舊局被改：由頭回填，結果同新數據一次過計一樣
+        edited = df.copy()
+        i = len(df) // 3
+        edited.loc[i, PLAYERS] = -edited.loc[i, PLAYERS].to_numpy()
+        edited_summary = sync_ratings(edited, PLAYERS, cache_dir=d)[0]
+        with tempfile.TemporaryDirectory() as d2:
+            assert np.allclose(edited_summary.to_numpy(), sync_ratings(edited, PLAYERS, cache_dir=d2)[0].to_numpy())
+        # 4. save 中途 crash (新 npz + 舊 JSON)：讀唔到就重建，唔會新舊混埋
+        path = next(os.path.join(d, f) for f in os.listdir(d) if f.endswith(".json"))
+        with open(path, encoding="utf-8") as f:
+            old_meta = f.read()
+        ratings._states.clear()
+        sync_ratings(df, PLAYERS, cache_dir=d)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(old_meta)
+        try:
+            ratings.RatingState.load(path)
+            raise AssertionError("torn checkpoint accepted")
+        except ValueError:
+            pass
+        ratings._states.clear()
+        assert np.allclose(sync_ratings(df, PLAYERS, cache_dir=d)[0].to_numpy(), summary.to_numpy())
+        print("ok: edited history rebuilt; torn checkpoint (new npz + old JSON) rejected")
+    # 由頭 replay 全部對局 (冇 checkpoint)：checkpoint 續計出嚟嘅走勢每個評分期都要一樣
+    with tempfile.TemporaryDirectory() as d:
+        t0 = time.perf_counter()
+        full, full_traj, _ = sync_ratings(df, PLAYERS, cache_dir=d)
+        replay = time.perf_counter() - t0
+    assert np.allclose(summary.to_numpy(), full.to_numpy()), "incremental != backfill"
+    assert traj.index.equals(full_traj.index), "checkpoint trajectory has different periods from a full replay"
+    assert np.allclose(traj.to_numpy(), full_traj.to_numpy()), "checkpoint trajectory != full replay"
+    print(f"ok: backfill {cut} hands / {len(full_traj)} periods in {backfill:.2f}s; "
+          f"then 10 syncs of +20 hands, median {np.median(times) * 1000:.1f}ms; "
+          f"trajectory == full replay of {len(df)} hands ({replay:.2f}s)")
+    print(full.round(1).to_string())
+
+
+if __name__ == "__main__":
+    main()
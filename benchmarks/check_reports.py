@@ -0,0 +1,86 @@
+"""
+核對報告匯出：喺 process pool 畫 全部 / 一年 / 一個月 嘅 PNG 同 PDF，第二次攞係即時讀檔；
+加新局之後只有涉及嘅期間 (最新月份、今年、全部) 要重畫，舊年份嘅報告仍然有效；
+worker 死咗會記低錯誤、換走共用 pool，重試用新 pool 畫得返。
+
+    python -m benchmarks.check_reports --hands 200000 [--keep DIR]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from functools import partial
+from concurrent.futures.process import BrokenProcessPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import process_pool
+import reports
+from benchmarks.generator import generate_hands
+from master_cache import coerce_types
+from partitions import HistoryPartitions
+from reports import ALL, cached_report, get_report, periods
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hands", type=int, default=200_000)
+    parser.add_argument("--keep", help="將畫好嘅報告複製去呢個資料夾睇")
+    args = parser.parse_args(argv)
+
+    df = coerce_types(generate_hands(args.hands, PLAYERS, seed=8), PLAYERS)
+    with tempfile.TemporaryDirectory() as d:
+        history = HistoryPartitions(PLAYERS, cache_dir=d)
+        history.sync(df.iloc[:-50])
+        options = periods(history)
+        picks = [ALL, options[-len(options) // 2 - 1][:4], options[-1]]  # 全部、中間某年、最舊嗰個月
+        for period in picks:
+            for fmt in ("png", "pdf"):
+                t0 = time.perf_counter()
+                path = get_report(history, PLAYERS, period, fmt, block=True)
+                cold = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                assert get_report(history, PLAYERS, period, fmt) == path, "second request not cached"
+                warm = time.perf_counter() - t0
+                print(f"ok: {period:>7} {fmt}: render {cold:.2f}s, cached {warm * 1000:.2f}ms, "
+                      f"{os.path.getsize(path) / 1024:.0f} KB")
+                if args.keep:
+                    os.makedirs(args.keep, exist_ok=True)
+                    shutil.copy(path, args.keep)
+
+        # 加新局：只有最新月份 / 年 / 全部要重畫
+        history.sync(df)
+        latest = history.last_date().strftime("%Y-%m")
+        stale = {ALL, latest, latest[:4]}
+        for period in picks:
+            hit = cached_report(history, period, "png") is not None
+            assert hit == (period not in stale), (period, hit)
+        print(f"ok: after appending 50 hands only {sorted(stale & set(picks))} need re-rendering")
+
+        # worker 死咗：記低錯誤 (唔會自動重排)，共用 pool 換新；撳重試就用新 pool 畫返
+        pool = process_pool.get_pool()
+        period = options[1]
+        with reports._lock:
+            future = pool.submit(os._exit, 1)
+            out = reports.report_path(history, period, "png")
+            reports._pending[out] = future
+        future.add_done_callback(partial(reports._done, out, "png", time.perf_counter(), pool))
+        try:
+            future.result()
+        except BrokenProcessPool:
+            pass
+        # callback 喺 pool 嘅管理 thread 行，可能遲過 result() 返嚟
+        while out in reports._pending:
+            time.sleep(0.01)
+        assert reports.report_error(history, period, "png") and get_report(history, PLAYERS, period, "png") is None
+        assert process_pool.get_pool() is not pool
+        assert get_report(history, PLAYERS, period, "png", block=True, retry=True) == out
+        print("ok: dead worker recorded, shared pool replaced, retry renders on the new pool")
+
+
+if __name__ == "__main__":
+    main()
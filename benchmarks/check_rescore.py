@@ -0,0 +1,66 @@
+"""
+核對批量重新計分 (scoring.rescore / compare_rulesets)：
+1. 用舊表 (classic) 產生嘅歷史，rescore(df, "classic") 逐局等於記錄咗嘅分數；六人名單輪流上枱 (現行表) 一樣；
+2. rescore(...) 每人加總 == compare_rulesets 嗰一欄 (兩套規則都對)，識別唔到嘅行保留原分數；
+3. 成個歷史轉規則重新計分嘅時間。
+
+    python -m benchmarks.check_rescore --hands 1000000
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_groups import rotating_frame
+from benchmarks.generator import generate_hands
+from master_cache import coerce_types
+from scoring import RULESETS, compare_rulesets, rescore
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+
+
+def check(df, players, label, recorded_with="classic"):
+    recorded = df[players].to_numpy(dtype='int64')
+    assert (rescore(df, players, recorded_with) == recorded).all(), f"{label}: {recorded_with} rescore != recorded"
+    table = compare_rulesets(df, players, tuple(RULESETS))
+    for r in RULESETS:
+        assert np.array_equal(rescore(df, players, r).sum(axis=0), table[r].to_numpy()), f"{label}: {r}"
+    print(f"ok: {label}: {recorded_with} rescore == recorded scores; rescore sums == compare_rulesets ({len(df):,} hands)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hands", type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    check(coerce_types(generate_hands(20_000, PLAYERS, seed=1, ruleset="classic"), PLAYERS), PLAYERS, "fixed table")
+    # rotating_frame 用現行表計分 (自摸只係落枱嗰三家付錢)
+    roster = [f"P{i}" for i in range(6)]
+    check(rotating_frame(20_000, roster, seed=2), roster, "rotating 6-player roster", recorded_with="current")
+
+    # 識別唔到嘅行 (方式打錯)：兩條路都保留原分數
+    odd = coerce_types(generate_hands(2_000, PLAYERS, seed=3, ruleset="classic"), PLAYERS)
+    odd["Method"] = odd["Method"].cat.add_categories(["詐糊"])
+    odd.loc[odd.index[::50], "Method"] = "詐糊"
+    check(odd, PLAYERS, "unparsed rows kept")
+
+    df = coerce_types(generate_hands(args.hands, PLAYERS, seed=4, ruleset="classic"), PLAYERS)
+    t0 = time.perf_counter()
+    scores = rescore(df, PLAYERS, "current")
+    matrix_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    table = compare_rulesets(df, PLAYERS)
+    totals_s = time.perf_counter() - t0
+    assert np.array_equal(scores.sum(axis=0), table["current"].to_numpy())
+    assert np.array_equal(df[PLAYERS].to_numpy(dtype='int64').sum(axis=0), table["classic"].to_numpy())
+    print(f"ok: {len(df):,} hands: rescore to 'current' {matrix_s:.2f}s (hands x players matrix); "
+          f"compare_rulesets over {len(RULESETS)} rulesets {totals_s:.2f}s")
+    print(table.to_string())
+
+
+if __name__ == "__main__":
+    main()
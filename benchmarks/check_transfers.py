@@ -0,0 +1,72 @@
+"""
+核對對戰資金流向矩陣：同逐個 付款人 / 收款人 / 方式 / 番數區間 用布林篩選計嘅結果一致，
+淨額等於每人總分；量度建 index 同任意日期範圍切片嘅時間。
+
+    python -m benchmarks.check_transfers --hands 1000000
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generator import generate_hands
+from master_cache import coerce_types
+from scoring import METHODS
+from transfers import BAND_LABELS, FAN_BANDS, TransferIndex
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+
+
+def reference(df, players, start, end):
+    """原本 view 嘅寫法：每個組合一次布林篩選"""
+    df = df[(df['Date'] >= start) & (df['Date'] < pd.Timestamp(end) + pd.Timedelta(days=1))]
+    band = np.digitize(df['Fan'].to_numpy(), FAN_BANDS)
+    money = np.zeros((len(METHODS), len(BAND_LABELS), len(players), len(players)), dtype='int64')
+    count = np.zeros_like(money)
+    for m, method in enumerate(METHODS):
+        for b in range(len(BAND_LABELS)):
+            sub = df[(df['Method'] == method) & (band == b)]
+            for w, winner in enumerate(players):
+                won = sub[sub['Winner'] == winner]
+                for q, payer in enumerate(players):
+                    if q != w:
+                        paid = won[payer][won[payer] < 0]
+                        money[m, b, q, w] = -paid.sum()
+                        count[m, b, q, w] = len(paid)
+    return money, count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hands", type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    df = coerce_types(generate_hands(args.hands, PLAYERS, seed=9), PLAYERS)
+    t0 = time.perf_counter()
+    index = TransferIndex(df, PLAYERS)
+    build = time.perf_counter() - t0
+
+    money, count = index.matrix()
+    net = money.sum(axis=0) - money.sum(axis=1)
+    assert (net.to_numpy() == df[PLAYERS].sum().to_numpy()).all(), "net transfers != totals"
+
+    days = df['Date'].dt.normalize()
+    start, end = days.iloc[len(df) // 3], days.iloc[2 * len(df) // 3]
+    t0 = time.perf_counter()
+    got = index.slice(start, end)
+    sliced = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    want = reference(df, PLAYERS, start, end)
+    ref_s = time.perf_counter() - t0
+    assert (got[0] == want[0]).all() and (got[1] == want[1]).all(), "slice differs from reference"
+    print(f"ok: {args.hands} hands, build {build:.3f}s, slice {start.date()}..{end.date()} "
+          f"{sliced * 1000:.1f}ms vs nested filters {ref_s:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
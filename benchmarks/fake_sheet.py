@@ -0,0 +1,116 @@
+import re
+import time
+
+# 本地假 Google Sheet：實作 gspread Worksheet 我哋用到嘅部分
+# 網絡成本用「每個請求固定 RTT + 每格傳輸時間」模擬，方便比較讀寫量
+
+RTT_S = 0.080
+PER_CELL_S = 0.00005
+
+
+class FakeWorksheet:
+    def __init__(self, title="Sheet1", rows=None, rtt=RTT_S, per_cell=PER_CELL_S, sleep=False):
+        self.title = title
+        self.rows = [list(r) for r in (rows or [])]
+        self.rtt = rtt
+        self.per_cell = per_cell
+        self.sleep = sleep
+        self.requests = 0
+        self.cells = 0
+        self.simulated_s = 0.0
+
+    # 記錄每次請求嘅網絡成本
+    def _cost(self, cells):
+        self.requests += 1
+        self.cells += cells
+        cost = self.rtt + cells * self.per_cell
+        self.simulated_s += cost
+        if self.sleep:
+            time.sleep(cost)
+
+    @staticmethod
+    def _entered(values, option):
+        # USER_ENTERED：開頭嘅 ' 只係話 Sheets 當純文字，唔會存入格
+        if option != "USER_ENTERED":
+            return list(values)
+        return [v[1:] if isinstance(v, str) and v.startswith("'") else v for v in values]
+
+    def _range(self, row, values):
+        end = chr(ord("A") + max(len(values), 1) - 1)
+        return f"'{self.title}'!A{row}:{end}{row}"
+
+    # --- 讀 ---
+    def get_all_values(self, **kwargs):
+        out = [list(map(str, r)) for r in self.rows]
+        self._cost(sum(len(r) for r in out))
+        return out
+
+    def batch_get(self, ranges, **kwargs):
+        # 只支援 "A5:K9" 呢類範圍；同 Sheets 一樣，範圍尾嘅空行唔返回
+        out = []
+        for rng in ranges:
+            start, end = (int(x) for x in re.match(r"[A-Z]+(\d+):[A-Z]+(\d+)", rng).groups())
+            part = [list(map(str, r)) for r in self.rows[start - 1:end]]
+            while part and not any(part[-1]):
+                part.pop()
+            out.append(part)
+        self._cost(sum(len(r) for part in out for r in part))
+        return out
+
+    def row_values(self, row, **kwargs):
+        out = list(map(str, self.rows[row - 1])) if row <= len(self.rows) else []
+        self._cost(len(out))
+        return out
+
+    def col_values(self, col, **kwargs):
+        out = [str(r[col - 1]) if len(r) >= col else "" for r in self.rows]
+        self._cost(len(out))
+        return out
+
+    # --- 寫 ---
+    def append_row(self, values, value_input_option="RAW", insert_data_option=None,
+                   table_range=None, include_values_in_response=False):
+        values = self._entered(values, value_input_option)
+        self.rows.append(values)
+        row = len(self.rows)
+        self._cost(len(values) * (2 if include_values_in_response else 1))
+        updates = {"updatedRange": self._range(row, values), "updatedRows": 1}
+        if include_values_in_response:
+            updates["updatedData"] = {"values": [list(map(str, values))]}
+        return {"updates": updates}
+
+    def append_rows(self, values, value_input_option="RAW", insert_data_option=None, table_range=None):
+        start = len(self.rows) + 1
+        self.rows.extend(self._entered(r, value_input_option) for r in values)
+        self._cost(sum(len(r) for r in values))
+        return {"updates": {"updatedRange": f"'{self.title}'!A{start}", "updatedRows": len(values)}}
+
+    def update_cell(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        r = self.rows[row - 1]
+        while len(r) < col:
+            r.append("")
+        r[col - 1] = self._entered([value], "USER_ENTERED")[0]
+        self._cost(1)
+
+    def batch_update(self, data, value_input_option="RAW", **kwargs):
+        # 只支援單行範圍 (例如 "A5:K5")
+        for item in data:
+            row = int(re.match(r"[A-Z]+(\d+)", item["range"]).group(1))
+            self.rows[row - 1] = self._entered(item["values"][0], value_input_option)
+        self._cost(sum(len(item["values"][0]) for item in data))
+
+    def delete_rows(self, start_index, end_index=None):
+        end_index = end_index or start_index
+        del self.rows[start_index - 1:end_index]
+        self._cost(0)
+
+    def clear(self):
+        self.rows = []
+        self._cost(0)
+
+    def update(self, range_name=None, values=None, **kwargs):
+        # 只支援由 A1 開始成張覆寫 (即舊版 conn.update 嘅做法)
+        self.rows = [list(r) for r in values]
+        self._cost(sum(len(r) for r in values))
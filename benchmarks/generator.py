@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from scoring import DEFAULT_RULESET, METHODS, score_hands
+
+# 可重現 (seeded) 嘅合成對局產生器
+# 贏家 / 輸家 / 方式 (出統 / 自摸 / 包自摸) / 番數 全部向量化抽樣，
+# 分數用計分頁同一套規則 (scoring.py) 計，格式同 Master Record 一樣
+
+METHOD_P = [0.62, 0.33, 0.05]
+
+# 番數分布：細番多、大牌少
+FANS = np.arange(3, 14)
+FAN_P = np.array([30, 24, 16, 10, 7, 5, 3, 2, 1.5, 1, 0.5])
+FAN_P = FAN_P / FAN_P.sum()
+
+HANDS_PER_DAY = 40
+# 日期跨度上限：三日一場、大約 20 年；局數再多就每場打多啲局，
+# 唔會行到幾百年之後 (亦唔會超出 datetime64[ns] 範圍)
+MAX_SESSIONS = 20 * 365 // 3
+
+
+def generate_hands(n, players=("Martin", "Lok", "Stephen", "Fongka"), seed=0,
+                   start="2020-01-03 20:00", ruleset=DEFAULT_RULESET):
+    players = list(players)
+    p = len(players)
+    rng = np.random.default_rng(seed)
+
+    winner = rng.integers(0, p, n)
+    # 輸家：由其餘玩家揀一個 (加 1..p-1 再取餘數，確保唔係贏家)
+    loser = (winner + rng.integers(1, p, n)) % p
+    method = rng.choice(3, size=n, p=METHOD_P)
+    fan = rng.choice(FANS, size=n, p=FAN_P)
+    scores = score_hands(winner, loser, method, fan, p, ruleset)
+    rows = np.arange(n)
+    is_zimo = method == 1
+
+    # 時間：每晚一場，每場 HANDS_PER_DAY 局，每局約 6 分鐘；每 3 日打一次。
+    # 超過 MAX_SESSIONS 場就加大每場局數，局距按比例縮短，每場仍然係四個鐘左右
+    per_day = max(HANDS_PER_DAY, -(-n // MAX_SESSIONS))
+    day = rows // per_day
+    minutes = ((rows % per_day) * 6 + rng.integers(0, 5, n)) * (HANDS_PER_DAY / per_day)
+    dates = (pd.Timestamp(start) + pd.to_timedelta(day * 3, unit="D")
+             + pd.to_timedelta(minutes * 60, unit="s").round("s"))
+
+    names = np.array(players)
+    df = pd.DataFrame(scores, columns=players)
+    df.insert(0, "Date", dates)
+    df["Winner"] = names[winner]
+    df["Loser"] = np.where(is_zimo, "三家", names[loser])
+    df["Method"] = np.array(METHODS)[method]
+    df["Fan"] = fan
+    df["Remark"] = ""
+    df["HandID"] = pd.Series(rows).map("{:012x}".format).to_numpy()
+    return df
@@ -0,0 +1,68 @@
+"""
+Master Record 每局佔幾多 bytes：舊載入方式 (read_csv 推斷型別 + float64) vs 標準型別 (coerce_types)。
+
+    python -m benchmarks.memory_report --hands 2000000
+
+預設 2M 局 (pandas 2.2.3)：before 353.3 bytes/hand (673.9 MB)，after 105.0 bytes/hand (200.3 MB)。
+文字欄喺 pandas 2 係 object，每格都係一個 Python 字串；剩返最大份嘅係 HandID (69 bytes/hand)。
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from benchmarks.generator import generate_hands
+from master_cache import coerce_types
+
+PLAYERS = ["Martin", "Lok", "Stephen", "Fongka"]
+
+
+def legacy_types(df, players):
+    # 改動之前 coerce_types 嘅做法：Date datetime64，分數同番數 float64，文字欄保持 read_csv 推斷
+    df = df.copy()
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    for col in list(players) + ['Fan']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    return df
+
+
+def per_column(df):
+    usage = df.memory_usage(deep=True, index=False)
+    return {col: int(b) for col, b in usage.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hands", type=int, default=2_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    n = args.hands
+    buf = io.StringIO()
+    generate_hands(n, PLAYERS, seed=args.seed).to_csv(buf, index=False)
+    buf.seek(0)
+    raw = pd.read_csv(buf)
+
+    t0 = time.perf_counter()
+    before = legacy_types(raw, PLAYERS)
+    before_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    after = coerce_types(raw, PLAYERS)
+    after_s = time.perf_counter() - t0
+
+    for name, df, secs in (("before", before, before_s), ("after", after, after_s)):
+        cols = per_column(df)
+        total = sum(cols.values())
+        print(json.dumps({"frame": name, "hands": n, "bytes_per_hand": round(total / n, 2),
+                          "total_mb": round(total / 2**20, 1), "coerce_s": round(secs, 3),
+                          "columns": {c: round(b / n, 2) for c, b in cols.items()},
+                          "dtypes": {c: str(t) for c, t in df.dtypes.items()}}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
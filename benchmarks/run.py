@@ -0,0 +1,122 @@
+"""
+離線效能基準：用合成對局量度各頁面嘅純計算時間同峰值記憶體，輸出 JSON lines。
+
+    python -m benchmarks.run --sizes 1000,10000,100000 --players 4 --out bench.jsonl
+
+Streamlit 會換成替身 (見 stub_streamlit.py)，唔使 Google Sheets 亦唔使網絡。
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import stub_streamlit
+
+stub_streamlit.install()
+
+from benchmarks.generator import generate_hands
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+TRACE_MEMORY = True
+
+
+def measure(fn, *args, **kwargs):
+    """返回 (結果, wall 秒數, 峰值記憶體 bytes)；tracemalloc 本身會拖慢 wall time"""
+    gc.collect()
+    if TRACE_MEMORY:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        wall = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1] if TRACE_MEMORY else 0
+        tracemalloc.stop()
+    return result, wall, peak
+
+
+def bench_size(n, players, seed, workdir):
+    import utils
+    import indicators
+    from views.dashboard import show_dashboard
+    from views.pro_analysis import show_pro_analysis
+    from views.history import show_history
+    import views.daily_analysis as daily
+    from partitions import HistoryPartitions
+
+    df = generate_hands(n, players, seed=seed)
+    csv_path = os.path.join(workdir, f"master_{n}.csv")
+    df.iloc[: max(n - n // 100, 1)].to_csv(csv_path, index=False)
+
+    results = []
+
+    def record(name, fn, *args):
+        out, wall, peak = measure(fn, *args)
+        results.append({"bench": name, "hands": n, "players": len(players),
+                        "wall_s": round(wall, 6), "peak_bytes": int(peak) if TRACE_MEMORY else None})
+        return out
+
+    # load_master_data：冷啟動全量載入，然後追加 1% 新行再增量同步
+    master = record("load_master_data.cold", utils.load_master_data, csv_path, "Master Record", players)
+    df.to_csv(csv_path, index=False)
+    master = record("load_master_data.incremental", utils.load_master_data, csv_path, "Master Record", players)
+
+    # 各頁面 (每次清走指標快取，量度冷計算)
+    indicators._memo.clear()
+    record("show_dashboard", show_dashboard, master, players)
+    indicators._memo.clear()
+    record("show_pro_analysis", show_pro_analysis, master, players)
+    hist = record("history.sync.cold", HistoryPartitions(players, os.path.join(workdir, f"hist_{n}")).sync, master)
+    hist = HistoryPartitions(players, os.path.join(workdir, f"hist_{n}"))
+    record("show_history", show_history, hist, players)
+
+    # 今日戰局：用最後一日嘅數據代替 Google 分頁
+    last_day = master[master["Date"].dt.date == master["Date"].iloc[-1].date()]
+    daily.get_store = lambda *a: SimpleNamespace(kind="sheets", day_frame=lambda *a, **kw: last_day.copy(),
+                                                 aggregates=utils.get_aggregates(tuple(players)))
+    record("show_daily_analysis", daily.show_daily_analysis, players)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="逗號分隔嘅對局數，例如 1000,10000000")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="同時寫入呢個 JSON lines 檔")
+    parser.add_argument("--no-memory", action="store_true", help="唔追蹤記憶體，wall time 更準")
+    args = parser.parse_args(argv)
+
+    global TRACE_MEMORY
+    TRACE_MEMORY = not args.no_memory
+
+    base = ["Martin", "Lok", "Stephen", "Fongka"]
+    players = base[: args.players] + [f"P{i}" for i in range(len(base), args.players)]
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else None
+    with tempfile.TemporaryDirectory() as workdir:
+        # 快取目錄要喺 import utils 之前設定
+        os.environ["MJ_CACHE_DIR"] = os.path.join(workdir, "cache")
+        for n in sizes:
+            for row in bench_size(n, players, args.seed, workdir):
+                line = json.dumps(row, ensure_ascii=False)
+                print(line, flush=True)
+                if out:
+                    out.write(line + "\n")
+    if out:
+        out.close()
+
+
+if __name__ == "__main__":
+    main()
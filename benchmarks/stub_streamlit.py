@@ -0,0 +1,92 @@
+import sys
+import types
+
+# 無頭執行 view 用嘅 Streamlit 替身：所有 UI 呼叫都係 no-op，
+# 只係為咗量度 view 入面純計算嘅時間 (唔影響 app 本身)
+
+
+# install() 之後填入：元件名 → 返回預設值嘅替身
+_INPUTS = {}
+
+
+class _Widget:
+    """任何屬性 / 呼叫都返回自己；可以當 context manager 用"""
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __getattr__(self, name):
+        # 欄 / container 上面嘅輸入元件 (例如 col.date_input) 同 st.xxx 一樣返回預設值
+        return _INPUTS.get(name, self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        return iter(())
+
+
+class _SessionState(dict):
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+
+def _passthrough_decorator(*args, **kwargs):
+    # 支援 @st.cache_data 同 @st.cache_data(ttl=5) 兩種寫法
+    if len(args) == 1 and callable(args[0]) and not kwargs:
+        return args[0]
+    return lambda fn: fn
+
+
+def _columns(spec, *args, **kwargs):
+    n = spec if isinstance(spec, int) else len(spec)
+    return [_Widget() for _ in range(n)]
+
+
+def _fragment(*args, **kwargs):
+    return _passthrough_decorator(*args, **kwargs)
+
+
+class _StubModule(types.ModuleType):
+    def __getattr__(self, name):
+        return _Widget()
+
+
+def install():
+    """將 streamlit / streamlit_gsheets 換成替身，要喺 import views 之前呼叫"""
+    st = _StubModule("streamlit")
+    st.cache_data = _passthrough_decorator
+    st.cache_resource = _passthrough_decorator
+    st.fragment = _fragment
+    st.columns = _columns
+    st.tabs = lambda labels, **kw: [_Widget() for _ in labels]
+    st.session_state = _SessionState()
+    st.secrets = {}
+    st.button = lambda *a, **kw: False
+    st.radio = lambda label, options, *a, **kw: options[kw.get("index", 0)]
+    st.select_slider = lambda label, options=(), value=None, **kw: value
+    st.selectbox = lambda label, options, *a, **kw: list(options)[kw.get("index", 0)]
+    st.number_input = lambda label, *a, value=None, **kw: value if value is not None else kw.get("min_value", 0)
+    st.text_input = lambda label, value="", **kw: value
+    st.toggle = st.checkbox = lambda label, value=False, **kw: value
+    st.date_input = lambda label, value=None, **kw: value
+    st.multiselect = lambda label, options, default=None, **kw: list(default or [])
+    st.column_config = _Widget()
+    _INPUTS.update({name: getattr(st, name) for name in ("button", "radio", "select_slider", "selectbox",
+                                                         "number_input", "text_input", "toggle", "checkbox",
+                                                         "date_input", "multiselect")})
+    sys.modules["streamlit"] = st
+
+    gs = types.ModuleType("streamlit_gsheets")
+    gs.GSheetsConnection = object
+    sys.modules["streamlit_gsheets"] = gs
+    return st
@@ -0,0 +1,317 @@
+import os
+import re
+import json
+import time
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from master_cache import CACHE_DIR
+from scheduler import get_scheduler
+from sheets import HAND_ID_COL, HandSheet, _row_from_range, _same, entered_values
+
+# 每日分頁 (YYYY-MM-DD) → Master Record 嘅合併流程
+# 1. 列出所有每日分頁：未合併過、今日、最近 RECHECK_DAYS 日、同埋 app 寫過 (dirty) 嘅先要讀
+# 2. 用有上限嘅 thread pool 並發讀取 (全部經 scheduler 限速)
+# 3. 每個分頁成日同 Master Record 入面嗰日嘅行對照 (只讀 checkpoint 記低嘅嗰幾日嘅行範圍)：有 HandID 用 HandID，
+#    冇 HandID (或者舊行嘅「分頁#行號」) 用 日期時間 + 各家分數 + 贏家 + 番數；
+#    新局一個 append 請求寫晒，改過嘅局更新返嗰行，分頁刪咗嘅局 (有 HandID 嗰啲) 喺 Master 刪走
+# 4. 寫入成功先更新 checkpoint (連埋每日喺 Master 嘅行範圍)
+
+DAY_TAB = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+# 舊行冇 HandID，合併時用「分頁#行號」做識別：行號會隨 Undo 變，唔可以當真 ID 用
+LEGACY_ID = re.compile(r"^\d{4}-\d{2}-\d{2}#\d+$")
+# 每日分頁嘅 Date 只有時間：app 寫嘅 "20:15"，Sheets 顯示成 "20:15:00" / "8:15:00 PM" 都算
+TIME_ONLY = re.compile(r"^\d{1,2}:\d{2}(:\d{2})?(\s*[AP]M)?$", re.IGNORECASE)
+MASTER_TITLE = "Master Record"
+MAX_WORKERS = 4
+# 已合併嘅分頁，最近幾日每次都重新讀 (打完之後喺 Sheets 直接改嘅通常係呢幾日)
+RECHECK_DAYS = 3
+
+
+def _hk_today():
+    return datetime.now(timezone(timedelta(hours=8))).strftime("%Y-%m-%d")
+
+
+class Consolidator:
+    """
+    registry 係 sheets.WorksheetRegistry。
+    預設唔合併今日 (仲未打完，可能仲有 Undo)，include_today=True 先會。
+    """
+
+    def __init__(self, registry, players, master_title=MASTER_TITLE,
+                 checkpoint_path=None, max_workers=MAX_WORKERS):
+        self.registry = registry
+        self.players = list(players)
+        self.master_title = master_title
+        self.checkpoint_path = checkpoint_path or os.path.join(CACHE_DIR, "consolidate.json")
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        # checkpoint 檔讀寫 (mark_dirty 喺計分寫入入面 call，唔可以等成個合併完)
+        self._ckpt_lock = threading.Lock()
+
+    # --- checkpoint：{"tabs": {分頁: 合併時嘅行數 (唔計 header)}, "dirty": {分頁: 標記時間},
+    #                  "master": {"last": Master 最後一行, "days": {日子: [[開始行, 結束行], ...]}}} ---
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                ckpt = json.load(f)
+        except (OSError, ValueError):
+            ckpt = {"tabs": {}}
+        ckpt.setdefault("dirty", {})
+        return ckpt
+
+    def _save_checkpoint(self, ckpt):
+        os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_path)), exist_ok=True)
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(ckpt, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.checkpoint_path)
+
+    def mark_dirty(self, title):
+        """app 改過呢個分頁 (append / Undo / 改備註)：下次合併要重新讀"""
+        # 今日分頁每次合併 (include_today) 都會讀，唔使記
+        if not DAY_TAB.match(title) or title == _hk_today():
+            return
+        with self._ckpt_lock:
+            ckpt = self.load_checkpoint()
+            ckpt["dirty"][title] = time.time()
+            self._save_checkpoint(ckpt)
+
+    # --- 讀 ---
+    def _fetch_tab(self, title):
+        ws = self.registry.worksheet(title)
+        return title, get_scheduler().call(ws.get_all_values, kind="analytics", key=("tab_values", title))
+
+    def pending_tabs(self, ckpt, include_today=False, rescan=False):
+        """需要讀嘅分頁：未見過嘅、今日、最近 RECHECK_DAYS 日、dirty 嘅；rescan=True 就全部"""
+        today = _hk_today()
+        recent = (datetime.strptime(today, "%Y-%m-%d") - timedelta(days=RECHECK_DAYS)).strftime("%Y-%m-%d")
+        titles = [t for t in self.registry.titles(refresh=True) if DAY_TAB.match(t)]
+        out = []
+        for t in sorted(titles):
+            if t > today or (t == today and not include_today):
+                continue
+            if rescan or t not in ckpt["tabs"] or t >= recent or t in ckpt["dirty"]:
+                out.append(t)
+        return out
+
+    def _to_master_rows(self, title, values, master_header):
+        """分頁全部數據 → Master Record 欄位次序嘅 list"""
+        if not values:
+            return []
+        header, rows = values[0], values[1:]
+        out = []
+        for i, row in enumerate(rows):
+            rec = dict(zip(header, row))
+            if not any(str(v).strip() for v in row):
+                continue
+            # 每日分頁只記 HH:MM，合併時補返日子；冇 HandID 嘅舊行用分頁 + 行號做識別
+            hhmm = str(rec.get("Date", "")).strip()
+            rec["Date"] = f"{title} {hhmm}" if TIME_ONLY.match(hhmm) else hhmm
+            rec[HAND_ID_COL] = rec.get(HAND_ID_COL) or f"{title}#{i + 2}"
+            out.append([rec.get(col, "") for col in master_header])
+        return out
+
+    def _content_keys(self, header, rows):
+        """日期時間 (到分鐘) + 各家分數 + 贏家 + 番數；人手合併嘅舊行格式唔同 (例如 2024/1/5、12.0) 都對得上"""
+        if not rows:
+            return []
+        df = pd.DataFrame([r + [""] * (len(header) - len(r)) for r in rows], columns=header)
+        when = pd.to_datetime(df["Date"].astype(str).str.strip(), errors="coerce", format="mixed")
+        cols = [when.dt.strftime("%Y-%m-%d %H:%M").fillna(df["Date"].astype(str))]
+        for col in self.players + ["Fan"]:
+            num = pd.to_numeric(df[col], errors="coerce") if col in df.columns else pd.Series(0, index=df.index)
+            cols.append(num.round().astype("Int64").astype(str))
+        cols.append(df["Winner"].astype(str).str.strip() if "Winner" in df.columns else pd.Series("", index=df.index))
+        return list(zip(*cols))
+
+    def _reconcile(self, rows, keys, master, id_idx, date_idx, seen, merged_before):
+        """
+        一個分頁同 Master 入面嗰日嘅行對照，返回 ([(新行, key)], {Master 行號: 新內容}, 要刪嘅 Master 行號, 重複數)。
+        master：呢日嘅 Master 行 [(行號, row, key)]；seen：今次讀咗嘅 Master 行 (同今次已加) 嘅 HandID。
+        Date 用 key 入面整理好嘅時間比較 (Sheets 會將寫入嘅日期格式化)，其他欄逐格比較。
+        """
+        by_id = {r[id_idx]: (n, r, k) for n, r, k in master if r[id_idx] and not LEGACY_ID.match(r[id_idx])}
+        # 內容只同冇真 HandID 嘅 Master 行對 (人手合併 / 舊「分頁#行號」)：真 HandID 嘅行一定係由 HandID 對
+        by_key = defaultdict(list)
+        for n, r, key in master:
+            if not r[id_idx] or LEGACY_ID.match(r[id_idx]):
+                by_key[key].append(n)
+        matched, new, updates, dupes = set(), [], {}, 0
+        for row, key in zip(rows, keys):
+            hid = row[id_idx]
+            if hid in by_id:
+                n, old, old_key = by_id[hid]
+                matched.add(n)
+                if key[0] != old_key[0] or not all(_same(a, b) for i, (a, b) in enumerate(zip(row, old))
+                                                   if i != date_idx):
+                    updates[n] = row
+                dupes += 1
+                continue
+            if hid in seen and not LEGACY_ID.match(hid):
+                # 其他日子 / 其他分頁已經有呢個 HandID
+                dupes += 1
+                continue
+            # 分頁嗰行冇真 HandID，或者 Master 嗰行係人手合併 (冇 HandID)：用內容對
+            free = [n for n in by_key.get(key, ()) if n not in matched]
+            if free:
+                matched.add(free[0])
+                dupes += 1
+                continue
+            seen.add(hid)
+            new.append((row, key))
+        # 分頁刪咗嘅局：只刪有真 HandID (即係由合併寫入) 嘅 Master 行，人手合併嗰啲唔郁
+        deleted = [n for hid, (n, _, _) in by_id.items() if n not in matched] if merged_before else []
+        return new, updates, deleted, dupes
+
+    def run(self, include_today=False, rescan=False):
+        """
+        合併一次，返回 {"tabs": 讀咗幾多個分頁, "rows": 新增行數, "updated": 更新行數, "deleted": 刪除行數,
+        "duplicates": Master 已經有嘅行}
+        """
+        with self._lock:
+            started = time.time()
+            with self._ckpt_lock:
+                ckpt = self.load_checkpoint()
+            tabs = self.pending_tabs(ckpt, include_today, rescan)
+            if not tabs:
+                return {"tabs": 0, "rows": 0, "updated": 0, "deleted": 0, "duplicates": 0}
+
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(tabs))) as pool:
+                fetched = dict(pool.map(self._fetch_tab, tabs))
+
+            master = HandSheet(self.registry.worksheet(self.master_title), self.players)
+            header = master.header()
+            id_idx, date_idx = header.index(HAND_ID_COL), header.index("Date")
+            layout = None if rescan else ckpt.get("master")
+            read = self._read_days(master, header, tabs, layout) if layout else None
+            if read is not None:
+                keys = self._content_keys(header, [r for _, r, _ in read])
+                # 行範圍過時 (Master 喺外面排過序 / 插過行)：嗰行已經唔係嗰日，改為全讀
+                if any(k[0][:10] != day for (_, _, day), k in zip(read, keys)):
+                    read = None
+            if read is None:
+                values = get_scheduler().call(master.ws.get_all_values, kind="analytics",
+                                              key=("master_values", self.master_title))
+                read = [(i + 2, r + [""] * (len(header) - len(r)), None) for i, r in enumerate(values[1:])]
+                keys = self._content_keys(header, [r for _, r, _ in read])
+                layout = {"last": len(values), "days": None}
+            # 分頁之間 / 同其他日子嘅 HandID 重複只查到今次讀咗嘅行：HandID 係打嗰局先產生、
+            # 只寫入自己嗰日嘅分頁，跨日重複只會係人手抄錯，rescan=True 會全讀 Master 查返
+            seen = {r[id_idx] for _, r, _ in read if r[id_idx]}
+            # Master 每行屬於邊日 (用內容 key 入面已經整理好嘅日期)
+            by_day = defaultdict(list)
+            for (n, row, _), key in zip(read, keys):
+                by_day[key[0][:10]].append((n, row, key))
+            days = layout["days"]
+            if days is None:
+                days = {day: _ranges(n for n, _, _ in entries) for day, entries in by_day.items()}
+
+            batch, updates, deleted, dupes, done = [], {}, [], 0, {}
+            for title in tabs:
+                rows = self._to_master_rows(title, fetched[title], header)
+                new, upd, dele, dup = self._reconcile(rows, self._content_keys(header, rows), by_day.get(title, []),
+                                                      id_idx, date_idx, seen,
+                                                      merged_before=title in ckpt["tabs"] and bool(fetched[title]))
+                batch += [(key[0], title, row) for row, key in new]
+                updates.update(upd)
+                deleted += dele
+                dupes += dup
+                done[title] = max(len(fetched[title]) - 1, 0)
+
+            scheduler = get_scheduler()
+            last = layout["last"]
+            if updates:
+                end = _column(len(header))
+                scheduler.call(master.ws.batch_update,
+                               [{"range": f"A{n}:{end}{n}", "values": [entered_values(header, row, self.players)]}
+                                for n, row in sorted(updates.items())],
+                               value_input_option="USER_ENTERED", kind="write")
+            # 連續嘅行一個請求刪晒；由下而上刪，前面嘅行號唔會移位
+            for s, e in reversed(_ranges(deleted)):
+                scheduler.call(master.ws.delete_rows, s, e, kind="write")
+            if deleted:
+                days = _shift(days, deleted)
+                last -= len(deleted)
+            if batch:
+                # 按時間排好先寫，Master Record 保持時間順序
+                batch.sort(key=lambda b: b[0])
+                resp = scheduler.call(master.ws.append_rows,
+                                      [entered_values(header, row, self.players) for _, _, row in batch],
+                                      value_input_option="USER_ENTERED",
+                                      insert_data_option="INSERT_ROWS", table_range="A1", kind="write")
+                start = _row_from_range(resp["updates"]["updatedRange"])
+                added = defaultdict(list)
+                for k, (_, title, _) in enumerate(batch):
+                    added[title].append(start + k)
+                for title, rows in added.items():
+                    days[title] = _ranges([n for s, e in days.get(title, []) for n in range(s, e + 1)] + rows)
+                last = start + len(batch) - 1
+            with self._ckpt_lock:
+                ckpt = self.load_checkpoint()
+                ckpt["tabs"].update(done)
+                ckpt["master"] = {"last": last, "days": days}
+                # 合併途中再被標記嘅分頁留返俾下次
+                ckpt["dirty"] = {t: at for t, at in ckpt["dirty"].items() if t not in done or at > started}
+                ckpt["merged_at"] = datetime.now().isoformat(timespec="seconds")
+                self._save_checkpoint(ckpt)
+            return {"tabs": len(tabs), "rows": len(batch), "updated": len(updates), "deleted": len(deleted),
+                    "duplicates": dupes}
+
+    def _read_days(self, master, header, tabs, layout):
+        """
+        一個 batch_get 讀返要合併嗰幾日喺 Master 嘅行 (checkpoint 記低嘅行範圍)，返回 [(行號, row, 日子)]。
+        同一個請求順手讀 Master 最後一行同下一行：最後一行唔喺返原位 (外面加過 / 刪過行) 就返回 None，要全讀。
+        """
+        end = _column(len(header))
+        last = layout["last"]
+        wanted = [(day, s, e) for day in tabs for s, e in layout["days"].get(day, [])]
+        ranges = [f"A{s}:{end}{e}" for _, s, e in wanted] + [f"A{last}:{end}{last + 1}"]
+        got = get_scheduler().call(master.ws.batch_get, ranges, kind="analytics",
+                                   key=("master_rows", self.master_title, tuple(ranges)))
+        *parts, tail = got
+        if len(tail) != 1 or not any(str(v).strip() for v in tail[0]):
+            return None
+        out = []
+        for (day, s, e), part in zip(wanted, parts):
+            # 範圍尾嘅空行 Sheets 唔會返回
+            part = list(part) + [[]] * (e - s + 1 - len(part))
+            out += [(s + k, list(r) + [""] * (len(header) - len(r)), day) for k, r in enumerate(part)]
+        return out
+
+
+def _ranges(rows):
+    """行號 → 連續範圍 [[開始, 結束], ...]"""
+    out = []
+    for n in sorted(rows):
+        if out and n == out[-1][1] + 1:
+            out[-1][1] = n
+        else:
+            out.append([n, n])
+    return out
+
+
+def _shift(days, deleted):
+    """刪咗 deleted 嗰啲行之後，每日嘅行範圍跟住上移"""
+    gone = sorted(deleted)
+    out = {}
+    for day, ranges in days.items():
+        rows = []
+        for s, e in ranges:
+            hit = set(gone[bisect_left(gone, s):bisect_right(gone, e)])
+            rows += [n - bisect_left(gone, n) for n in range(s, e + 1) if n not in hit]
+        if rows:
+            out[day] = _ranges(rows)
+    return out
+
+
+def _column(n):
+    """第 n 欄 (1 起) 嘅字母：1 → A，27 → AA"""
+    out = ""
+    while n:
+        n, r = divmod(n - 1, 26)
+        out = chr(ord("A") + r) + out
+    return out
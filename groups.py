@@ -0,0 +1,80 @@
+import os
+import re
+import json
+import hashlib
+from master_cache import CACHE_DIR
+
+# 枱 (group)：每張枱有自己嘅名單 (roster)、計分儲存同快取資料夾。
+# 名單可以多過四個人 (輪流上枱)，每局只記落枱嗰幾個 (見 storage.SQLiteStore 嘅 deltas 表)。
+# 設定檔 groups.json：
+#   {"groups": [{"name": "星期五枱", "roster": ["A", "B", "C", "D", "E"], "seats": 4}, ...]}
+# 冇設定檔就只有預設枱 (即 app.py 原本嘅四人 + Google Sheets Master Record，見 utils.get_groups)。
+# 設定檔係用戶設定，同 secrets.toml 一樣放喺 .streamlit/ (唔好放 .cache/，清快取會一齊冇咗)；
+# 想放第二度就設 MJ_GROUPS_FILE 或者 secrets.toml 嘅 [storage] groups_file。
+
+GROUPS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".streamlit", "groups.json")
+# 舊版放喺快取資料夾：新位置冇設定檔而舊位置仲有，就照讀舊嗰個
+LEGACY_GROUPS_FILE = os.path.join(CACHE_DIR, "groups.json")
+SEATS = 4
+
+
+class Group:
+    """
+    只有預設枱 (default=True) 有 csv_url (Google Sheets Master Record)，沿用 CACHE_DIR 根目錄 (舊快取唔使重建)；
+    其他枱只用本地 SQLite，數據同快取各自喺 groups/<slug>/。
+    """
+
+    def __init__(self, name, roster, seats=SEATS, csv_url=None, default=False):
+        self.name = name
+        self.roster = list(roster)
+        self.seats = int(seats)
+        self.csv_url = csv_url
+        self.default = default
+        if len(set(self.roster)) != len(self.roster):
+            raise ValueError(f"duplicate players in roster of {name!r}")
+        if len(self.roster) < 2 or not 2 <= self.seats <= len(self.roster):
+            raise ValueError(f"group {name!r} needs 2..{len(self.roster)} seats, got {self.seats}")
+
+    @property
+    def slug(self):
+        # 資料夾名：純英文數字嘅枱名照用，其他 (例如中文枱名) 用 hash
+        if re.fullmatch(r"[A-Za-z0-9_-]+", self.name):
+            return self.name.lower()
+        return "group-" + hashlib.sha1(self.name.encode("utf-8")).hexdigest()[:8]
+
+    @property
+    def cache_dir(self):
+        return CACHE_DIR if self.default else os.path.join(CACHE_DIR, "groups", self.slug)
+
+    def __repr__(self):
+        return f"Group({self.name!r}, {self.roster!r})"
+
+
+def load_groups(default, path=GROUPS_FILE):
+    """返回 {枱名: Group}，預設枱排第一；設定檔有同名嘅枱會覆蓋預設枱嘅名單"""
+    groups = {default.name: default}
+    if path == GROUPS_FILE and not os.path.exists(path) and os.path.exists(LEGACY_GROUPS_FILE):
+        print(f"Reading groups from {LEGACY_GROUPS_FILE}; move it to {path} so clearing the cache keeps it")
+        path = LEGACY_GROUPS_FILE
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    except OSError:
+        return groups
+    except ValueError as e:
+        print(f"Invalid groups file {path}: {e}")
+        return groups
+    if not isinstance(config, dict):
+        print(f"Invalid groups file {path}: expected an object with a \"groups\" list")
+        return groups
+    for spec in config.get("groups", []):
+        # 一張枱設定錯 (冇名 / 名單 / 人數唔啱) 只係略過嗰張枱，唔好令所有頁面開唔到
+        try:
+            is_default = spec["name"] == default.name
+            group = Group(spec["name"], spec["roster"], spec.get("seats", SEATS),
+                          default.csv_url if is_default else None, default=is_default)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Skipping invalid group in {path}: {spec!r} ({e})")
+            continue
+        groups[group.name] = group
+    return groups
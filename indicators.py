@@ -0,0 +1,564 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from master_cache import (CACHE_DIR, SEATS_COL, data_version, frame_cache_dir, frame_source, prefix_matches,
+                          row_digest, seated_mask, seated_rows)
+from metrics import get_metrics
+
+# 共用指標引擎：將玩家分數矩陣 (hands × players) 一次過攞出嚟，
+# 所有指標都用 2-D NumPy 一個 pass 計晒，dashboard 同 pro analysis 用同一份結果
+
+WINDOW = 5
+DIST_BINS = [-float('inf'), -500, -300, -100, 0, 100, 300, 500, float('inf')]
+DIST_LABELS = ["<-500", "-300", "-100", "<0", ">0", "+100", "+300", ">500"]
+
+
+def score_matrix(df, players):
+    """玩家分數 → float64 矩陣；標準型別 (int32) 直接轉，其他先轉數值、非數值當 0"""
+    scores = df[list(players)]
+    if not all(pd.api.types.is_numeric_dtype(t) for t in scores.dtypes):
+        scores = scores.apply(pd.to_numeric, errors='coerce')
+    return scores.fillna(0).to_numpy(dtype='float64')
+
+
+def rolling_sum(x, window, min_periods=None):
+    """沿 axis 0 嘅滾動總和 (cumsum 相減)，未夠 min_periods 嘅位置係 NaN"""
+    min_periods = window if min_periods is None else min_periods
+    c = np.cumsum(x, axis=0)
+    out = c.copy()
+    out[window:] = c[window:] - c[:-window]
+    counts = np.minimum(np.arange(1, len(x) + 1), window).reshape(-1, *([1] * (x.ndim - 1)))
+    out[np.broadcast_to(counts < min_periods, out.shape)] = np.nan
+    return out, counts
+
+
+def _rsi(x):
+    # RSI 以每局得失 (即資本曲線嘅變化) 計，窗口 5，頭幾局用已有數據
+    gain, n = rolling_sum(np.where(x > 0, x, 0.0), WINDOW, 1)
+    loss, _ = rolling_sum(np.where(x < 0, -x, 0.0), WINDOW, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = (gain / n) / (loss / n)
+        return 100 - 100 / (1 + rs)
+
+
+def _rolling_sharpe(x):
+    s1, _ = rolling_sum(x, WINDOW)
+    s2, _ = rolling_sum(x * x, WINDOW)
+    mean = s1 / WINDOW
+    var = np.maximum((WINDOW * s2 - s1 * s1) / (WINDOW * (WINDOW - 1)), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = mean / np.sqrt(var)
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+def _skew(x, mean):
+    # 同 pandas Series.skew 一樣 (adjusted Fisher-Pearson)
+    n = len(x)
+    if n < 3:
+        return np.full(x.shape[1], np.nan)
+    d = x - mean
+    m2 = (d ** 2).mean(axis=0)
+    m3 = (d ** 3).mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        g1 = np.where(m2 > 0, m3 / m2 ** 1.5, 0.0)
+    return g1 * np.sqrt(n * (n - 1)) / (n - 2)
+
+
+def _distribution(x):
+    # pd.cut(right=True) 等價：每個值落喺 (a, b] 區間
+    inner = np.asarray(DIST_BINS[1:-1])
+    idx = np.searchsorted(inner, x, side='left')
+    nb = len(DIST_LABELS)
+    flat = (idx + np.arange(x.shape[1]) * nb).ravel()
+    return np.bincount(flat, minlength=nb * x.shape[1]).reshape(x.shape[1], nb).T
+
+
+def _summary(x, rsi):
+    """純量指標：x 係 hands × players，rsi 係每位玩家最後一局嘅 RSI"""
+    n, p = x.shape
+    if n:
+        equity = np.cumsum(x, axis=0)
+        total = equity[-1]
+        mean = x.mean(axis=0)
+        std = x.std(axis=0, ddof=1) if n > 1 else np.full(p, np.nan)
+        mdd = (equity - np.maximum.accumulate(equity, axis=0)).min(axis=0)
+        wins = x > 0
+        losses = x < 0
+        n_win = wins.sum(axis=0)
+        n_loss = losses.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_win = np.where(wins, x, 0).sum(axis=0) / n_win
+            avg_loss = np.where(losses, x, 0).sum(axis=0) / n_loss
+            pl_ratio = np.where((n_loss > 0) & (avg_loss != 0), avg_win / np.abs(avg_loss), 0.0)
+        sharpe = np.where(std > 0, mean / np.where(std > 0, std, 1), 0.0)
+        momentum = x[-3:].mean(axis=0) - mean
+        last = x[-1]
+        prev = x[-2] if n > 1 else x[-1]
+        win_rate = n_win / n * 100
+    else:
+        mean = std = mdd = pl_ratio = sharpe = momentum = last = prev = np.full(p, np.nan)
+        n_win = n_loss = total = win_rate = np.zeros(p)
+    return {
+        "hands": np.full(p, n),
+        "total": total,
+        "mean": mean,
+        "std": std,
+        "skew": _skew(x, mean) if n else np.full(p, np.nan),
+        "last": last,
+        "prev": prev,
+        "wins": n_win,
+        "losses": n_loss,
+        "win_rate": win_rate,
+        "mdd": mdd,
+        "pl_ratio": pl_ratio,
+        "sharpe": sharpe,
+        "rsi": rsi,
+        "momentum": momentum,
+        "expected_next": mean + momentum * 0.3,
+    }
+
+
+def compute_indicators(df, players):
+    """
+    一次過計所有玩家嘅所有指標。返回 dict：
+    summary: 每位玩家一行嘅純量指標 (DataFrame, index=players)
+    equity / rsi / rolling_sharpe / sma5: hands × players 嘅時間序列
+    form: 最近 5 局分數；dist: 損益分布次數
+    輪流上枱嘅枱每位玩家只計自己有落枱嗰啲局 (坐出嗰局唔當 0 分局)。
+    """
+    players = list(players)
+    x = score_matrix(df, players)
+    rows = seated_rows(df, players)
+    series = compute_series(df, players, x, rows)
+    rsi = series["rsi"].to_numpy()[-1] if len(x) else np.full(len(players), np.nan)
+    if rows is None:
+        stats = _summary(x, rsi)
+    else:
+        parts = [_summary(x[r, j][:, None], rsi[j:j + 1]) for j, r in enumerate(rows)]
+        stats = {k: np.concatenate([s[k] for s in parts]) for k in parts[0]}
+    return {"summary": pd.DataFrame(stats, index=players), **series}
+
+
+def _spread(n, rows, values):
+    # 每位玩家自己嗰串局嘅序列 → 全部 n 局：坐出嗰局沿用佢上一局嘅值，未落過枱係 NaN
+    out = np.full((n, len(rows)), np.nan)
+    hands = np.arange(n)
+    for j, (r, v) in enumerate(zip(rows, values)):
+        if len(r):
+            pos = np.searchsorted(r, hands, side='right') - 1
+            out[:, j] = np.where(pos >= 0, v[np.maximum(pos, 0)], np.nan)
+    return out
+
+
+def compute_series(df, players, x=None, rows=None):
+    """
+    圖表用嘅時間序列 (equity / rsi / rolling_sharpe / sma5) 同 form、dist。
+    rows (見 master_cache.seated_rows) 畀咗就每位玩家用自己落枱嗰啲局計 (成本 = 局數 × 每局人數)。
+    """
+    players = list(players)
+    x = score_matrix(df, players) if x is None else x
+    rows = seated_rows(df, players) if rows is None else rows
+    n = len(x)
+    equity = np.cumsum(x, axis=0)
+    if rows is None:
+        rsi, sharpe = _rsi(x), _rolling_sharpe(x)
+        sma5 = rolling_sum(equity, WINDOW)[0] / WINDOW
+        form, dist = x[-WINDOW:], _distribution(x)
+    else:
+        own = [x[r, j] for j, r in enumerate(rows)]
+        rsi = _spread(n, rows, [_rsi(v[:, None])[:, 0] for v in own])
+        sharpe = _spread(n, rows, [_rolling_sharpe(v[:, None])[:, 0] for v in own])
+        sma5 = _spread(n, rows, [rolling_sum(np.cumsum(v), WINDOW)[0] / WINDOW for v in own])
+        # 最近 5 局：每人自己嘅最近 5 局，唔夠嘅喺前面補 NaN
+        k = min(n, WINDOW)
+        form = np.column_stack([np.concatenate([np.full(k, np.nan), v])[-k:] for v in own]) if k \
+            else np.zeros((0, len(players)))
+        dist = np.column_stack([_distribution(v[:, None])[:, 0] for v in own])
+    frame = lambda a: pd.DataFrame(a, columns=players, index=df.index)
+    return {
+        "equity": frame(equity),
+        "rsi": frame(rsi),
+        "rolling_sharpe": frame(sharpe),
+        "sma5": frame(sma5),
+        "form": pd.DataFrame(form, columns=players),
+        "dist": pd.DataFrame(dist, index=DIST_LABELS, columns=players),
+    }
+
+
+# --- 圖表降採樣 ---
+# 每條線最多 CHART_POINTS 點：按局數平均分桶，每桶保留每個玩家嘅最高同最低點 (頂位 / 回撤谷底唔會漏)，
+# 再加頭尾兩點。所有玩家共用同一組點 (聯集)，圖表嘅 index 保持一致
+
+CHART_POINTS = int(os.environ.get("MJ_CHART_POINTS", 2000))
+
+
+def minmax_points(a, budget=CHART_POINTS):
+    """
+    a 係 (N × players) 矩陣，返回要保留嘅行 (已排序嘅 index array)，數量唔超過 budget。
+    每桶每個玩家揀 argmin / argmax，成個過程係 reshape 之後一次 argmin / argmax，唔使逐個玩家 loop。
+    """
+    a = np.asarray(a, dtype='float64')
+    if a.ndim == 1:
+        a = a[:, None]
+    n, p = a.shape
+    if n <= budget:
+        return np.arange(n)
+    # 每桶最多出 2p 點，加頭尾兩點
+    buckets = max((budget - 2) // (2 * p), 1)
+    size = -(-n // buckets)
+    pad = buckets * size - n
+    # 唔夠整桶就重複最後一行補齊；NaN (例如頭幾局嘅 Sharpe) 唔會被揀做極值
+    lo = np.where(np.isnan(a), np.inf, a)
+    hi = np.where(np.isnan(a), -np.inf, a)
+    if pad:
+        lo = np.concatenate([lo, np.repeat(lo[-1:], pad, axis=0)])
+        hi = np.concatenate([hi, np.repeat(hi[-1:], pad, axis=0)])
+    offset = (np.arange(buckets) * size)[:, None]
+    picks = np.concatenate([
+        (lo.reshape(buckets, size, p).argmin(axis=1) + offset).ravel(),
+        (hi.reshape(buckets, size, p).argmax(axis=1) + offset).ravel(),
+        [0, n - 1],
+    ])
+    return np.unique(np.minimum(picks, n - 1))
+
+
+def chart_series(series, budget=CHART_POINTS):
+    """compute_series 嘅結果 → 降採樣後嘅圖表數據；SMA5 跟 equity 用同一組點，方便同一張圖畫"""
+    eq = minmax_points(series["equity"].to_numpy(), budget)
+    out = {"equity": series["equity"].iloc[eq], "sma5": series["sma5"].iloc[eq]}
+    for name in ("rsi", "rolling_sharpe"):
+        out[name] = series[name].iloc[minmax_points(series[name].to_numpy(), budget)]
+    return out
+
+
+class ChartPoints:
+    """
+    可以逐批 append 嘅 minmax 降採樣 (增量版 chart_series)：一樣係每桶留每個玩家嘅最高 / 最低點 + 頭尾兩點，
+    但桶由第 0 局開始、大小係 2 嘅次方，append 之後舊桶唔會移位；桶數超過上限就大小加倍，
+    喺已留低嘅點入面再揀一次 (細桶嘅極值一定係佢所屬大桶嘅候選)。成本 = 新增局數 + 已留低嘅點數。
+    values 頭 len(players) 欄用嚟揀點，後面嘅欄跟住同一組點保留 (例如 SMA5 跟 equity)。
+    """
+
+    def __init__(self, players, budget=CHART_POINTS):
+        self.budget = budget
+        self.buckets = max((budget - 2) // (2 * len(players)), 1)
+        self.p = len(players)
+        self.size = 1
+        self.n = 0
+        self.rows = np.zeros(0, dtype='int64')
+        self.values = None
+
+    def add(self, values):
+        values = np.asarray(values, dtype='float64')
+        m = len(values)
+        if m == 0:
+            return self
+        rows = np.concatenate([self.rows, np.arange(self.n, self.n + m)])
+        vals = values if self.values is None else np.concatenate([self.values, values])
+        self.n += m
+        # 未超過 budget 就全部留 (同 minmax_points 一樣)
+        while self.n > self.budget and -(-self.n // self.size) > self.buckets:
+            self.size *= 2
+        if self.n > self.budget:
+            key = vals[:, :self.p]
+            bucket = rows // self.size
+            starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+            idx = np.arange(len(rows))[:, None]
+            # 每桶每個玩家第一個最低 / 最高點；NaN 唔會被揀做極值
+            picks = [[0, len(rows) - 1]]
+            for a in (np.where(np.isnan(key), np.inf, key), np.where(np.isnan(key), np.inf, -key)):
+                best = np.minimum.reduceat(a, starts, axis=0)
+                hit = a == np.repeat(best, np.diff(np.r_[starts, len(rows)]), axis=0)
+                picks.append(np.minimum.reduceat(np.where(hit, idx, len(rows)), starts, axis=0).ravel())
+            keep = np.unique(np.concatenate(picks))
+            rows, vals = rows[keep], vals[keep]
+        self.rows, self.values = rows, vals
+        return self
+
+    def frame(self, players, part=0):
+        """第 part 組欄 (每組 len(players) 欄) 做 DataFrame，index 係原本嘅局數"""
+        p = len(players)
+        vals = self.values[:, part * p:(part + 1) * p] if self.values is not None else np.zeros((0, p))
+        return pd.DataFrame(vals, columns=players, index=self.rows)
+
+    def to_dict(self):
+        return {"budget": self.budget, "size": self.size, "n": self.n, "rows": self.rows.tolist(),
+                "values": None if self.values is None else self.values.tolist()}
+
+    @classmethod
+    def from_dict(cls, players, d):
+        if d["budget"] != CHART_POINTS:
+            # CHART_POINTS 改咗：用返舊 budget 揀嘅點唔啱，要重建
+            raise ValueError("chart budget changed")
+        out = cls(players, d["budget"])
+        out.size, out.n = d["size"], d["n"]
+        out.rows = np.array(d["rows"], dtype='int64')
+        if d["values"] is not None:
+            out.values = np.array(d["values"], dtype='float64').reshape(len(out.rows), -1)
+        return out
+
+
+# --- 增量指標狀態 ---
+# 歷史只會 append，所以純量指標可以用運行中嘅狀態更新：
+# Welford / Pébay 嘅動差合併、運行中最高位同最大回撤、最近 5 局嘅環形緩衝、勝負計數、分布次數；
+# 圖表序列 (equity / SMA5 / RSI / Sharpe) 只需要最近 5 局做 context，新增嘅局計完即刻併入 ChartPoints
+
+class IndicatorState:
+    def __init__(self, players):
+        p = len(players)
+        self.players = list(players)
+        self.rows = 0
+        # 每位玩家計咗幾多局 (輪流上枱嘅枱只計有落枱嗰啲)
+        self.hands = np.zeros(p)
+        self.mean = np.zeros(p)
+        self.m2 = np.zeros(p)
+        self.m3 = np.zeros(p)
+        self.total = np.zeros(p)
+        self.peak = np.full(p, -np.inf)
+        self.mdd = np.zeros(p)
+        self.n_win = np.zeros(p)
+        self.n_loss = np.zeros(p)
+        self.sum_win = np.zeros(p)
+        self.sum_loss = np.zeros(p)
+        # 每人最近 5 局，未夠 5 局嘅位置係 NaN
+        self.ring = np.full((WINDOW, p), np.nan)
+        self.dist = np.zeros((len(DIST_LABELS), p))
+        # equity 同 SMA5 共用一組點
+        self.charts = {"equity": ChartPoints(players), "rsi": ChartPoints(players),
+                       "rolling_sharpe": ChartPoints(players)}
+        # 處理過嘅行當時嘅數據版本 + 內容 digest (見 master_cache.row_digest)，用嚟知道舊行有冇被改過
+        self.version = None
+        self.digest = 0
+
+    def update(self, x, seated=None):
+        """
+        加入 N 局 (N × players 矩陣)，成本 O(N)。
+        seated (見 master_cache.seated_mask) 畀咗就每位玩家只加自己有落枱嗰啲局。
+        """
+        x = np.asarray(x, dtype='float64')
+        if len(x) == 0:
+            return self
+        equity, sma5, rsi, sharpe = self._tail_series(x, seated)
+        self.charts["equity"].add(np.hstack([equity, sma5]))
+        self.charts["rsi"].add(rsi)
+        self.charts["rolling_sharpe"].add(sharpe)
+        self.rows += len(x)
+        if seated is None or seated.all():
+            self._merge(slice(None), x)
+        else:
+            for j in range(len(self.players)):
+                own = x[seated[:, j], j]
+                if len(own):
+                    self._merge(slice(j, j + 1), own[:, None])
+        return self
+
+    def _tail_series(self, x, seated):
+        """
+        新增 N 局嘅 equity / SMA5 / RSI / Sharpe (同 compute_series 全量計嗰幾行一樣)：
+        每位玩家用環形緩衝入面自己最近 5 局做 context，坐出嗰局沿用佢上一局嘅值。
+        """
+        m, p = x.shape
+        equity = self.total + np.cumsum(x, axis=0)
+        sma5, rsi, sharpe = (np.full((m, p), np.nan) for _ in range(3))
+        for j in range(p):
+            seat = np.ones(m, dtype=bool) if seated is None else seated[:, j]
+            context = self.ring[:, j][~np.isnan(self.ring[:, j])]
+            own = np.concatenate([context, x[seat, j]])[:, None]
+            k = len(context)
+            # context 之前嘅 equity = 而家 total 減返 context 嗰幾局
+            own_eq = self.total[j] - context.sum() + np.cumsum(own[:, 0])
+            pos = k - 1 + np.cumsum(seat)
+            valid = pos >= 0
+            pos = np.maximum(pos, 0)
+            for out, v in ((rsi, _rsi(own)[:, 0]), (sharpe, _rolling_sharpe(own)[:, 0]),
+                           (sma5, rolling_sum(own_eq, WINDOW)[0] / WINDOW)):
+                out[:, j] = np.where(valid, v[pos], np.nan)
+        return equity, sma5, rsi, sharpe
+
+    def _merge(self, cols, x):
+        m = len(x)
+        n = self.hands[cols]
+        # 動差合併 (Pébay)：先計新批次自己嘅 mean / M2 / M3，再同舊狀態合併
+        mean_b = x.mean(axis=0)
+        d = x - mean_b
+        m2_b = (d ** 2).sum(axis=0)
+        m3_b = (d ** 3).sum(axis=0)
+        tot = n + m
+        delta = mean_b - self.mean[cols]
+        self.m3[cols] = (self.m3[cols] + m3_b + delta ** 3 * n * m * (n - m) / tot ** 2
+                         + 3 * delta * (n * m2_b - m * self.m2[cols]) / tot)
+        self.m2[cols] = self.m2[cols] + m2_b + delta ** 2 * n * m / tot
+        self.mean[cols] = self.mean[cols] + delta * m / tot
+        self.hands[cols] = tot
+
+        # 資本曲線、最高位、最大回撤
+        equity = self.total[cols] + np.cumsum(x, axis=0)
+        peak = np.maximum(self.peak[cols], np.maximum.accumulate(equity, axis=0))
+        self.mdd[cols] = np.minimum(self.mdd[cols], (equity - peak).min(axis=0))
+        self.peak[cols] = peak[-1]
+        self.total[cols] = equity[-1]
+
+        self.n_win[cols] += (x > 0).sum(axis=0)
+        self.n_loss[cols] += (x < 0).sum(axis=0)
+        self.sum_win[cols] += np.where(x > 0, x, 0).sum(axis=0)
+        self.sum_loss[cols] += np.where(x < 0, x, 0).sum(axis=0)
+        self.ring[:, cols] = np.vstack([self.ring[:, cols], x[-WINDOW:]])[-WINDOW:]
+        self.dist[:, cols] += _distribution(x)
+
+    def summary(self):
+        """同 compute_indicators(...)['summary'] 一樣嘅結果"""
+        if self.rows == 0:
+            return compute_indicators(pd.DataFrame(columns=self.players), self.players)["summary"]
+        n = self.hands
+        ring = self.ring
+        seen = ~np.isnan(ring)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(n > 0, self.mean, np.nan)
+            std = np.where(n > 1, np.sqrt(self.m2 / (n - 1)), np.nan)
+            g1 = np.where(self.m2 > 0, (self.m3 / n) / (self.m2 / n) ** 1.5, 0.0)
+            skew = np.where(n > 2, g1 * np.sqrt(n * (n - 1)) / (n - 2), np.nan)
+            avg_win = self.sum_win / self.n_win
+            avg_loss = self.sum_loss / self.n_loss
+            pl_ratio = np.where((self.n_loss > 0) & (avg_loss != 0), avg_win / np.abs(avg_loss), 0.0)
+            gain = np.where(ring > 0, ring, 0).sum(axis=0) / seen.sum(axis=0)
+            loss = np.where(ring < 0, -ring, 0).sum(axis=0) / seen.sum(axis=0)
+            rsi = 100 - 100 / (1 + gain / loss)
+            momentum = np.where(seen[-3:], ring[-3:], 0).sum(axis=0) / seen[-3:].sum(axis=0) - mean
+            win_rate = np.where(n > 0, self.n_win / n * 100, 0.0)
+        sharpe = np.where(std > 0, mean / np.where(std > 0, std, 1), np.where(n > 0, 0.0, np.nan))
+        return pd.DataFrame({
+            "hands": n,
+            "total": self.total,
+            "mean": mean,
+            "std": std,
+            "skew": skew,
+            "last": ring[-1],
+            "prev": np.where(n > 1, ring[-2], ring[-1]),
+            "wins": self.n_win,
+            "losses": self.n_loss,
+            "win_rate": win_rate,
+            "mdd": np.where(n > 0, self.mdd, np.nan),
+            "pl_ratio": np.where(n > 0, pl_ratio, np.nan),
+            "sharpe": sharpe,
+            "rsi": rsi,
+            "momentum": momentum,
+            "expected_next": mean + momentum * 0.3,
+        }, index=self.players)
+
+    def series(self):
+        """同 compute_indicators(...) 入面 form / dist / chart_series(...) 對應嘅結果 (圖表係增量降採樣版)"""
+        k = min(self.rows, WINDOW)
+        charts = {name: self.charts[name].frame(self.players) for name in ("equity", "rsi", "rolling_sharpe")}
+        charts["sma5"] = self.charts["equity"].frame(self.players, 1)
+        return {
+            "form": pd.DataFrame(self.ring[WINDOW - k:], columns=self.players),
+            "dist": pd.DataFrame(self.dist.astype('int64'), index=DIST_LABELS, columns=self.players),
+            "charts": charts,
+        }
+
+    # 持久化 (JSON)
+    def to_dict(self):
+        out = {k: (v.tolist() if isinstance(v, np.ndarray) else v) for k, v in self.__dict__.items()}
+        out["peak"] = [None if np.isinf(v) else v for v in self.peak]
+        out["charts"] = {k: v.to_dict() for k, v in self.charts.items()}
+        return out
+
+    @classmethod
+    def from_dict(cls, d):
+        state = cls(d["players"])
+        # 舊版 checkpoint (冇 digest / 每人局數 / 圖表點) 要重建
+        for k in ("digest", "hands", "dist", "charts"):
+            if k not in d:
+                raise KeyError(k)
+        for k, v in d.items():
+            if k in ("players", "rows", "version", "digest"):
+                setattr(state, k, v)
+            elif k == "charts":
+                state.charts = {name: ChartPoints.from_dict(state.players, c) for name, c in v.items()}
+            elif k == "peak":
+                state.peak = np.array([-np.inf if e is None else e for e in v], dtype='float64')
+            else:
+                state.__dict__[k] = np.array(v, dtype='float64').reshape(-1, len(state.players)) \
+                    if k in ("ring", "dist") else np.array(v, dtype='float64')
+        return state
+
+
+_states = {}
+_states_lock = threading.Lock()
+# 每個 checkpoint 一把鎖：唔同枱 (唔同資料夾) 嘅狀態可以同時追
+_path_locks = {}
+
+
+def _path_lock(path):
+    with _states_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+def sync_state(df, players, cache_dir=CACHE_DIR):
+    """
+    將持久化嘅指標狀態追到 df 最新一行：只處理上次之後新增嘅行。
+    如果處理過嘅行內容同 df 對唔上 (數據被改過)，就由頭重建。
+    checkpoint 按 來源 + 名單 分開，唔同來源 (Sheets / SQLite / 測試表) 唔會共用。
+    """
+    players = list(players)
+    digest = hashlib.sha1(json.dumps([frame_source(df), players]).encode("utf-8")).hexdigest()[:12]
+    path = os.path.join(cache_dir, f"indicators_{digest}.json")
+    with _path_lock(path):
+        state = _states.get(path)
+        if state is None and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    state = IndicatorState.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                # 舊版或者壞咗嘅 checkpoint：重建
+                print(f"Indicator checkpoint unreadable, rebuilding: {e}")
+        if state is None or not prefix_matches(df, state.rows, state.digest, state.version):
+            state = IndicatorState(players)
+        version = data_version(df)
+        if state.rows < len(df) or state.version != version:
+            tail = df.iloc[state.rows:]
+            state.digest = (state.digest + row_digest(tail, state.rows)) % 2 ** 64
+            state.update(score_matrix(tail, players), seated_mask(tail, players) if SEATS_COL in df.columns else None)
+            state.version = version
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state.to_dict(), f)
+            os.replace(tmp, path)
+        _states[path] = state
+        return state
+
+
+# --- 按數據版本 memoize ---
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+MEMO_SIZE = 8
+
+
+def get_indicators(df, players):
+    """
+    同一個數據版本只計一次；多個 session / 頁面共用結果。
+    全部由持久化嘅增量狀態提供 (只處理新增嘅局)：summary、form、dist，
+    同 "charts" (降採樣後畫圖用嘅 equity / sma5 / rsi / rolling_sharpe，每條線最多 CHART_POINTS 點)。
+    """
+    key = (data_version(df), tuple(players))
+    with _memo_lock:
+        cached = _memo.get(key)
+        if cached is not None:
+            _memo.move_to_end(key)
+    get_metrics().cache("indicators", cached is not None)
+    if cached is not None:
+        return cached
+    with get_metrics().timer("indicator_seconds", stage="state"):
+        state = sync_state(df, players, frame_cache_dir(df))
+        result = {"summary": state.summary(), **state.series()}
+    with _memo_lock:
+        _memo[key] = result
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return result
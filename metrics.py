@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# 全 process 共用嘅效能計數：
+# 1. counters：API 請求 (按 op / kind)、429、各快取命中 / 未命中
+# 2. timings：頁面 render、數據載入、指標計算 (次數 / 總時間 / 最長)
+# 匯出做 Prometheus text 同 JSON (寫去本地檔，外部 node_exporter textfile collector 或者人手睇都得)
+
+EXPORT_INTERVAL = 10.0
+# 預設同其他快取一齊放 .cache/ (唔 import master_cache，避免 scheduler 要拖埋 pandas)
+METRICS_DIR = os.environ.get("MJ_METRICS_DIR") or os.environ.get(
+    "MJ_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _prom_labels(labels):
+    if not labels:
+        return ""
+    body = ",".join('%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return "{" + body + "}"
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = Counter()
+        # (name, labels) -> [次數, 總秒數, 最長秒數]
+        self.timings = {}
+        self.started = time.time()
+        self._exported = 0.0
+        # 匯出用另一把鎖 (prometheus / snapshot 要用 _lock)：間隔檢查同寫檔一齊做，兩個 session 唔會同時寫
+        self._export_lock = threading.Lock()
+
+    # --- 記錄 ---
+    def count(self, name, n=1, **labels):
+        with self._lock:
+            self.counters[(name, _labels(labels))] += n
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            t = self.timings.setdefault(key, [0, 0.0, 0.0])
+            t[0] += 1
+            t[1] += seconds
+            t[2] = max(t[2], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def cache(self, name, hit):
+        """快取查詢結果：cache_requests_total / cache_misses_total"""
+        self.count("cache_requests_total", cache=name)
+        if not hit:
+            self.count("cache_misses_total", cache=name)
+
+    # --- 讀 ---
+    def snapshot(self):
+        with self._lock:
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self.counters.items())]
+            timings = [{"name": n, "labels": dict(l), "count": c, "sum": s, "max": m}
+                       for (n, l), (c, s, m) in sorted(self.timings.items())]
+        return {"started": self.started, "exported": time.time(), "counters": counters, "timings": timings}
+
+    def cache_rates(self):
+        """{cache: (requests, misses, hit_rate)}"""
+        with self._lock:
+            requests = {dict(l)["cache"]: v for (n, l), v in self.counters.items() if n == "cache_requests_total"}
+            misses = {dict(l)["cache"]: v for (n, l), v in self.counters.items() if n == "cache_misses_total"}
+        return {c: (r, misses.get(c, 0), 1 - misses.get(c, 0) / r if r else 0.0) for c, r in sorted(requests.items())}
+
+    def prometheus(self):
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+        # 同名 metric 嘅行要排埋一齊，TYPE 只出一次
+        groups = {}
+        for (name, labels), value in counters:
+            groups.setdefault((f"mj_{name}", "counter"), []).append(f"mj_{name}{_prom_labels(labels)} {value}")
+        for (name, labels), (count, total, longest) in timings:
+            metric, tags = f"mj_{name}", _prom_labels(labels)
+            groups.setdefault((metric, "summary"), []).extend(
+                [f"{metric}_count{tags} {count}", f"{metric}_sum{tags} {total:.6f}"])
+            groups.setdefault((f"{metric}_max", "gauge"), []).append(f"{metric}_max{tags} {longest:.6f}")
+        lines = []
+        for (metric, kind), rows in groups.items():
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.extend(rows)
+        return "\n".join(lines) + "\n"
+
+    # --- 匯出 ---
+    def export(self, root=METRICS_DIR, force=False):
+        """寫 `<root>/metrics.prom` 同 `metrics.json`；非 force 嘅話 EXPORT_INTERVAL 秒內最多寫一次"""
+        with self._export_lock:
+            now = time.monotonic()
+            if not force and now - self._exported < EXPORT_INTERVAL:
+                return False
+            self._exported = now
+            os.makedirs(root, exist_ok=True)
+            for name, body in (("metrics.prom", self.prometheus()),
+                               ("metrics.json", json.dumps(self.snapshot(), ensure_ascii=False))):
+                # 每次用獨立嘅暫存檔 (其他 process 可能同時匯出去同一個資料夾)
+                fd, tmp = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=root)
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        f.write(body)
+                    # mkstemp 係 0600；textfile collector 可能用另一個用戶讀
+                    os.chmod(tmp, 0o644)
+                    os.replace(tmp, os.path.join(root, name))
+                except BaseException:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                    raise
+        return True
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
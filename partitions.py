@@ -0,0 +1,149 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+import pandas as pd
+from master_cache import CACHE_DIR, concat_frames, data_version, prefix_matches, row_digest
+
+# 歷史紀錄按 年 / 月 分區存 Parquet：`<cache_dir>/history_<hash>/g<代>/YYYY/MM.parquet`
+# 每個分區已經按時間排好，明細表分頁時只讀需要嘅月份
+# 重建嗰陣寫去新一代資料夾，寫好先換 meta.json，上一代留低俾讀緊嘅 session / 報表 worker；
+# append 只寫涉及嘅月份，先寫暫存檔再 os.replace，讀嘅人唔會見到寫到一半 / 唔見咗嘅檔
+# (年度總分 / 對局天數 / 最大單局 由 aggregates.py 嘅物化統計表提供)
+
+PAGE_SIZE = 200
+
+
+class HistoryPartitions:
+    """
+    sync(frame) 跟 Master Record 同步 (只 append 嘅話只寫新行涉及嘅月份)，
+    page(n) 攞第 n 頁明細 (最新喺前)。
+    """
+
+    def __init__(self, players, cache_dir=CACHE_DIR):
+        self.players = list(players)
+        digest = hashlib.sha1(json.dumps(self.players).encode("utf-8")).hexdigest()[:12]
+        self.root = os.path.join(cache_dir, f"history_{digest}")
+        self.meta_path = os.path.join(self.root, "meta.json")
+        self._lock = threading.Lock()
+        self._meta = None
+
+    # --- meta：已同步行數 + 內容 digest / 版本 (核對用) + 第幾代資料夾 + 每月行數 ---
+    def meta(self):
+        if self._meta is None:
+            try:
+                with open(self.meta_path, encoding="utf-8") as f:
+                    self._meta = json.load(f)
+            except (OSError, ValueError):
+                self._meta = self._empty(0)
+        return self._meta
+
+    @staticmethod
+    def _empty(gen):
+        return {"rows": 0, "digest": "0", "version": None, "gen": gen, "months": {}}
+
+    def _write_meta(self, meta):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+        self._meta = meta
+
+    def _path(self, month, gen=None):
+        year, mm = month.split("-")
+        gen = self.meta().get("gen", 0) if gen is None else gen
+        return os.path.join(self.root, f"g{gen}", year, f"{mm}.parquet")
+
+    def month_paths(self, months):
+        """月份分區嘅 parquet 路徑 (同一份 meta，即同一代)；俾直接讀檔嘅 worker 用"""
+        gen = self.meta().get("gen", 0)
+        return [self._path(m, gen) for m in months]
+
+    def read_month(self, month, gen=None):
+        path = self._path(month, gen)
+        return pd.read_parquet(path) if os.path.exists(path) else pd.DataFrame()
+
+    def _write_month(self, month, part, gen):
+        path = self._path(month, gen)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+    def _drop_old(self, gen):
+        # 淨係留今代同上一代 (可能有人讀緊)；舊版 (冇分代) 嘅 YYYY 資料夾都喺呢度清走
+        keep = {f"g{gen}", f"g{gen - 1}", os.path.basename(self.meta_path)}
+        for name in os.listdir(self.root):
+            if name not in keep:
+                path = os.path.join(self.root, name)
+                shutil.rmtree(path, ignore_errors=True) if os.path.isdir(path) else os.remove(path)
+
+    # --- 同步 ---
+    def sync(self, frame):
+        """跟 Master Record 同步；返回寫咗幾多個月份分區"""
+        with self._lock:
+            meta = self.meta()
+            version = data_version(frame)
+            if meta["version"] == version:
+                return 0
+            n = meta["rows"]
+            rebuild = not (n and "gen" in meta and prefix_matches(frame, n, int(meta["digest"], 16), meta["version"]))
+            if rebuild:
+                # 舊數據改咗 (或者第一次)：喺新一代資料夾成個重建
+                meta = self._empty(meta.get("gen", 0) + 1)
+                digest, tail = row_digest(frame), frame
+            else:
+                meta = {**meta, "months": dict(meta["months"])}
+                digest = (int(meta["digest"], 16) + row_digest(frame.iloc[n:], n)) % 2 ** 64
+                tail = frame.iloc[n:]
+            gen = meta["gen"]
+            tail = tail[tail['Date'].notna()]
+            # 整數 YYYYMM 做分組 key，唔使逐行 strftime
+            keys = (tail['Date'].dt.year * 100 + tail['Date'].dt.month).to_numpy()
+            touched = []
+            for key, rows in tail.groupby(keys, sort=True):
+                month = f"{key // 100:04d}-{key % 100:02d}"
+                part = rows if rebuild else concat_frames([self.read_month(month, gen), rows])
+                part = part.sort_values("Date", kind="stable").reset_index(drop=True)
+                self._write_month(month, part, gen)
+                meta["months"][month] = len(part)
+                touched.append(month)
+            if len(tail):
+                last = max(pd.Timestamp(meta.get("last_date") or tail['Date'].max()), tail['Date'].max())
+                meta["last_date"] = last.isoformat()
+            meta.update(rows=len(frame), version=version, digest=f"{digest:016x}")
+            self._write_meta(meta)
+            if rebuild:
+                self._drop_old(gen)
+            return len(touched)
+
+    # --- 讀 ---
+    def total_rows(self):
+        return sum(self.meta()["months"].values())
+
+    def last_date(self):
+        last = self.meta().get("last_date")
+        return pd.Timestamp(last) if last else None
+
+    def frame(self):
+        """成個歷史 (同一代嘅全部月份分區，按時間排)；例如換規則重新計分要用全部行"""
+        meta = self.meta()
+        return concat_frames([self.read_month(m, meta["gen"]) for m in sorted(meta["months"])])
+
+    def page(self, page_no, page_size=PAGE_SIZE):
+        """第 page_no 頁 (0 起)，最新嘅喺前；只讀覆蓋呢一頁嘅月份分區"""
+        start = page_no * page_size
+        stop = start + page_size
+        frames, seen = [], 0
+        # 用同一份 meta：中途有 sync 換咗代都係讀緊同一代嘅檔
+        meta = self.meta()
+        for month in sorted(meta["months"], reverse=True):
+            count = meta["months"][month]
+            if seen + count > start:
+                part = self.read_month(month, meta["gen"]).iloc[::-1]
+                frames.append(part.iloc[max(start - seen, 0): stop - seen])
+            seen += count
+            if seen >= stop:
+                break
+        return concat_frames(frames)
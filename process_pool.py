@@ -0,0 +1,42 @@
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# 共用 process pool：Monte Carlo 大 run (simulation.py) 同報告渲染 (reports.py) 都用呢一個。
+# Streamlit server 係多 thread 嘅 process，fork 會將其他 thread 攞住嘅鎖、sqlite / gspread 連線一齊抄落 child，
+# 所以一律用 spawn (child 重新 import，只攞佢需要嘅 module)。
+# worker 死咗 (BrokenProcessPool) 就 discard 舊 pool (會 shutdown，唔會漏 process)，下次 get_pool 開新嘅；
+# 程式結束時 atexit 收埋。
+
+POOL_WORKERS = int(os.environ.get("MJ_POOL_WORKERS", os.cpu_count() or 1))
+
+_pool = None
+_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def discard(pool):
+    """pool 壞咗 (BrokenProcessPool)：仲係共用嗰個就換走，然後 shutdown 佢"""
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@atexit.register
+def shutdown():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,216 @@
+import os
+import json
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from master_cache import (CACHE_DIR, data_version, frame_cache_dir, frame_source, prefix_matches, row_digest,
+                          seated_mask)
+from metrics import get_metrics
+
+# 實力評分 (Glicko-1)：每局四個玩家兩兩比較嗰局嘅得失 (高分嘅贏、同分打和)，唔理分數大細，
+# 所以運氣大牌唔會一局拉高評分，長期贏人先會升。每個玩家有評分 r 同不確定度 RD。
+# 每局人人都同其他三家比一次，場數一樣，評分唔會因為贏家「場數多啲」而整體漂移；
+# 輪流上枱嘅枱 (有 Seats 欄) 冇落枱嘅人嗰局唔計。
+# Glicko 本身係按「評分期」更新：同一期入面所有對局都用期初嘅評分計，呢度一日 = 一期，
+# 所以一期只需要 (players × players) 同枱局數 + 勝場兩個矩陣，成個歷史回填逐期做幾個細矩陣運算。
+# 已完結嘅日子寫入 checkpoint；最後一日 (可能仲有新局) 每次即場計，成本 O(新局數 + 今日局數)。
+
+R0 = 1500.0
+RD0 = 350.0
+# 每期不確定度回升 (冇打都會慢慢變唔肯定)
+RD_DRIFT = 35.0
+Q = math.log(10) / 400
+
+
+def _g(rd):
+    return 1 / np.sqrt(1 + 3 * Q ** 2 * rd ** 2 / math.pi ** 2)
+
+
+def rate_period(r, rd, hands, wins):
+    """
+    一個評分期 (Glicko-1)：hands[i, j] = i 同 j 同枱嘅局數 (固定四人枱可以係一個數)，
+    wins[i, j] = i 贏 j 嘅場數 (打和當半場)，全部用期初 r / rd。
+    返回新嘅 (r, rd)；冇局嘅話只係 rd 回升。
+    """
+    rd = np.minimum(np.sqrt(rd ** 2 + RD_DRIFT ** 2), RD0)
+    if not np.any(hands):
+        return r, rd
+    g = _g(rd)[None, :]
+    e = 1 / (1 + 10 ** (-g * (r[:, None] - r[None, :]) / 400))
+    off = 1 - np.eye(len(r))
+    v_inv = Q ** 2 * (off * hands * g ** 2 * e * (1 - e)).sum(axis=1)
+    score = (off * g * (wins - hands * e)).sum(axis=1)
+    denom = 1 / rd ** 2 + v_inv
+    return r + Q / denom * score, np.sqrt(1 / denom)
+
+
+def valid_hands(df, players):
+    """有贏家嘅局先計 (打錯 / 空白行唔當成四家打和)"""
+    return pd.Categorical(df['Winner'], categories=list(players)).codes >= 0
+
+
+def _periods(df):
+    # 連續同一日嘅行 = 一期；返回每期嘅 (開始行, 日期)
+    day = df['Date'].dt.normalize().to_numpy()
+    if len(day) == 0:
+        return np.array([], dtype='int64'), day
+    starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+    return starts, day[starts]
+
+
+def run_periods(r, rd, df, players):
+    """由 (r, rd) 開始逐期更新 df 嘅所有局；返回最終 (r, rd) 同每期之後嘅 (日期, r, rd) 軌跡"""
+    players = list(players)
+    starts, days = _periods(df)
+    p = len(players)
+    traj_r, traj_rd = np.empty((len(starts), p)), np.empty((len(starts), p))
+    if len(starts) == 0:
+        return r, rd, days, traj_r, traj_rd
+    # 每局兩兩比較 (贏 2 / 和 1 / 輸 0，用 int8 慳記憶體)，再按期 reduceat 加總；
+    # 輪流上枱嘅枱只比較同一局都有落枱嘅兩個人
+    x = df[players].to_numpy()
+    seated = seated_mask(df, players) & valid_hands(df, players)[:, None]
+    pair = (seated[:, :, None] & seated[:, None, :]).astype('int8')
+    d = x[:, :, None] - x[:, None, :]
+    outcome = (2 * (d > 0) + (d == 0)).astype('int8') * pair
+    wins = np.add.reduceat(outcome, starts, axis=0, dtype='int64') / 2
+    hands = np.add.reduceat(pair, starts, axis=0, dtype='int64')
+    for k in range(len(starts)):
+        r, rd = rate_period(r, rd, hands[k], wins[k])
+        traj_r[k], traj_rd[k] = r, rd
+    return r, rd, days, traj_r, traj_rd
+
+
+class RatingState:
+    """已完結評分期嘅 checkpoint：rows 行之前嘅日子已經計入 r / rd，軌跡每期一點"""
+
+    def __init__(self, players):
+        p = len(players)
+        self.players = list(players)
+        self.rows = 0
+        # 頭 rows 行當時嘅數據版本 + 內容 digest：用嚟知道已計入嘅局有冇被改過
+        self.version = None
+        self.digest = 0
+        self.r = np.full(p, R0)
+        self.rd = np.full(p, RD0)
+        self.days = np.array([], dtype='datetime64[ns]')
+        self.traj_r = np.zeros((0, p))
+        self.traj_rd = np.zeros((0, p))
+
+    def advance(self, df):
+        """處理 df 入面所有完整嘅日子 (最後一日留返俾 current)；返回處理咗幾多行"""
+        starts, _ = _periods(df)
+        if len(starts) < 2:
+            return 0
+        closed = df.iloc[:starts[-1]]
+        self.digest = (self.digest + row_digest(closed, self.rows)) % 2 ** 64
+        self.r, self.rd, days, tr, trd = run_periods(self.r, self.rd, closed, self.players)
+        self.days = np.concatenate([self.days, days])
+        self.traj_r = np.vstack([self.traj_r, tr])
+        self.traj_rd = np.vstack([self.traj_rd, trd])
+        self.rows += len(closed)
+        return len(closed)
+
+    def current(self, open_df):
+        """加埋未完結嗰日 (唔寫入 checkpoint)：返回 (summary, 評分軌跡, RD 軌跡) 三個 DataFrame"""
+        r, rd, days, tr, trd = run_periods(self.r, self.rd, open_df, self.players)
+        days = np.concatenate([self.days, days])
+        summary = pd.DataFrame({"rating": r, "rd": rd, "low": r - 2 * rd, "high": r + 2 * rd}, index=self.players)
+        index = pd.DatetimeIndex(days, name="Date")
+        trajectory = pd.DataFrame(np.vstack([self.traj_r, tr]), index=index, columns=self.players)
+        rd_trajectory = pd.DataFrame(np.vstack([self.traj_rd, trd]), index=index, columns=self.players)
+        return summary, trajectory, rd_trajectory
+
+    # 持久化：純量 JSON，軌跡 npz (幾萬日都唔大)。兩個檔分開 os.replace，中間 crash 會新舊混埋，
+    # 所以 npz 都記低 rows / digest，讀返嚟對唔上就當壞咗
+    def save(self, path):
+        meta = {"players": self.players, "rows": self.rows, "version": self.version, "digest": f"{self.digest:016x}",
+                "r": self.r.tolist(), "rd": self.rd.tolist()}
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        with open(tmp + ".npz", "wb") as f:
+            np.savez(f, days=self.days.astype('int64'), r=self.traj_r, rd=self.traj_rd,
+                     rows=self.rows, digest=np.uint64(self.digest))
+        os.replace(tmp + ".npz", path[:-len(".json")] + ".npz")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            meta = json.load(f)
+        state = cls(meta["players"])
+        state.rows, state.version, state.digest = meta["rows"], meta["version"], int(meta["digest"], 16)
+        state.r, state.rd = np.array(meta["r"]), np.array(meta["rd"])
+        with np.load(path[:-len(".json")] + ".npz") as z:
+            state.days = z["days"].astype('datetime64[ns]')
+            state.traj_r, state.traj_rd = z["r"], z["rd"]
+            rows, digest = int(z["rows"]), int(z["digest"])
+        if len(state.days) != len(state.traj_r) or rows != state.rows or digest != state.digest:
+            raise ValueError("rating checkpoint out of step")
+        return state
+
+
+_states = {}
+_states_lock = threading.Lock()
+# 每個 checkpoint 一把鎖：唔同枱嘅評分可以同時追
+_path_locks = {}
+
+
+def _path_lock(path):
+    with _states_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+def sync_ratings(df, players, cache_dir=CACHE_DIR):
+    """
+    將評分 checkpoint 追到 df 最新嘅完整日子，返回 (summary, 評分軌跡, RD 軌跡) (包埋未完結嗰日)。
+    已計入嘅局內容同 df 對唔上 (數據被改過) 就由頭回填。
+    """
+    players = list(players)
+    df = df[df['Date'].notna()]
+    digest = hashlib.sha1(json.dumps([frame_source(df), players]).encode("utf-8")).hexdigest()[:12]
+    path = os.path.join(cache_dir, f"ratings_{digest}.json")
+    with _path_lock(path):
+        state = _states.get(path)
+        if state is None and os.path.exists(path):
+            try:
+                state = RatingState.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Rating checkpoint unreadable, rebuilding: {e}")
+        if state is None or not prefix_matches(df, state.rows, state.digest, state.version):
+            state = RatingState(players)
+        version = data_version(df)
+        if state.advance(df.iloc[state.rows:]) or state.version != version:
+            state.version = version
+            os.makedirs(cache_dir, exist_ok=True)
+            state.save(path)
+        _states[path] = state
+        return state.current(df.iloc[state.rows:])
+
+
+# --- 按數據版本快取 ---
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+MEMO_SIZE = 8
+
+
+def get_ratings(df, players):
+    key = (data_version(df), tuple(players))
+    with _memo_lock:
+        cached = _memo.get(key)
+        if cached is not None:
+            _memo.move_to_end(key)
+    get_metrics().cache("ratings", cached is not None)
+    if cached is not None:
+        return cached
+    with get_metrics().timer("indicator_seconds", stage="ratings"):
+        result = sync_ratings(df, players, frame_cache_dir(df))
+    with _memo_lock:
+        _memo[key] = result
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return result
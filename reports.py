@@ -0,0 +1,250 @@
+import os
+import io
+import glob
+import json
+import hashlib
+import time
+import threading
+from functools import partial
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from indicators import chart_series, compute_series, score_matrix
+from master_cache import concat_frames
+from metrics import get_metrics
+from process_pool import discard, get_pool
+
+# 期間報告匯出 (PNG / PDF)：資本曲線 + SMA5、每局損益分布、滾動 Sharpe、年度 / 月度總結表。
+# matplotlib 畫圖好食 CPU，所以喺共用 process pool (見 process_pool.py) 度畫 (唔會阻住 Streamlit 其他 session 嘅 GIL)；
+# worker 直接讀 HistoryPartitions 嘅月份 parquet，唔使將成個 DataFrame pickle 過去。
+# 輸出檔按 期間 + 期間數據版本 存喺磁碟，重複下載直接讀檔；
+# 期間版本只睇涉及嘅月份分區，所以加咗新局之後舊年份嘅報告仍然有效。
+
+FORMATS = ("png", "pdf")
+ALL = "全部"
+# 報告入面每條線最多幾多點 (同 dashboard 一樣降採樣，大歷史都畫得快)
+REPORT_POINTS = 3000
+
+
+def periods(history):
+    """可揀嘅期間：全部、每年 (YYYY)、每月 (YYYY-MM)，新嘅喺前"""
+    months = sorted(history.meta()["months"], reverse=True)
+    years = sorted({m[:4] for m in months}, reverse=True)
+    return [ALL] + years + months if months else []
+
+
+def period_months(history, period):
+    return sorted(m for m in history.meta()["months"] if period == ALL or m.startswith(period))
+
+
+def period_version(history, months):
+    """期間數據版本：每個月份分區嘅行數 + 修改時間 (sync 只會重寫有新行嘅月份)"""
+    parts = []
+    counts = history.meta()["months"]
+    for month, path in zip(months, history.month_paths(months)):
+        stat = os.stat(path) if os.path.exists(path) else None
+        parts.append([month, counts[month], stat and stat.st_mtime_ns])
+    return hashlib.sha1(json.dumps(parts).encode("utf-8")).hexdigest()[:12]
+
+
+def report_dir(history):
+    return os.path.join(os.path.dirname(history.root), "reports", os.path.basename(history.root))
+
+
+def report_path(history, period, fmt):
+    version = period_version(history, period_months(history, period))
+    name = "all" if period == ALL else period
+    return os.path.join(report_dir(history), f"{name}_{version}.{fmt}")
+
+
+# --- 畫圖 (喺 worker process 度行) ---
+
+def _summary_table(df, players, period):
+    # 全部 / 年：按年總結；單一年：按月；單一月：按日
+    if period == ALL:
+        key, label = df['Date'].dt.year.astype(str), "Year"
+    elif len(period) == 4:
+        key, label = df['Date'].dt.strftime("%Y-%m"), "Month"
+    else:
+        key, label = df['Date'].dt.strftime("%m-%d"), "Day"
+    table = df.groupby(key)[players].sum()
+    table["Hands"] = df.groupby(key).size()
+    if label != "Day":
+        table["Days"] = df['Date'].dt.normalize().groupby(key).nunique()
+    return table.rename_axis(label)
+
+
+def _draw_equity(fig, charts, players):
+    ax = fig.subplots()
+    # x 軸用返原本嘅局數 (降採樣後 index 唔連續)
+    x = charts["equity"].index.to_numpy()
+    for p in players:
+        line, = ax.plot(x, charts["equity"][p].to_numpy(), lw=1.2, label=p)
+        ax.plot(x, charts["sma5"][p].to_numpy(), lw=0.6, ls="--", color=line.get_color())
+    ax.axhline(0, color="grey", lw=0.5)
+    ax.set_title("Equity (solid) / SMA5 (dashed)")
+    ax.set_xlabel("Hand")
+    ax.legend(loc="upper left", fontsize=8)
+
+
+def _draw_distribution(fig, series, players):
+    axes = fig.subplots(1, len(players), sharey=True)
+    dist = series["dist"]
+    for ax, p in zip(np.atleast_1d(axes), players):
+        ax.bar(range(len(dist)), dist[p].to_numpy(), color="#2E86C1")
+        ax.set_xticks(range(len(dist)), list(dist.index), fontsize=6, rotation=45)
+        ax.set_title(p, fontsize=9)
+    fig.suptitle("Score per hand")
+
+
+def _draw_sharpe(fig, charts, players):
+    ax = fig.subplots()
+    sharpe = charts["rolling_sharpe"]
+    for p in players:
+        ax.plot(sharpe.index.to_numpy(), sharpe[p].to_numpy(), lw=1, label=p)
+    ax.axhline(0, color="grey", lw=0.5)
+    ax.set_title("Rolling Sharpe")
+    ax.legend(loc="upper left", fontsize=8)
+
+
+def _draw_table(fig, table):
+    ax = fig.subplots()
+    ax.axis("off")
+    # 太多行 (例如全部期間按日) 唔會出現：ALL 按年、年按月、月按日
+    cells = [[f"{v:,.0f}" for v in row] for row in table.to_numpy()]
+    t = ax.table(cellText=cells, rowLabels=list(table.index), colLabels=list(table.columns), loc="center")
+    t.auto_set_font_size(False)
+    t.set_fontsize(8)
+    ax.set_title(f"Totals by {table.index.name.lower()}")
+
+
+def render(paths, players, period, fmt, out):
+    """
+    讀 paths 嘅月份分區，畫成報告寫去 out (先寫 tmp 再 rename)；同一期間舊版本嘅檔案會刪走。
+    喺 worker process 入面行，返回 (out, 局數)。
+    """
+    from matplotlib.figure import Figure
+
+    players = list(players)
+    df = concat_frames([pd.read_parquet(p) for p in paths])
+    df = df.sort_values("Date", kind="stable").reset_index(drop=True)
+    x = score_matrix(df, players)
+    series = compute_series(df, players, x)
+    charts = chart_series(series, REPORT_POINTS)
+    table = _summary_table(df, players, period)
+    title = f"Mahjong report: {period if period != ALL else 'all time'} ({len(df):,} hands)"
+    pages = [(_draw_equity, (charts, players)), (_draw_distribution, (series, players)),
+             (_draw_sharpe, (charts, players)), (_draw_table, (table,))]
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    buf = io.BytesIO()
+    if fmt == "pdf":
+        # PDF：每部分一頁
+        from matplotlib.backends.backend_pdf import PdfPages
+        with PdfPages(buf) as pdf:
+            for draw, args in pages:
+                fig = Figure(figsize=(11, 6))
+                draw(fig, *args)
+                fig.text(0.01, 0.99, title, va="top", fontsize=8, color="grey")
+                pdf.savefig(fig)
+    else:
+        # PNG：一張長圖
+        fig = Figure(figsize=(11, 6 * len(pages)), layout="constrained")
+        fig.suptitle(title)
+        for sub, (draw, args) in zip(fig.subfigures(len(pages), 1), pages):
+            draw(sub, *args)
+        fig.savefig(buf, format="png", dpi=100)
+    tmp = out + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(buf.getvalue())
+    os.replace(tmp, out)
+    prefix = os.path.basename(out).rsplit("_", 1)[0]
+    for old in glob.glob(os.path.join(os.path.dirname(out), f"{prefix}_*.{fmt}")):
+        if old != out:
+            os.remove(old)
+    return out, len(df)
+
+
+# --- 背景渲染 + 磁碟快取 ---
+# 每個 (輸出檔) 只排一次；結果就係磁碟上面嗰個檔，所以唔使記憶體 memo。
+# 畫失敗 (包括 worker 死咗) 就按輸出檔記低錯誤，唔會自動重新排隊，要用家撳「重試」
+
+_pending = {}
+_failed = {}
+_lock = threading.Lock()
+
+
+def _done(out, fmt, started, pool, future):
+    error = None
+    try:
+        future.result()
+        get_metrics().observe("report_seconds", time.perf_counter() - started, fmt=fmt)
+    except BrokenProcessPool as e:
+        # worker 死咗 (例如被 OOM kill)：換走呢個 pool (會 shutdown 舊嘅)，下次開新嘅
+        error = f"report worker died: {e}"
+        discard(pool)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    if error is not None:
+        get_metrics().count("report_errors_total")
+        print(f"Report rendering failed: {error}")
+    with _lock:
+        if error is not None:
+            _failed[out] = error
+        _pending.pop(out, None)
+
+
+def cached_report(history, period, fmt="png"):
+    """已經畫好嘅報告路徑 (唔會排隊畫)；冇就返回 None"""
+    out = report_path(history, period, fmt) if period_months(history, period) else None
+    return out if out and os.path.exists(out) else None
+
+
+def get_report(history, players, period, fmt="png", block=False, retry=False):
+    """
+    返回報告檔案路徑；未有嘅話喺 process pool 排隊畫 (block=False 返回 None，之後再問)。
+    之前畫失敗過 (見 report_error) 就返回 None 唔再排隊，除非 retry=True。
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown report format {fmt!r}")
+    months = period_months(history, period)
+    if not months:
+        raise ValueError(f"no data for period {period!r}")
+    out = report_path(history, period, fmt)
+    ready = os.path.exists(out)
+    with _lock:
+        if retry:
+            _failed.pop(out, None)
+        future = _pending.get(out)
+        failed = out in _failed
+        started = not ready and future is None and not failed
+        if started:
+            pool = get_pool()
+            future = pool.submit(render, history.month_paths(months), tuple(players), period, fmt, out)
+            _pending[out] = future
+            future.add_done_callback(partial(_done, out, fmt, time.perf_counter(), pool))
+    if ready or started:
+        get_metrics().cache("report", ready)
+    if ready:
+        return out
+    if failed:
+        if block:
+            raise RuntimeError(_failed.get(out, "report rendering failed"))
+        return None
+    if block:
+        future.result()
+        return out
+    return None
+
+
+def is_pending(history, period, fmt="png"):
+    with _lock:
+        return report_path(history, period, fmt) in _pending
+
+
+def report_error(history, period, fmt="png"):
+    """呢個期間 + 數據版本嘅報告畫失敗咗就返回錯誤訊息 (否則 None)"""
+    if not period_months(history, period):
+        return None
+    with _lock:
+        return _failed.get(report_path(history, period, fmt))
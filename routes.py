@@ -0,0 +1,21 @@
+import importlib
+
+# 頁面路由表：每個頁面宣告自己嘅 view 模組同所需數據，
+# app.py 只會 import 同載入當前頁面需要嘅嘢 (例如計分頁唔會觸發 Master Record 讀取)
+#   needs: "master" = 需要 df_master 做第一個參數
+#          "history" = 需要按年 / 月分區嘅歷史 (partitions.HistoryPartitions)
+
+PAGES = {
+    "📊 總體概況": {"module": "views.dashboard", "func": "show_dashboard", "needs": ["master"]},
+    "🧮 快速計分": {"module": "views.calculator", "func": "show_calculator", "needs": []},
+    "🔍 今日戰局復盤": {"module": "views.daily_analysis", "func": "show_daily_analysis", "needs": []},
+    "🧠 專業量化分析": {"module": "views.pro_analysis", "func": "show_pro_analysis", "needs": ["master"]},
+    "📜 歷史紀錄": {"module": "views.history", "func": "show_history", "needs": ["history"]},
+}
+DEFAULT_PAGE = "📊 總體概況"
+
+
+def load_view(page):
+    """延遲 import 頁面模組，返回 show_xxx function"""
+    spec = PAGES[page]
+    return getattr(importlib.import_module(spec["module"]), spec["func"])
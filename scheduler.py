@@ -0,0 +1,145 @@
+import time
+import random
+import threading
+from collections import Counter
+from metrics import get_metrics
+
+# 全 process 共用嘅 Google API 請求排程：
+# 1. Token bucket 控制速率 (Sheets 配額大約每分鐘 60 個請求 / 用戶)
+# 2. 相同嘅讀取同時發生就合併成一個請求 (singleflight)
+# 3. 429 用 jittered exponential backoff 重試
+# 4. 寫入優先：讀取唔可以用埋留俾寫入嘅 token，亦要等排緊隊嘅寫入先
+
+PRIORITY = {"write": 0, "read": 1, "analytics": 2}
+
+
+def is_rate_limited(e):
+    """gspread APIError / urllib HTTPError / requests HTTPError：只睇 HTTP 狀態碼 (訊息入面有 429 唔算)"""
+    for code in (getattr(e, "code", None), getattr(e, "status_code", None),
+                 getattr(getattr(e, "response", None), "status_code", None)):
+        try:
+            if code is not None and int(code) == 429:
+                return True
+        except (TypeError, ValueError):
+            pass
+    return False
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Scheduler:
+    def __init__(self, rate_per_min=60, burst=10, write_reserve=2,
+                 max_retries=5, base_delay=1.0, max_delay=32.0):
+        self.rate = rate_per_min / 60.0
+        self.burst = burst
+        self.write_reserve = write_reserve
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._waiting = Counter()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self.stats = Counter()
+
+    # --- token bucket ---
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def _acquire(self, kind, cost=1):
+        prio = PRIORITY[kind]
+        floor = cost if kind == "write" else min(cost + self.write_reserve, self.burst)
+        with self._cond:
+            self._waiting[prio] += 1
+            try:
+                while True:
+                    self._refill()
+                    ahead = any(self._waiting[p] for p in range(prio))
+                    if not ahead and self._tokens >= floor:
+                        self._tokens -= cost
+                        return
+                    wait = max((floor - self._tokens) / self.rate, 0.01)
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._waiting[prio] -= 1
+                self._cond.notify_all()
+
+    # --- 重試 ---
+    def _run(self, fn, args, kwargs, kind, op=None, cost=1):
+        op = op or getattr(fn, "__name__", "call")
+        for attempt in range(self.max_retries + 1):
+            self._acquire(kind, cost)
+            self.stats[f"calls_{kind}"] += cost
+            get_metrics().count("api_calls_total", cost, op=op, kind=kind)
+            try:
+                with get_metrics().timer("api_seconds", op=op):
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                self.stats["rate_limited"] += 1
+                get_metrics().count("api_429_total", op=op)
+                # full jitter：0 至 base * 2^attempt 之間隨機等
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def call(self, fn, *args, kind="read", key=None, op=None, cost=1, **kwargs):
+        """
+        經排程執行 fn(*args, **kwargs)。
+        讀取帶 key 嘅話，同一 key 嘅並發請求只會真正發一次，其餘等同一個結果。
+        op 係統計用嘅請求名 (預設 fn.__name__)；cost 係 fn 入面連續發幾多個 API 請求 (一次過攞晒 token)。
+        """
+        if kind == "write" or key is None:
+            return self._run(fn, args, kwargs, kind, op, cost)
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            self.stats["coalesced"] += 1
+            get_metrics().count("api_coalesced_total", op=op or getattr(fn, "__name__", "call"))
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._run(fn, args, kwargs, kind, op)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
+
+
+def set_scheduler(scheduler):
+    """換走全域 scheduler (benchmark / 離線模式用)"""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+# 統一計分引擎：番數表 + 出統 / 自摸 / 包自摸 嘅分錢規則由 ruleset 定義
+# 單局 (計分頁) 同批量 (成個 Master Record 重新計分) 用同一套規則
+
+METHODS = ["出統", "自摸", "包自摸"]
+
+RULESETS = {
+    # 舊表 (utils.get_base_money)
+    "classic": {
+        "fan_money": {3: 8, 4: 16, 5: 48, 6: 64, 7: 96, 8: 128, 9: 192, 10: 256},
+        "over_cap": 256,      # 超過最大番數嘅底錢
+        "zimo_share": 0.5,    # 自摸：每家付底錢嘅一半
+    },
+    # 現行計分頁用緊嘅表
+    "current": {
+        "fan_money": {3: 16, 4: 32, 5: 48, 6: 64, 7: 96, 8: 128, 9: 192, 10: 256},
+        "over_cap": 256,
+        "zimo_share": 0.5,
+    },
+}
+DEFAULT_RULESET = "current"
+
+
+def _rules(ruleset):
+    return RULESETS[ruleset] if isinstance(ruleset, str) else ruleset
+
+
+def base_money(fan, ruleset=DEFAULT_RULESET):
+    rules = _rules(ruleset)
+    fan_map = rules["fan_money"]
+    return fan_map.get(fan, rules["over_cap"] if fan > max(fan_map) else 0)
+
+
+def money_table(ruleset=DEFAULT_RULESET, max_fan=64):
+    """番數 → 底錢嘅查表陣列 (index = 番數)，超過 max_fan 嘅用 over_cap"""
+    return np.array([base_money(f, ruleset) for f in range(max_fan + 1)], dtype='float64')
+
+
+def score_hand(winner, loser, method, fan, players, ruleset=DEFAULT_RULESET):
+    """計一局：返回 {玩家: 得失}"""
+    rules = _rules(ruleset)
+    base = base_money(fan, rules)
+    res = {p: 0 for p in players}
+    if method == "出統":
+        res[winner], res[loser] = int(base), int(-base)
+    elif method == "自摸":
+        each_pay = base * rules["zimo_share"]
+        res[winner] = int(each_pay * (len(players) - 1))
+        for p in players:
+            if p != winner: res[p] = int(-each_pay)
+    elif method == "包自摸":
+        total_pay = base * rules["zimo_share"] * (len(players) - 1)
+        res[winner], res[loser] = int(total_pay), int(-total_pay)
+    return res
+
+
+def score_hands(winner, loser, method, fan, n_players, ruleset=DEFAULT_RULESET, seated=None):
+    """
+    向量化批量計分。winner / loser 係玩家 index (-1 代表冇)，method 係 METHODS 嘅 index，
+    返回 hands × players 嘅 int64 矩陣；同 score_hand 逐局計嘅結果一樣。
+    seated (hands × players 布林，見 master_cache.seated_mask)：輪流上枱嘅枱每局只有落枱嘅人分錢。
+    """
+    rules = _rules(ruleset)
+    winner = np.asarray(winner, dtype='int64')
+    loser = np.asarray(loser, dtype='int64')
+    method = np.asarray(method, dtype='int64')
+    fan = np.nan_to_num(np.asarray(fan, dtype='float64')).astype('int64')
+    n = len(winner)
+
+    table = money_table(rules, max(int(fan.max(initial=0)), max(rules["fan_money"])) + 1)
+    base = table[np.clip(fan, 0, len(table) - 1)]
+    each = base * rules["zimo_share"]
+    seats = n_players if seated is None else seated.sum(axis=1)
+    win_amt = np.select([method == 0, method == 1, method == 2],
+                        [base, each * (seats - 1), each * (seats - 1)], 0)
+    lose_amt = np.select([method == 0, method == 2], [base, each * (seats - 1)], 0)
+
+    out = np.zeros((n, n_players), dtype='float64')
+    rows = np.arange(n)
+    zimo = (method == 1) & (winner >= 0)
+    out[zimo] = -each[zimo, None] if seated is None else -each[zimo, None] * seated[zimo]
+    has_loser = (loser >= 0) & (winner >= 0) & (lose_amt > 0)
+    out[rows[has_loser], loser[has_loser]] = -lose_amt[has_loser]
+    has_winner = winner >= 0
+    out[rows[has_winner], winner[has_winner]] = win_amt[has_winner]
+    return np.trunc(out).astype('int64')
+
+
+def encode_hands(df, players):
+    """Winner / Loser / Method 文字欄 → index 陣列 (搵唔到係 -1)"""
+    players = list(players)
+    codes = lambda col, cats: pd.Categorical(df[col], categories=cats).codes.astype('int64')
+    return (codes("Winner", players), codes("Loser", players),
+            codes("Method", METHODS), pd.to_numeric(df["Fan"], errors='coerce').fillna(0).to_numpy())
+
+
+def _seated(df, players):
+    # master_cache 要 import 呢個 module (METHODS)，所以喺度先 import
+    from master_cache import SEATS_COL, seated_mask
+    return seated_mask(df, players) if SEATS_COL in df.columns else None
+
+
+def rescore(df, players, ruleset=DEFAULT_RULESET, encoded=None):
+    """用另一套規則重新計成個歷史；識別唔到嘅行 (冇 Winner / Method) 保留原分數"""
+    players = list(players)
+    winner, loser, method, fan = encode_hands(df, players) if encoded is None else encoded
+    scores = score_hands(winner, loser, method, fan, len(players), ruleset, _seated(df, players))
+    valid = (winner >= 0) & (method >= 0)
+    original = df[players].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype='float64')
+    return np.where(valid[:, None], scores, original)
+
+
+def rescore_totals(encoded, n_players, ruleset=DEFAULT_RULESET, seated=None):
+    """
+    只要每位玩家總分嘅話唔使砌成個矩陣：用 bincount 一個 pass 加總。
+    seated 同 score_hands 一樣：輪流上枱嘅枱自摸只係落枱嗰幾家付錢。
+    """
+    winner, loser, method, fan = (np.asarray(a) for a in encoded)
+    ok = (winner >= 0) & (method >= 0)
+    winner, loser, method = winner[ok], loser[ok], method[ok]
+    seated = None if seated is None else np.asarray(seated, dtype=bool)[ok]
+    seats = n_players if seated is None else seated.sum(axis=1)
+    fan = np.nan_to_num(np.asarray(fan, dtype='float64')[ok]).astype('int64')
+    rules = _rules(ruleset)
+    table = money_table(rules, max(int(fan.max(initial=0)), max(rules["fan_money"])) + 1)
+    base = np.trunc(table[fan])
+    each = np.trunc(base * rules["zimo_share"])
+    group = np.trunc(base * rules["zimo_share"] * (seats - 1))
+    zimo = method == 1
+    win_amt = np.where(method == 0, base, np.where(zimo, np.trunc(each * (seats - 1)), group))
+    lose_amt = np.where(method == 0, base, np.where(method == 2, group, 0))
+    has_loser = (loser >= 0) & (lose_amt > 0)
+    totals = np.bincount(winner, weights=win_amt, minlength=n_players)
+    totals -= np.bincount(loser[has_loser], weights=lose_amt[has_loser], minlength=n_players)
+    # 自摸：贏家以外 (有落枱) 嘅每家付 each
+    zimo_each = each[zimo].sum() if seated is None else each[zimo] @ seated[zimo]
+    totals -= zimo_each - np.bincount(winner[zimo], weights=each[zimo], minlength=n_players)
+    return totals, ok
+
+
+def compare_rulesets(df, players, rulesets=("classic", "current")):
+    """「如果轉咗規則」：各規則下每位玩家嘅總分 (players × rulesets)；文字欄只編碼一次"""
+    players = list(players)
+    encoded = encode_hands(df, players)
+    seated = _seated(df, players)
+    out = {}
+    for r in rulesets:
+        totals, ok = rescore_totals(encoded, len(players), r, seated)
+        if not ok.all():
+            # 識別唔到嘅行保留原分數
+            totals = totals + df.loc[~ok, players].apply(pd.to_numeric, errors='coerce').fillna(0).sum().to_numpy()
+        out[r] = totals
+    return pd.DataFrame(out, index=players)
@@ -0,0 +1,262 @@
+import re
+import time
+import uuid
+import threading
+from scheduler import get_scheduler
+
+# 每日分頁 (YYYY-MM-DD) 嘅單行操作
+# 每局只 append 一行，唔再成張表讀落嚟再成張寫返上去
+
+HAND_ID_COL = "HandID"
+
+def daily_header(players):
+    return ["Date"] + list(players) + ["Winner", "Loser", "Method", "Fan", "Remark", HAND_ID_COL]
+
+def new_hand_id():
+    return uuid.uuid4().hex[:12]
+
+
+class AppendConflict(Exception):
+    """append 之後讀返嘅行唔係自己嗰行 (被其他裝置搶先寫入)"""
+
+
+class StaleRowError(Exception):
+    """要改 / 刪嘅行已經唔係預期內容 (被其他裝置改咗或者刪咗)"""
+
+
+def _same(a, b):
+    # Sheet 讀返嚟係格式化字串，本地係 float / int，數字就用數值比較
+    blank_a = a is None or str(a).strip() in ("", "nan")
+    blank_b = b is None or str(b).strip() in ("", "nan")
+    if blank_a or blank_b:
+        return blank_a and blank_b
+    try:
+        return float(a) == float(b)
+    except (TypeError, ValueError):
+        return str(a).strip() == str(b).strip()
+
+
+def entered_values(header, values, players):
+    """
+    USER_ENTERED 寫入用：Date / 分數 / 番數照原樣俾 Sheets 解析 (變返時間同數字，同舊分頁一致)，
+    其他文字欄 (HandID、備註等) 前面加 ' 當純文字，唔會被當成數字、日期或者公式。
+    """
+    typed = {"Date", "Fan", *players}
+    return [v if col in typed or not isinstance(v, str) or not v else "'" + v
+            for col, v in zip(header, values)]
+
+
+def _row_from_range(a1_range):
+    # 'Sheet1!A12:K12' -> 12
+    m = re.search(r"![A-Z]+(\d+)", a1_range) or re.search(r"^[A-Z]+(\d+)", a1_range)
+    return int(m.group(1))
+
+
+class HandSheet:
+    """
+    包住一個 gspread Worksheet。
+    Header 只喺第一次用嘅時候讀一次 (一行)，之後每局只有一個 append 請求。
+    """
+
+    def __init__(self, ws, players):
+        self.ws = ws
+        self.players = list(players)
+        self._header = None
+
+    # 所有 API 請求都經 scheduler (限速、合併讀取、429 重試)
+    def _read(self, fn, *args):
+        return get_scheduler().call(fn, *args, kind="read", key=(self.ws.title, fn.__name__, args))
+
+    def _write(self, fn, *args, **kwargs):
+        return get_scheduler().call(fn, *args, kind="write", **kwargs)
+
+    def header(self):
+        if self._header is None:
+            header = self._read(self.ws.row_values, 1)
+            if not header:
+                header = daily_header(self.players)
+                self._write(self.ws.append_row, header, table_range="A1")
+            elif HAND_ID_COL not in header:
+                # 舊分頁冇 HandID 欄：補一格 header 就夠，舊行留空
+                self._write(self.ws.update_cell, 1, len(header) + 1, HAND_ID_COL)
+                header = header + [HAND_ID_COL]
+            self._header = header
+        return self._header
+
+    def append(self, entry):
+        """
+        原子地 append 一局，返回 (hand_id, 行號)。
+        Sheets 嘅 values.append 由伺服器決定落邊行，兩部手機同時交都唔會互相覆蓋；
+        我哋再用 HandID 核對返回嘅行，確保寫入嘅係自己嗰行。
+        """
+        header = self.header()
+        entry = dict(entry)
+        hand_id = entry.setdefault(HAND_ID_COL, new_hand_id())
+        values = entered_values(header, [entry.get(col, "") for col in header], self.players)
+        resp = self._write(
+            self.ws.append_row,
+            values,
+            value_input_option="USER_ENTERED",
+            insert_data_option="INSERT_ROWS",
+            table_range="A1",
+            include_values_in_response=True,
+        )
+        updates = resp.get("updates", {})
+        written = updates.get("updatedData", {}).get("values", [[]])[0]
+        id_idx = header.index(HAND_ID_COL)
+        if len(written) <= id_idx or written[id_idx] != hand_id:
+            raise AppendConflict(f"append 結果對唔上 HandID {hand_id}")
+        return hand_id, _row_from_range(updates["updatedRange"])
+
+    def locate(self, hand_id=None, hint=None, expected=None):
+        """
+        搵返一局喺 sheet 嘅行號，返回 (行號, 該行數值)。
+        先讀 hint 嗰一行 (一個請求)；對唔上 HandID 先至讀 HandID 一欄去搵。
+        冇 HandID 嘅舊行就只可以靠 hint + expected 內容核對。
+        有 expected 嘅話逐欄比較，唔啱就 raise StaleRowError。
+        """
+        header = self.header()
+        id_idx = header.index(HAND_ID_COL)
+        row, values = None, []
+        if hint:
+            values = self._read(self.ws.row_values, hint)
+            cell = values[id_idx] if len(values) > id_idx else ""
+            if (hand_id and cell == hand_id) or (not hand_id and hint > 1):
+                row = hint
+        if row is None and hand_id:
+            ids = self._read(self.ws.col_values, id_idx + 1)
+            if hand_id in ids:
+                row = ids.index(hand_id) + 1
+                values = self._read(self.ws.row_values, row)
+        if row is None:
+            raise StaleRowError(f"搵唔到呢一局 (HandID={hand_id or '-'})")
+        for col, want in (expected or {}).items():
+            got = values[header.index(col)] if col in header and len(values) > header.index(col) else ""
+            if not _same(got, want):
+                raise StaleRowError(f"第 {row} 行嘅 {col} 已經變咗 ({got!r} != {want!r})")
+        return row, values
+
+    def _verify(self, row, values, hand_id, expected):
+        header = self.header()
+        id_idx = header.index(HAND_ID_COL)
+        cell = values[id_idx] if len(values) > id_idx else ""
+        if cell != hand_id:
+            raise StaleRowError(f"第 {row} 行已經唔係 HandID={hand_id}")
+        for col, want in (expected or {}).items():
+            got = values[header.index(col)] if col in header and len(values) > header.index(col) else ""
+            if not _same(got, want):
+                raise StaleRowError(f"第 {row} 行嘅 {col} 已經變咗 ({got!r} != {want!r})")
+
+    def _checked_write(self, row, hand_id, expected, fn, *args):
+        """
+        寫之前喺同一個排程請求入面再讀一次嗰行：HandID / expected 仲係啱先寫，唔啱就 raise StaleRowError 唔寫。
+        讀同寫連續發 (一次過攞兩個 token，中間唔會排隊)；遇到 429 重試會連核對一齊重做。
+        """
+        def job():
+            self._verify(row, self.ws.row_values(row), hand_id, expected)
+            return fn(*args)
+        return self._write(job, op=fn.__name__, cost=2)
+
+    # Sheets API 冇「行內容係 X 先寫」嘅條件寫入，行號係寫嗰刻先解析：
+    # 所以一定要有 HandID，寫之前緊貼住再核對嗰行係咪仍然係呢一局。
+    # 剩返嘅空檔只係兩個連續 API 請求之間；其他裝置啱啱喺呢一刻刪 / 插上面嘅行先會撞到。
+    def delete(self, hand_id, hint=None, expected=None):
+        """刪除一局 (按 HandID；hint 行號只係用嚟少讀一欄)：定位，核對完即刻發 deleteDimension"""
+        if not hand_id:
+            raise ValueError("delete 要 HandID")
+        row, _ = self.locate(hand_id, hint, expected)
+        self._checked_write(row, hand_id, expected, self.ws.delete_rows, row)
+        return row
+
+    def update_cell(self, column, value, hand_id, hint=None, expected=None):
+        """只改一格 (例如 Remark)；同 delete 一樣按 HandID 定位，核對完即刻寫"""
+        if not hand_id:
+            raise ValueError("update_cell 要 HandID")
+        row, _ = self.locate(hand_id, hint, expected)
+        # update_cell 一定係 USER_ENTERED：文字欄同 append 一樣加 '
+        value = entered_values([column], [value], self.players)[0]
+        self._checked_write(row, hand_id, expected, self.ws.update_cell, row, self.header().index(column) + 1, value)
+        return row
+
+
+class WorksheetRegistry:
+    """
+    全 process 共用嘅 spreadsheet / worksheet handle 快取。
+    第一次列一次所有分頁 (一個 metadata 請求)，之後 tab_exists / worksheet 都唔使再 call API。
+    """
+
+    # 搵唔到分頁時，距離上次列表超過呢個秒數先再列一次 (可能係其他 server 開咗)
+    RELIST_AFTER_S = 60
+
+    def __init__(self, open_spreadsheet):
+        self._open = open_spreadsheet
+        self._lock = threading.RLock()
+        self._sh = None
+        self._ws = {}
+        self._sheets = {}
+        self._listed_at = None
+
+    def spreadsheet(self):
+        with self._lock:
+            if self._sh is None:
+                self._sh = get_scheduler().call(self._open, kind="read", key=("open", id(self)), op="open")
+            return self._sh
+
+    def _list(self):
+        sh = self.spreadsheet()
+        worksheets = get_scheduler().call(sh.worksheets, kind="read", key=("list", id(self)))
+        self._ws = {ws.title: ws for ws in worksheets}
+        self._listed_at = time.monotonic()
+
+    def tab_exists(self, title):
+        with self._lock:
+            if title in self._ws:
+                return True
+            if self._listed_at is None or time.monotonic() - self._listed_at > self.RELIST_AFTER_S:
+                self._list()
+            return title in self._ws
+
+    def titles(self, refresh=False):
+        """所有分頁名；refresh=True 會重新列一次"""
+        with self._lock:
+            if refresh or self._listed_at is None:
+                self._list()
+            return list(self._ws)
+
+    def worksheet(self, title):
+        with self._lock:
+            if not self.tab_exists(title):
+                raise KeyError(title)
+            return self._ws[title]
+
+    def get_or_create(self, title, header, rows=500, cols=15):
+        """返回 (worksheet, 係咪啱啱開)"""
+        with self._lock:
+            if self.tab_exists(title):
+                return self._ws[title], False
+            try:
+                ws = get_scheduler().call(
+                    self.spreadsheet().add_worksheet, title=title, rows=str(rows), cols=str(cols), kind="write"
+                )
+            except Exception:
+                # 可能另一部機啱啱開咗，重新列一次
+                self._list()
+                if title in self._ws:
+                    return self._ws[title], False
+                raise
+            get_scheduler().call(ws.append_row, header, kind="write")
+            self._ws[title] = ws
+            return ws, True
+
+    def hand_sheet(self, title, players):
+        """HandSheet 都快取埋，header 每個分頁只讀一次"""
+        with self._lock:
+            key = (title, tuple(players))
+            if key not in self._sheets:
+                self._sheets[key] = HandSheet(self.worksheet(title), players)
+            return self._sheets[key]
+
+    def forget(self, title):
+        with self._lock:
+            self._ws.pop(title, None)
+            self._sheets = {k: v for k, v in self._sheets.items() if k[0] != title}
@@ -0,0 +1,186 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from indicators import score_matrix
+from master_cache import data_version, seated_rows
+from metrics import get_metrics
+from process_pool import discard, get_pool
+
+# 「下一場」Monte Carlo 預測：由歷史局數有放回咁抽樣 (bootstrap)，模擬幾千場未來對局，
+# 所有玩家同所有模擬場一次過用 NumPy 計 (sessions × hands × players)。
+# 每行歷史分數已經包含咗嗰局嘅 贏家 / 方式 / 番數 (同埋零和)，所以成行抽就保留晒佢哋之間嘅關係。
+# 輪流上枱嘅枱坐出嗰局唔係 0 分局：每位玩家淨係由自己有落枱嗰啲局抽。
+
+SESSIONS = 10_000
+DRAWDOWN = 500
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+# 每個 chunk 最多幾多格 (sessions × hands × players)，控制記憶體
+CHUNK_CELLS = 4_000_000
+# 超過呢個格數先開 process pool (細嘅 run 開 process 反而慢)
+POOL_CELLS = 50_000_000
+DEFAULT_HANDS = 40
+
+
+def session_length(df, rows=None):
+    """每場局數：歷史每日局數嘅中位數 (冇日期就用 DEFAULT_HANDS)；rows 畀咗就只數嗰啲局 (某位玩家有落枱嘅)"""
+    if 'Date' not in df.columns or df['Date'].isna().all():
+        return DEFAULT_HANDS
+    dates = df['Date'] if rows is None else df['Date'].iloc[rows]
+    if dates.isna().all():
+        return DEFAULT_HANDS
+    per_day = dates.dt.normalize().value_counts()
+    return max(int(per_day.median()), 1)
+
+
+def _simulate_chunk(x, sessions, hands, seed):
+    # 返回每場嘅最終盈虧同最大回撤 (sessions × players)
+    rng = np.random.default_rng(seed)
+    paths = np.cumsum(x[rng.integers(0, len(x), size=(sessions, hands))], axis=1)
+    # 回撤由開場 (0 分) 起計
+    peak = np.maximum(np.maximum.accumulate(paths, axis=1), 0)
+    return paths[:, -1, :], (paths - peak).min(axis=1)
+
+
+def simulate(x, sessions=SESSIONS, hands=DEFAULT_HANDS, seed=0, workers=None):
+    """
+    x 係 (N × players) 歷史分數矩陣。返回 (final, drawdown) 兩個 sessions × players 陣列。
+    分 chunk 計 (每個 chunk 一個獨立 seed)，結果同用唔用 process pool 無關；workers=1 就唔用 pool。
+    """
+    x = np.asarray(x, dtype='float32')
+    per_chunk = max(CHUNK_CELLS // (hands * x.shape[1]), 1)
+    sizes = [min(per_chunk, sessions - i) for i in range(0, sessions, per_chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(x, n, hands, s) for n, s in zip(sizes, seeds)]
+    big = sessions * hands * x.shape[1] >= POOL_CELLS and len(jobs) > 1
+    if big and workers != 1:
+        pool = get_pool()
+        try:
+            parts = list(pool.map(_simulate_chunk, *zip(*jobs)))
+        except BrokenProcessPool:
+            discard(pool)
+            raise
+    else:
+        parts = [_simulate_chunk(*job) for job in jobs]
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+def _forecast(df, players, sessions, hands=None, seed=0, workers=None):
+    """
+    模擬下一場，返回 (結果 DataFrame (冇 p_drawdown)，回撤陣列)；回撤警戒線唔影響模擬，之後先計。
+    輪流上枱嘅枱逐個玩家模擬，每場局數係佢自己每日落枱局數嘅中位數。
+    """
+    players = list(players)
+    x = score_matrix(df, players)
+    rows = seated_rows(df, players)
+    if rows is None:
+        hands = hands or session_length(df)
+        final, drawdown = simulate(x, sessions, hands, seed, workers)
+    else:
+        final = np.zeros((sessions, len(players)), dtype='float32')
+        drawdown = np.zeros((sessions, len(players)), dtype='float32')
+        for j, r in enumerate(rows):
+            if len(r):
+                final[:, j:j + 1], drawdown[:, j:j + 1] = simulate(
+                    x[r, j][:, None], sessions, hands or session_length(df, r), [seed, j], workers)
+        hands = hands or session_length(df)
+    out = pd.DataFrame({
+        "expected": final.mean(axis=0),
+        **{f"p{int(q * 100)}": np.quantile(final, q, axis=0) for q in QUANTILES},
+        "p_win": (final > 0).mean(axis=0),
+    }, index=players)
+    out.attrs.update(sessions=sessions, hands=hands)
+    return out, drawdown
+
+
+def _with_threshold(forecast, threshold):
+    base, drawdown = forecast
+    out = base.copy()
+    out["p_drawdown"] = (drawdown <= -threshold).mean(axis=0)
+    out.attrs.update(base.attrs, threshold=threshold)
+    return out
+
+
+def project(df, players, sessions=SESSIONS, threshold=DRAWDOWN, hands=None, seed=0, workers=None):
+    """
+    每個玩家下一場嘅預測：期望盈虧、分位數、回撤超過 threshold 嘅機率。
+    返回 DataFrame (index = 玩家)，attrs 記低 sessions / hands / threshold。
+    """
+    return _with_threshold(_forecast(df, players, sessions, hands, seed, workers), threshold)
+
+
+# --- 按數據版本快取 + 背景計算 ---
+# dashboard render 唔使等：未計好就返回 None，背景 thread 計完放入 memo。
+# memo 存模擬結果同每場回撤，唔同嘅回撤警戒線只係重新計 p_drawdown，唔使再模擬。
+# 失敗都記低 (同一數據版本唔再重試)，唔係 dashboard 每秒 poll 就會不斷重新提交。
+
+_memo = OrderedDict()
+_pending = {}
+_failed = OrderedDict()
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mj-sim")
+MEMO_SIZE = 16
+
+
+def _key(df, players, sessions):
+    return data_version(df), tuple(players), sessions
+
+
+def _store(key, forecast):
+    with _lock:
+        _memo[key] = forecast
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+        _pending.pop(key, None)
+
+
+def _run(key, df, players, sessions):
+    try:
+        with get_metrics().timer("simulation_seconds"):
+            _store(key, _forecast(df, players, sessions))
+    except Exception as e:
+        print(f"Simulation failed: {e!r}")
+        with _lock:
+            _failed[key] = f"{type(e).__name__}: {e}"
+            while len(_failed) > MEMO_SIZE:
+                _failed.popitem(last=False)
+            _pending.pop(key, None)
+
+
+def get_projection(df, players, sessions=SESSIONS, threshold=DRAWDOWN, block=False):
+    """
+    同一數據版本 + 參數只模擬一次。block=False 時未有結果就喺背景開始計並返回 None；
+    之前失敗過 (見 projection_error) 就唔會再提交。
+    """
+    key = _key(df, players, sessions)
+    with _lock:
+        cached = _memo.get(key)
+        if cached is not None:
+            _memo.move_to_end(key)
+            started = False
+        else:
+            started = key not in _pending and key not in _failed and not block
+            if started:
+                _pending[key] = _executor.submit(_run, key, df, tuple(players), sessions)
+    if cached is not None or started or block:
+        get_metrics().cache("simulation", cached is not None)
+    if cached is not None:
+        return _with_threshold(cached, threshold)
+    if not block:
+        return None
+    forecast = _forecast(df, players, sessions)
+    _store(key, forecast)
+    return _with_threshold(forecast, threshold)
+
+
+def is_pending(df, players, sessions=SESSIONS):
+    with _lock:
+        return _key(df, players, sessions) in _pending
+
+
+def projection_error(df, players, sessions=SESSIONS):
+    """呢個數據版本嘅背景模擬失敗咗就返回錯誤訊息 (否則 None)"""
+    with _lock:
+        return _failed.get(_key(df, players, sessions))
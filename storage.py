@@ -0,0 +1,520 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from master_cache import SEAT_SEP, SEATS_COL, coerce_types, seated_mask
+from sheets import HAND_ID_COL, StaleRowError, _same, daily_header, new_hand_id
+
+# 儲存後端：計分頁 / 今日復盤 / Master Record 都經呢個介面讀寫
+#   SheetsStore  - 現有嘅 Google Sheets (每日一個分頁 + Master Record CSV)
+#   SQLiteStore  - 本地 SQLite：hands 表 (每局一行，按時間 / 贏家 / 輸家 / 番數建索引)
+#                  + deltas 長表 (hand, player, delta)，每局只記落枱嘅玩家，名單加人唔使改 schema
+# SQLite 模式可以完全離線運行；開咗 mirror 就由背景 SyncWorker 將改動同步去 Sheets
+
+
+def day_canonical(df, day, players):
+    """每日分頁 (Date 係 HH:MM 字串) → 標準型別；Date 配返日子變完整時間"""
+    if df.empty:
+        return df
+    df = df.copy()
+    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        df['Date'] = pd.to_datetime(day + " " + df['Date'].astype(str).str.strip(), errors='coerce')
+    return coerce_types(df, players)
+
+
+def _iso(ts):
+    """SQLite ts 欄嘅標準格式 (精確到秒)：字串比較 = 時間比較，讀返用 ISO8601 解析"""
+    return ts.isoformat(sep="T", timespec="seconds")
+
+
+class HandStore(ABC):
+    """所有後端共用嘅介面；day 係 'YYYY-MM-DD' (香港時間)"""
+
+    kind = "base"
+
+    @abstractmethod
+    def ensure_day(self, day):
+        """確保當日存在，返回係咪啱啱建立"""
+
+    @abstractmethod
+    def day_frame(self, day, ttl=5, kind="read"):
+        """當日所有局，欄位同每日分頁一樣，型別同 Master Record (見 master_cache.coerce_types)"""
+
+    def invalidate(self, day):
+        pass
+
+    @abstractmethod
+    def append(self, day, entry):
+        """加一局，返回 (hand_id, 定位提示)"""
+
+    @abstractmethod
+    def locate(self, day, hand_id=None, hint=None, expected=None):
+        """搵返一局 (核對 expected)；搵唔到或者內容變咗就 raise StaleRowError"""
+
+    @abstractmethod
+    def delete(self, day, hand_id=None, hint=None, expected=None):
+        """刪除一局"""
+
+    @abstractmethod
+    def update_cell(self, day, column, value, hand_id=None, hint=None, expected=None):
+        """改一局嘅一格"""
+
+    @abstractmethod
+    def master_frame(self):
+        """全歷史 (Master Record 格式，Date 係完整 datetime)"""
+
+    def query(self, start=None, end=None, min_fan=None, player=None):
+        """按時間範圍 / 最少番數 / 玩家 (贏或輸) 篩選；預設實作喺全歷史上面過濾"""
+        df = self.master_frame()
+        mask = pd.Series(True, index=df.index)
+        if start is not None:
+            mask &= df['Date'] >= pd.Timestamp(start)
+        if end is not None:
+            mask &= df['Date'] < pd.Timestamp(end)
+        if min_fan is not None:
+            mask &= pd.to_numeric(df['Fan'], errors='coerce') >= min_fan
+        if player is not None:
+            mask &= (df['Winner'] == player) | (df['Loser'] == player)
+        return df[mask]
+
+
+class SheetsStore(HandStore):
+    """
+    包住現有嘅 Google Sheets 實作：registry (分頁 handle)、分頁讀取快取同 Master Record 快取。
+    用 callable 注入，等呢個模組唔使依賴 Streamlit。
+    on_write(day)：寫入成功之後 call (例如標記分頁要重新合併)。
+    """
+
+    kind = "sheets"
+
+    def __init__(self, players, registry, read_tab, invalidate_tab, load_master, on_write=None):
+        self.players = list(players)
+        self.registry = registry
+        self._read_tab = read_tab
+        self._invalidate_tab = invalidate_tab
+        self._load_master = load_master
+        self._on_write = on_write or (lambda day: None)
+
+    def ensure_day(self, day):
+        return self.registry.get_or_create(day, daily_header(self.players))[1]
+
+    def day_frame(self, day, ttl=5, kind="read"):
+        return day_canonical(self._read_tab(day, ttl=ttl, kind=kind), day, self.players)
+
+    def invalidate(self, day):
+        self._invalidate_tab(day)
+
+    def append(self, day, entry):
+        out = self.registry.hand_sheet(day, self.players).append(entry)
+        self._on_write(day)
+        return out
+
+    def locate(self, day, hand_id=None, hint=None, expected=None):
+        return self.registry.hand_sheet(day, self.players).locate(hand_id, hint=hint, expected=expected)[0]
+
+    def delete(self, day, hand_id=None, hint=None, expected=None):
+        out = self.registry.hand_sheet(day, self.players).delete(hand_id, hint=hint, expected=expected)
+        self._on_write(day)
+        return out
+
+    def update_cell(self, day, column, value, hand_id=None, hint=None, expected=None):
+        out = self.registry.hand_sheet(day, self.players).update_cell(
+            column, value, hand_id, hint=hint, expected=expected)
+        self._on_write(day)
+        return out
+
+    def master_frame(self):
+        return self._load_master()
+
+
+class SQLiteStore(HandStore):
+    """
+    players 係成張枱嘅名單；seats 細過名單人數 (輪流上枱) 嘅話，讀出嚟嘅 frame 會多一個 Seats 欄。
+    name 用嚟分開唔同枱嘅數據版本 (每張枱一個 db 檔，revision 會撞)。
+    """
+
+    kind = "sqlite"
+
+    FIELDS = ["Winner", "Loser", "Method", "Fan", "Remark"]
+    HAND_COLS = ["seq", "hand_id", "ts", "day", "winner", "loser", "method", "fan", "remark"]
+
+    def __init__(self, path, players, seats=None, name=None):
+        self.players = list(players)
+        self.seats = seats or len(self.players)
+        self.name = name
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._init_schema()
+
+    # --- schema ---
+    def _init_schema(self):
+        with self._lock:
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS hands (
+                    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+                    hand_id TEXT NOT NULL UNIQUE,
+                    ts      TEXT NOT NULL,
+                    day     TEXT NOT NULL,
+                    winner  TEXT, loser TEXT, method TEXT, fan INTEGER, remark TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_hands_ts ON hands(ts);
+                CREATE INDEX IF NOT EXISTS idx_hands_winner ON hands(winner, ts);
+                CREATE INDEX IF NOT EXISTS idx_hands_loser ON hands(loser, ts);
+                CREATE INDEX IF NOT EXISTS idx_hands_fan ON hands(fan, ts);
+                CREATE TABLE IF NOT EXISTS deltas (
+                    seq    INTEGER NOT NULL,
+                    player TEXT NOT NULL,
+                    delta  INTEGER NOT NULL,
+                    PRIMARY KEY (seq, player)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_deltas_player ON deltas(player, seq);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+                    op      TEXT NOT NULL,
+                    day     TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS outbox_failed (
+                    id      INTEGER PRIMARY KEY,
+                    op      TEXT NOT NULL,
+                    day     TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    error   TEXT,
+                    ts      TEXT NOT NULL
+                );
+            """)
+            # outbox 舊版冇 attempts 欄 (同步失敗次數)
+            if "attempts" not in [r[1] for r in self._db.execute("PRAGMA table_info(outbox)")]:
+                self._db.execute("ALTER TABLE outbox ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            # 舊版每個玩家一欄 (寬表)：搬一次去 deltas，之後嗰啲欄唔再讀寫
+            legacy = [r[1] for r in self._db.execute("PRAGMA table_info(hands)") if r[1] not in self.HAND_COLS]
+            migrated = self._db.execute("SELECT 1 FROM meta WHERE key = 'long_format'").fetchone()
+            if legacy and not migrated:
+                self._db.execute("BEGIN IMMEDIATE")
+                for p in legacy:
+                    self._db.execute(f'INSERT OR IGNORE INTO deltas(seq, player, delta) SELECT seq, ?, "{p}" FROM hands', (p,))
+                self._db.execute("INSERT OR REPLACE INTO meta(key, value) VALUES('long_format', '1')")
+                self._db.execute("COMMIT")
+
+    def _bump(self):
+        # 每次改動都加 revision，用嚟做數據版本
+        self._db.execute("INSERT INTO meta(key, value) VALUES('rev', '1') "
+                         "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+    def version(self):
+        """數據版本 (每次寫入都會變)，同 master_frame().attrs['version'] 一致"""
+        return f"sqlite:{self.revision()}" if self.name is None else f"sqlite:{self.name}:{self.revision()}"
+
+    def revision(self):
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _enqueue(self, op, day, payload):
+        self._db.execute("INSERT INTO outbox(op, day, payload) VALUES (?, ?, ?)",
+                         (op, day, json.dumps(payload, ensure_ascii=False, default=str)))
+
+    # --- 讀 ---
+    def _select(self, where="", params=()):
+        """hands 表 + deltas 長表 → 寬表 (名單每人一欄，冇落枱當 0)"""
+        with self._lock:
+            rows = self._db.execute("SELECT seq, hand_id, ts, winner, loser, method, fan, remark "
+                                    f"FROM hands {where} ORDER BY seq", params).fetchall()
+            deltas = self._db.execute("SELECT seq, player, delta FROM deltas "
+                                      f"WHERE seq IN (SELECT seq FROM hands {where})", params).fetchall()
+        df = pd.DataFrame(rows, columns=["seq", HAND_ID_COL, "Date"] + self.FIELDS)
+        # ts 一律係 _iso 寫嘅格式；舊 DB 可能有帶微秒嘅，ISO8601 兩種都食到
+        df['Date'] = pd.to_datetime(df['Date'], format="ISO8601")
+        seq = df['seq'].to_numpy()
+        d = pd.DataFrame(deltas, columns=["seq", "player", "delta"])
+        row = np.searchsorted(seq, d['seq'].to_numpy())
+        col = pd.Categorical(d['player'], categories=self.players).codes
+        keep = col >= 0
+        wide = np.zeros((len(df), len(self.players)), dtype='int64')
+        wide[row[keep], col[keep]] = d['delta'].to_numpy()[keep]
+        for i, p in enumerate(self.players):
+            df[p] = wide[:, i]
+        out = ["Date"] + self.players + self.FIELDS + [HAND_ID_COL]
+        if self.seats < len(self.players):
+            # 每局落枱組合用 bitmask 分組，同一組合只砌一次字串
+            mask = np.zeros(len(df), dtype='int64')
+            np.bitwise_or.at(mask, row[keep], 1 << col[keep].astype('int64'))
+            codes, uniq = pd.factorize(mask)
+            labels = [SEAT_SEP.join(p for i, p in enumerate(self.players) if m >> i & 1) for m in uniq]
+            df[SEATS_COL] = pd.Categorical.from_codes(codes, categories=labels)
+            out.append(SEATS_COL)
+        return df[out]
+
+    def ensure_day(self, day):
+        return False
+
+    def day_frame(self, day, ttl=5, kind="read"):
+        start = datetime.strptime(day, "%Y-%m-%d")
+        df = self._select("WHERE ts >= ? AND ts < ?",
+                          (start.isoformat(), (start + timedelta(days=1)).isoformat()))
+        return coerce_types(df, self.players)
+
+    def master_frame(self):
+        with self._lock:
+            df = coerce_types(self._select(), self.players)
+            df.attrs['version'] = self.version()
+            df.attrs['source'] = f"sqlite:{os.path.abspath(self.path)}"
+        return df
+
+    def query(self, start=None, end=None, min_fan=None, player=None):
+        """全部行 SQL 索引 (ts / fan / winner / loser)，唔使載入全歷史"""
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("ts >= ?"); params.append(pd.Timestamp(start).isoformat())
+        if end is not None:
+            clauses.append("ts < ?"); params.append(pd.Timestamp(end).isoformat())
+        if min_fan is not None:
+            clauses.append("fan >= ?"); params.append(int(min_fan))
+        if player is not None:
+            clauses.append("seq IN (SELECT seq FROM hands WHERE winner = ? UNION SELECT seq FROM hands WHERE loser = ?)")
+            params += [player, player]
+        return coerce_types(self._select(("WHERE " + " AND ".join(clauses)) if clauses else "", params), self.players)
+
+    # --- 寫 ---
+    def _ts_for(self, day, entry):
+        # 每日分頁只記 HH:MM；配返日子變完整時間
+        hhmm = str(entry.get("Date") or datetime.now().strftime("%H:%M"))
+        return _iso(pd.Timestamp(f"{day} {hhmm}"))
+
+    def append(self, day, entry):
+        """entry 入面有分數嘅玩家就當有落枱 (計分頁只會傳落枱嗰幾個)"""
+        entry = dict(entry)
+        hand_id = entry.setdefault(HAND_ID_COL, new_hand_id())
+        values = [hand_id, self._ts_for(day, entry), day, entry.get("Winner"), entry.get("Loser"),
+                  entry.get("Method"), int(entry.get("Fan") or 0), entry.get("Remark", "")]
+        seated = [(p, int(entry.get(p) or 0)) for p in self.players if p in entry]
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                cur = self._db.execute("INSERT INTO hands (hand_id, ts, day, winner, loser, method, fan, remark) "
+                                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", values)
+                self._db.executemany("INSERT INTO deltas(seq, player, delta) VALUES (?, ?, ?)",
+                                     [(cur.lastrowid, p, v) for p, v in seated])
+                self._enqueue("append", day, entry)
+                self._bump()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return hand_id, cur.lastrowid
+
+    def locate(self, day, hand_id=None, hint=None, expected=None):
+        with self._lock:
+            return self._locate(hand_id, hint, expected)
+
+    def _locate(self, hand_id, hint, expected):
+        if hand_id:
+            where, params = "WHERE hand_id = ?", (hand_id,)
+        else:
+            where, params = "WHERE seq = ?", (hint,)
+        df = self._select(where, params)
+        if df.empty:
+            raise StaleRowError(f"搵唔到呢一局 (HandID={hand_id or '-'})")
+        row = df.iloc[0]
+        for col, want in (expected or {}).items():
+            if col in row.index and col != "Date" and not _same(row[col], want):
+                raise StaleRowError(f"{col} 已經變咗 ({row[col]!r} != {want!r})")
+        return row[HAND_ID_COL]
+
+    def delete(self, day, hand_id=None, hint=None, expected=None):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                hid = self._locate(hand_id, hint, expected)
+                self._db.execute("DELETE FROM deltas WHERE seq = (SELECT seq FROM hands WHERE hand_id = ?)", (hid,))
+                self._db.execute("DELETE FROM hands WHERE hand_id = ?", (hid,))
+                self._enqueue("delete", day, {HAND_ID_COL: hid})
+                self._bump()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return hid
+
+    def update_cell(self, day, column, value, hand_id=None, hint=None, expected=None):
+        field = {"Remark": "remark", "Fan": "fan", "Winner": "winner", "Loser": "loser", "Method": "method"}.get(column)
+        if field is None and column not in self.players:
+            raise KeyError(column)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                hid = self._locate(hand_id, hint, expected)
+                if field is None:
+                    self._db.execute("INSERT INTO deltas(seq, player, delta) "
+                                     "SELECT seq, ?, ? FROM hands WHERE hand_id = ? "
+                                     "ON CONFLICT(seq, player) DO UPDATE SET delta = excluded.delta",
+                                     (column, int(value), hid))
+                else:
+                    self._db.execute(f"UPDATE hands SET {field} = ? WHERE hand_id = ?", (value, hid))
+                self._enqueue("update", day, {HAND_ID_COL: hid, "column": column, "value": value})
+                self._bump()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return hid
+
+    def import_frame(self, df):
+        """由 Master Record 匯入 (例如第一次轉去 SQLite)；已存在嘅 HandID 會略過，唔會入 outbox"""
+        df = df.copy()
+        if HAND_ID_COL not in df.columns:
+            df[HAND_ID_COL] = None
+        df['Date'] = pd.to_datetime(df['Date'], format="mixed")
+        df[HAND_ID_COL] = [h if isinstance(h, str) and h else new_hand_id() for h in df[HAND_ID_COL]]
+        # 空白番數 / 備註 (NaN) 先轉好：NaN 係 truthy，唔可以靠 `or` 補
+        df['Fan'] = pd.to_numeric(df['Fan'], errors='coerce').fillna(0).round().astype(int) if 'Fan' in df.columns else 0
+        df['Remark'] = df['Remark'].astype(object).fillna("") if 'Remark' in df.columns else ""
+        rows = []
+        for r in df.itertuples(index=False):
+            r = r._asdict() if hasattr(r, "_asdict") else dict(zip(df.columns, r))
+            ts = r["Date"]
+            rows.append([r[HAND_ID_COL], _iso(ts), ts.strftime("%Y-%m-%d"),
+                         r.get("Winner"), r.get("Loser"), r.get("Method"),
+                         int(r["Fan"]), str(r["Remark"])])
+        # 長表：有嗰個玩家欄、而且有落枱 (有 Seats 欄先睇) 先記
+        present = [p for p in self.players if p in df.columns]
+        seated = seated_mask(df, present)
+        scores = df[present].apply(pd.to_numeric, errors='coerce').fillna(0).round().astype('int64').to_numpy()
+        ids = df[HAND_ID_COL].to_numpy()
+        deltas = [(p, int(scores[i, j]), ids[i]) for j, p in enumerate(present) for i in np.flatnonzero(seated[:, j])]
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany("INSERT OR IGNORE INTO hands (hand_id, ts, day, winner, loser, method, fan, remark) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._db.executemany("INSERT OR IGNORE INTO deltas(seq, player, delta) "
+                                 "SELECT seq, ?, ? FROM hands WHERE hand_id = ?", deltas)
+            self._bump()
+            self._db.execute("COMMIT")
+        return len(rows)
+
+    def import_once(self, load):
+        """
+        第一次用 (資料庫一局都未有) 先由 Master Record 匯入一次；load() 返回全歷史。
+        已經有局 (或者匯入過) 就唔再讀；load 失敗 (例如離線) 會 raise，下次開 app 再試。返回匯入咗幾多局。
+        """
+        with self._lock:
+            done = self._db.execute("SELECT 1 FROM meta WHERE key = 'imported'").fetchone()
+            if done or self._db.execute("SELECT 1 FROM hands LIMIT 1").fetchone():
+                return 0
+        n = self.import_frame(load())
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO meta(key, value) VALUES('imported', ?)",
+                             (datetime.now().isoformat(timespec="seconds"),))
+        return n
+
+    # --- outbox (俾 SyncWorker 用) ---
+    def pending(self, limit=50):
+        with self._lock:
+            return self._db.execute("SELECT id, op, day, payload FROM outbox ORDER BY id LIMIT ?", (limit,)).fetchall()
+
+    def ack(self, op_id):
+        with self._lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (op_id,))
+
+    def fail(self, op_id, error, max_attempts):
+        """
+        記低一次同步失敗，返回係咪已經搬咗去 outbox_failed。
+        試咗 max_attempts 次都唔得嘅 (例如 AppendConflict) 就搬走，唔好阻住後面嘅改動。
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", (op_id,))
+            row = self._db.execute("SELECT attempts FROM outbox WHERE id = ?", (op_id,)).fetchone()
+            parked = bool(row) and row[0] >= max_attempts
+            if parked:
+                self._db.execute("INSERT OR REPLACE INTO outbox_failed(id, op, day, payload, error, ts) "
+                                 "SELECT id, op, day, payload, ?, ? FROM outbox WHERE id = ?",
+                                 (repr(error), datetime.now().isoformat(timespec="seconds"), op_id))
+                self._db.execute("DELETE FROM outbox WHERE id = ?", (op_id,))
+            self._db.execute("COMMIT")
+        return parked
+
+    def failed(self):
+        """搬咗去 outbox_failed 嘅改動 (要人手處理)"""
+        with self._lock:
+            return self._db.execute("SELECT id, op, day, payload, error, ts FROM outbox_failed ORDER BY id").fetchall()
+
+
+class SyncWorker(threading.Thread):
+    """
+    背景將 SQLite outbox 入面嘅改動按次序鏡像去另一個 store (通常係 SheetsStore)。
+    失敗就等一陣再試；對方已經冇咗嗰行 (StaleRowError) 就當完成。
+    重播係冪等嘅：append 之前先用 HandID 搵，對方已經有 (上次寫咗但未 ack) 就唔再加。
+    網絡錯誤 (OSError) 一直等到連得返；其他錯誤試 MAX_ATTEMPTS 次就搬去 outbox_failed。
+    """
+
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, source, target, interval=2.0, max_backoff=60.0):
+        super().__init__(name="mj-sheets-sync", daemon=True)
+        self.source = source
+        self.target = target
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._stop_event = threading.Event()
+        self.last_error = None
+
+    def stop(self):
+        self._stop_event.set()
+
+    def sync_once(self):
+        """處理一批 outbox，返回處理咗幾多個"""
+        done = 0
+        for op_id, op, day, payload in self.source.pending():
+            data = json.loads(payload)
+            try:
+                if op == "append":
+                    self.target.ensure_day(day)
+                    if not self._exists(day, data[HAND_ID_COL]):
+                        self.target.append(day, data)
+                elif op == "delete":
+                    self.target.delete(day, hand_id=data[HAND_ID_COL])
+                elif op == "update":
+                    self.target.update_cell(day, data["column"], data["value"], hand_id=data[HAND_ID_COL])
+            except StaleRowError:
+                pass
+            except OSError:
+                raise
+            except Exception as e:
+                # 可能每次都會失敗嘅改動：未到上限就照舊 backoff 再試 (保持次序)，到咗就搬走再繼續
+                if not self.source.fail(op_id, e, self.MAX_ATTEMPTS):
+                    raise
+                print(f"Sync gave up on outbox #{op_id} ({op} {day}): {e}")
+                self.target.invalidate(day)
+                continue
+            self.source.ack(op_id)
+            self.target.invalidate(day)
+            done += 1
+        return done
+
+    def _exists(self, day, hand_id):
+        try:
+            self.target.locate(day, hand_id)
+            return True
+        except StaleRowError:
+            return False
+
+    def run(self):
+        backoff = self.interval
+        while not self._stop_event.is_set():
+            try:
+                self.sync_once()
+                self.last_error = None
+                backoff = self.interval
+            except Exception as e:
+                self.last_error = e
+                backoff = min(self.max_backoff, backoff * 2)
+            self._stop_event.wait(backoff)
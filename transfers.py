@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from master_cache import data_version
+from metrics import get_metrics
+from scoring import METHODS
+
+# 對戰資金流向 (head-to-head)：每局邊個俾錢邊個、俾幾多，
+# 按 方式 (出統 / 自摸 / 包自摸) × 番數區間 分開，整成 付款人 × 收款人 嘅矩陣。
+# 每局每個輸錢嘅玩家 (分數 < 0) 當一筆轉帳俾贏家，金額直接用紀錄分數，所以自摸三家各自一筆。
+# 事件按時間排好存一次 (按數據版本快取)，任何日期範圍都係 searchsorted + 一次 bincount。
+
+FAN_BANDS = [5, 7, 10]
+BAND_LABELS = ["3-4番", "5-6番", "7-9番", "10番+"]
+
+
+class TransferIndex:
+    def __init__(self, df, players):
+        self.players = list(players)
+        p = len(self.players)
+        self.shape = (len(METHODS), len(BAND_LABELS), p, p)
+        cells = int(np.prod(self.shape))
+        df = df[df['Date'].notna()]
+        order = np.argsort(df['Date'].to_numpy(), kind="stable")
+        self.dates = df['Date'].to_numpy()[order]
+
+        # 類別碼：coerce_types 已經將玩家 / METHODS 放喺類別最前，碼 < p / < 3 就係有效值
+        winner = pd.Categorical(df['Winner'], categories=self.players).codes[order].astype('int64')
+        method = pd.Categorical(df['Method'], categories=METHODS).codes[order].astype('int64')
+        fan = pd.to_numeric(df['Fan'], errors='coerce').fillna(0).to_numpy()[order]
+        band = np.digitize(fan, FAN_BANDS)
+        x = df[self.players].to_numpy(dtype='int64')[order]
+
+        # 每局 × 每個玩家一格：cell = ((method × bands + band) × p + payer) × p + winner
+        payer = np.arange(p)[None, :]
+        base = ((method * len(BAND_LABELS) + band) * p)[:, None]
+        cell = (base + payer) * p + winner[:, None]
+        pays = (x < 0) & (winner >= 0)[:, None] & (method >= 0)[:, None] & (payer != winner[:, None])
+        # 唔計嘅格放去 cells (多出嚟嗰個 bin，bincount 之後截走)
+        self.cell = np.where(pays, cell, cells).astype('int32')
+        self.amount = np.where(pays, -x, 0).astype('int64')
+        self.cells = cells
+
+    def _bounds(self, start, end):
+        lo = 0 if start is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start)), "left")
+        # end 當成包埋嗰一日
+        hi = len(self.cell) if end is None else np.searchsorted(
+            self.dates, np.datetime64(pd.Timestamp(end).normalize() + pd.Timedelta(days=1)), "left")
+        return lo, hi
+
+    def slice(self, start=None, end=None):
+        """日期範圍 [start, end] (包頭包尾，None = 唔限) → (money, count)，各自係 (方式, 番數區間, 付款, 收款) 陣列"""
+        lo, hi = self._bounds(start, end)
+        cell = self.cell[lo:hi].ravel()
+        money = np.bincount(cell, weights=self.amount[lo:hi].ravel(), minlength=self.cells + 1)
+        count = np.bincount(cell, minlength=self.cells + 1)
+        return (money[:self.cells].reshape(self.shape).astype('int64'),
+                count[:self.cells].reshape(self.shape))
+
+    def matrix(self, start=None, end=None, method=None, band=None):
+        """
+        付款人 (行) × 收款人 (欄) 嘅 (money, count) 兩個 DataFrame；
+        method / band 係 METHODS / BAND_LABELS 入面嘅名 (None = 全部加埋)。
+        """
+        out = []
+        for a in self.slice(start, end):
+            a = a[METHODS.index(method)] if method is not None else a.sum(axis=0)
+            a = a[BAND_LABELS.index(band)] if band is not None else a.sum(axis=0)
+            out.append(pd.DataFrame(a, index=pd.Index(self.players, name="付款"),
+                                    columns=pd.Index(self.players, name="收款")))
+        return tuple(out)
+
+
+# --- 按數據版本快取 ---
+_memo = OrderedDict()
+_lock = threading.Lock()
+MEMO_SIZE = 8
+
+
+def get_transfers(df, players):
+    """同一數據版本只建一次 TransferIndex (dashboard 同每日復盤共用)"""
+    key = (data_version(df), tuple(players))
+    with _lock:
+        cached = _memo.get(key)
+        if cached is not None:
+            _memo.move_to_end(key)
+    get_metrics().cache("transfers", cached is not None)
+    if cached is not None:
+        return cached
+    with get_metrics().timer("indicator_seconds", stage="transfers"):
+        index = TransferIndex(df, players)
+    with _lock:
+        _memo[key] = index
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return index
@@ -1,38 +1,240 @@
 import streamlit as st
-from streamlit_gsheets import GSheetsConnection
-import gspread
-import pandas as pd
-import numpy as np
-from google.oauth2.service_account import Credentials
-from datetime import datetime
+import os
+import threading
+import time
+from groups import GROUPS_FILE, Group, load_groups
+from sheets import WorksheetRegistry
+from scheduler import get_scheduler
+from metrics import get_metrics
+
+# 每個頁面都會 import 呢個模組 (app.py 要 MASTER_CSV_URL / get_groups)，所以頂層只 import 輕嘅模組；
+# Master 快取、儲存後端、統計表、核對、合併、分區喺用到嘅 function 入面先 import，
+# 例如計分頁只會載入 storage / aggregates，唔會拉埋 audit (pyarrow)、partitions、consolidate
 
 # 1. 喺度定義返個 URL (或者喺 st.secrets 攞)
-# 確保呢條 URL 同你喺 app.py 用嘅一致
-SHEET_URL = "https://docs.google.com/spreadsheets/d/12rjgnWh2gMQ05TsFR6aCCn7QXB6rpa-Ylb0ma4Cs3E4/edit?gid=2131114078#gid=2131114078"
+# Spreadsheet ID 同 Master Record 嘅 GID 只喺呢度定義，app.py 直接 import MASTER_CSV_URL
+SHEET_ID = "12rjgnWh2gMQ05TsFR6aCCn7QXB6rpa-Ylb0ma4Cs3E4"
+MASTER_GID = "2131114078"
+SHEET_URL = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/edit?gid={MASTER_GID}#gid={MASTER_GID}"
+# Master Record 嘅 CSV 匯出網址：必須係 /export?format=csv 先讀到正確嘅欄位
+MASTER_CSV_URL = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid={MASTER_GID}"
 
+@st.cache_resource
 def get_connection():
+    # 全 process 共用一個 client；google-auth 會喺 token 過期時自動 refresh，唔使每次重新 authorize
+    # gspread / google-auth 只喺真正要寫 sheet 嘅時候先 import，唔拖慢其他頁面冷啟動
+    import gspread
+    from google.oauth2.service_account import Credentials
     creds_dict = st.secrets["connections"]["gsheets"]
     scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
     creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
+    get_metrics().count("api_calls_total", op="auth", kind="auth")
     return gspread.authorize(creds)
 
+@st.cache_resource
+def get_registry(url=SHEET_URL):
+    # spreadsheet / worksheet handle 跨 session 共用，分頁存在與否熱咗之後唔使 call API
+    return WorksheetRegistry(lambda: get_connection().open_by_url(url))
+
 def get_base_money(fan):
-    # 呢度跟你之前嘅 logic
-    fan_map = {3: 8, 4: 16, 5: 48, 6: 64, 7: 96, 8: 128, 9: 192, 10: 256}
-    return fan_map.get(fan, 256 if fan > 10 else 0)
+    # 舊番數表，規則統一喺 scoring.py
+    from scoring import base_money
+    return base_money(fan, "classic")
+
+# 分頁讀取快取：全 process 共用，寫入之後即刻 invalidate，唔使等 TTL
+# 每個分頁一個 generation：invalidate 就加一，喺舊 generation 開始嘅讀取結果唔會放入快取，
+# 亦唔會同新 generation 嘅讀取合併 (否則寫入之後可能讀返寫入之前嘅內容)
+_tab_cache = {}
+_tab_gen = {}
+_tab_lock = threading.Lock()
+
+def read_worksheet(worksheet, ttl=5, kind="read"):
+    """經 scheduler 讀一個分頁；ttl 秒內重用上次結果，並發嘅相同讀取只發一次請求"""
+    now = time.monotonic()
+    with _tab_lock:
+        hit = _tab_cache.get(worksheet)
+        gen = _tab_gen.get(worksheet, 0)
+    fresh = hit is not None and now - hit[0] < ttl
+    get_metrics().cache("conn.read", fresh)
+    if fresh:
+        return hit[1].copy()
+    from streamlit_gsheets import GSheetsConnection
+    conn = st.connection("gsheets", type=GSheetsConnection)
+    with get_metrics().timer("load_seconds", source="worksheet"):
+        df = get_scheduler().call(conn.read, spreadsheet=SHEET_URL, worksheet=worksheet, ttl=0,
+                                  kind=kind, key=("tab", worksheet, gen))
+    with _tab_lock:
+        if _tab_gen.get(worksheet, 0) == gen:
+            _tab_cache[worksheet] = (now, df)
+    return df.copy()
+
+def invalidate_worksheet(worksheet):
+    with _tab_lock:
+        _tab_gen[worksheet] = _tab_gen.get(worksheet, 0) + 1
+        _tab_cache.pop(worksheet, None)
+
+@st.cache_resource
+def get_master_cache(url, players):
+    # 每個 process 共用一個快取物件，記住上次同步到邊一行
+    from master_cache import MasterCache, make_upstream
+    return MasterCache(make_upstream(url), players, scheduler=get_scheduler())
+
+def _storage_setting(name, env, default=None):
+    # 環境變數優先，其次 secrets.toml 嘅 [storage]
+    if os.environ.get(env) is not None:
+        return os.environ[env]
+    try:
+        return st.secrets.get("storage", {}).get(name, default)
+    except Exception:
+        return default
+
+def storage_backend(group=None):
+    """'sheets' (預設) 或 'sqlite' (離線都用得)；預設枱以外嘅枱一律用 SQLite"""
+    if group is not None and not group.default:
+        return "sqlite"
+    return str(_storage_setting("backend", "MJ_STORAGE", "sheets")).lower()
+
+# --- 枱 (groups.py)：每張枱有自己嘅名單、儲存同快取，下面所有 get_xxx(players) 都按目前揀咗嘅枱分開 ---
+DEFAULT_GROUP = "主枱"
+
+@st.cache_resource
+def get_groups(players):
+    """{枱名: Group}；預設枱 = app.py 嘅玩家 + Google Sheets Master Record，其他枱見 groups.json"""
+    return load_groups(Group(DEFAULT_GROUP, players, csv_url=MASTER_CSV_URL, default=True),
+                       _storage_setting("groups_file", "MJ_GROUPS_FILE", GROUPS_FILE))
+
+def active_group(players):
+    """目前 session 揀咗嘅枱 (app.py 側邊欄設定)；名單對唔上 (例如直接 call view) 就當預設枱"""
+    group = st.session_state.get("active_group")
+    if group is None or tuple(group.roster) != tuple(players):
+        return get_groups(tuple(players)).get(DEFAULT_GROUP) or \
+            Group(DEFAULT_GROUP, players, csv_url=MASTER_CSV_URL, default=True)
+    return group
+
+def get_aggregates(players):
+    group = active_group(players)
+    return _get_aggregates(tuple(players), group.name, group)
+
+@st.cache_resource
+def _get_aggregates(players, name, _group):
+    from aggregates import Aggregates
+    return Aggregates(players, cache_dir=_group.cache_dir)
+
+def get_store(players):
+    group = active_group(players)
+    return _get_store(tuple(players), group.name, group)
+
+@st.cache_resource
+def _get_store(players, name, _group):
+    from aggregates import AggregatingStore
+    from storage import SheetsStore, SQLiteStore, SyncWorker
+    players = list(players)
+    aggregates = _get_aggregates(tuple(players), name, _group)
+    if not _group.default:
+        # 其他枱：各自一個 SQLite 檔，分數存長表 (每局只記落枱嘅玩家)
+        return AggregatingStore(SQLiteStore(os.path.join(_group.cache_dir, "hands.db"), players,
+                                            seats=_group.seats, name=_group.slug), aggregates)
+    sheets = SheetsStore(players, get_registry(), read_worksheet, invalidate_worksheet,
+                         lambda: get_master_cache(_group.csv_url, tuple(players)).refresh(),
+                         # 合併器 (consolidate) 第一次寫入先載入
+                         on_write=lambda title: get_consolidator(tuple(players)).mark_dirty(title))
+    # 所有寫入都經 AggregatingStore，物化統計表即時更新
+    if storage_backend() != "sqlite":
+        return AggregatingStore(sheets, aggregates)
+    from master_cache import CACHE_DIR
+    store = SQLiteStore(_storage_setting("sqlite_path", "MJ_SQLITE_PATH", os.path.join(CACHE_DIR, "hands.db")),
+                        players, seats=_group.seats)
+    # 第一次轉去 SQLite：由 Master Record 匯入一次全歷史 (讀唔到就下次開 app 再試)
+    try:
+        store.import_once(lambda: get_master_cache(_group.csv_url, tuple(players)).refresh())
+    except (OSError, ValueError) as e:
+        print(f"Master Record import skipped: {e}")
+    # 開咗 mirror 先會喺背景同步去 Google Sheets；冇網絡嘅時候 outbox 會等到連得返先寫
+    if str(_storage_setting("sync_sheets", "MJ_SYNC_SHEETS", "0")).lower() in ("1", "true", "yes"):
+        store.sync = SyncWorker(store, sheets)
+        store.sync.start()
+    return AggregatingStore(store, aggregates)
+
+def _group_frame(group, url, players):
+    """一張枱嘅全歷史：SQLite 直接讀，Sheets 經 MasterCache 增量同步；狀態 / checkpoint 放返嗰張枱嘅資料夾"""
+    if storage_backend(group) == "sqlite":
+        frame = get_store(players).master_frame()
+    else:
+        # 直接用 MasterCache (記憶體入面嗰份)，唔經 cache_data 複製成個 DataFrame
+        frame = get_master_cache(url, tuple(players)).refresh()
+    if not group.default:
+        frame.attrs['cache_dir'] = group.cache_dir
+    return frame
 
-@st.cache_data(ttl=5)
 def load_master_data(url, sheet_name, players):
+    # cache_data 命中就唔會入到 _load_master_data 裏面，所以 request 喺外面計、miss 喺裏面計
+    get_metrics().count("cache_requests_total", cache="load_master_data")
+    group = active_group(players)
+    return _load_master_data(url, sheet_name, tuple(players), group.name, group)
+
+@st.cache_data(ttl=5)
+def _load_master_data(url, sheet_name, players, group_name, _group):
     # 直接使用傳入的 url，不要再手動拼接 &gid=...
     # 因為我們在 app.py 已經定義好正確的純數字 GID URL 了
+    # TTL 過咗之後只會增量同步新行 (見 master_cache.py)，唔再成份 CSV 重新下載
+    # 上游冇改動 (304 / body hash 一樣) 就連 parse 都略過，版本唔變，指標 / 統計表快取照用
+    # SQLite 後端：全歷史直接由本地資料庫讀；物化統計表 (aggregates.py) 跟住追到最新
+    get_metrics().count("cache_misses_total", cache="load_master_data")
     try:
-        df = pd.read_csv(url)
-        
-        # 確保 Date 欄位轉換為日期格式
-        if 'Date' in df.columns:
-            df['Date'] = pd.to_datetime(df['Date'])
-            
-        return df
+        with get_metrics().timer("load_seconds", source="master"):
+            frame = _group_frame(_group, url, players)
+        with get_metrics().timer("load_seconds", source="aggregates"):
+            _get_aggregates(players, group_name, _group).sync(frame)
+        return frame
     except Exception as e:
+        get_metrics().count("load_errors_total", source="master")
         print(f"Error loading data: {e}")
+        import pandas as pd
         return pd.DataFrame()
+
+@st.cache_resource
+def get_consolidator(players):
+    from consolidate import Consolidator
+    return Consolidator(get_registry(), players)
+
+def consolidate_daily_tabs(players):
+    """將未合併 / 改過嘅每日分頁寫入 Master Record，之後 Master 快取會同步到新內容"""
+    result = get_consolidator(tuple(players)).run()
+    if result["rows"] or result["updated"] or result["deleted"]:
+        _load_master_data.clear()
+    return result
+
+def audit_daily_tabs(players):
+    """未合併 (包括今日) 嘅每日分頁逐個讀、逐個核對 (見 audit.py)；SQLite 後端冇分頁，返回空報告"""
+    group = active_group(players)
+    tabs = []
+    if storage_backend(group) == "sheets":
+        consolidator = get_consolidator(tuple(players))
+        tabs = consolidator.pending_tabs(consolidator.load_checkpoint(), include_today=True)
+    from audit import audit_frames
+    store = get_store(players)
+    # generator：一次只有一個分頁喺記憶體
+    return audit_frames(((t, store.day_frame(t, kind="analytics")) for t in tabs), players)
+
+def get_history_partitions(players):
+    group = active_group(players)
+    return _get_history_partitions(tuple(players), group.name, group)
+
+@st.cache_resource
+def _get_history_partitions(players, name, _group):
+    from partitions import HistoryPartitions
+    return HistoryPartitions(players, cache_dir=_group.cache_dir)
+
+def load_history(url, players):
+    """歷史頁用：Master Record 同步完之後更新年 / 月分區，返回 HistoryPartitions"""
+    players = tuple(players)
+    hist = get_history_partitions(players)
+    try:
+        frame = _group_frame(active_group(players), url, players)
+        with get_metrics().timer("load_seconds", source="history"):
+            hist.sync(frame)
+            get_aggregates(players).sync(frame)
+    except Exception as e:
+        get_metrics().count("load_errors_total", source="history")
+        print(f"Error syncing history: {e}")
+    return hist
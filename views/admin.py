@@ -0,0 +1,46 @@
+import os
+import time
+import streamlit as st
+import pandas as pd
+from metrics import METRICS_DIR, get_metrics
+
+def admin_enabled():
+    # 隱藏面板：網址加 ?admin=1，或者環境變數 MJ_ADMIN=1
+    if st.query_params.get("admin") == "1":
+        return True
+    return os.environ.get("MJ_ADMIN", "0").lower() in ("1", "true", "yes")
+
+def show_admin_panel():
+    """側邊欄效能監控：頁面 / 載入 / 指標計時、API 請求數、429、快取命中率，另可匯出"""
+    metrics = get_metrics()
+    snap = metrics.snapshot()
+    with st.sidebar.expander("🛠 效能監控", expanded=False):
+        st.caption(f"運行咗 {(time.time() - snap['started']) / 60:.1f} 分鐘")
+
+        # --- 1. 計時 ---
+        rows = [{"項目": t["name"], "標籤": ",".join(f"{k}={v}" for k, v in t["labels"].items()),
+                 "次數": t["count"], "平均 ms": round(t["sum"] / t["count"] * 1000, 1),
+                 "最長 ms": round(t["max"] * 1000, 1)} for t in snap["timings"]]
+        st.markdown("**⏱️ 計時**")
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+
+        # --- 2. Google API ---
+        api = [c for c in snap["counters"] if c["name"] == "api_calls_total"]
+        limited = sum(c["value"] for c in snap["counters"] if c["name"] == "api_429_total")
+        st.markdown(f"**🌐 API 請求** (429：{limited} 次)")
+        st.dataframe(pd.DataFrame([{"op": c["labels"].get("op"), "kind": c["labels"].get("kind"),
+                                    "次數": c["value"]} for c in api]),
+                     hide_index=True, use_container_width=True)
+
+        # --- 3. 快取 ---
+        st.markdown("**💾 快取命中率**")
+        st.dataframe(pd.DataFrame([{"快取": name, "請求": r, "未命中": m, "命中率": f"{rate:.0%}"}
+                                   for name, (r, m, rate) in metrics.cache_rates().items()]),
+                     hide_index=True, use_container_width=True)
+
+        # --- 4. 匯出 ---
+        c1, c2 = st.columns(2)
+        c1.download_button("Prometheus", metrics.prometheus(), file_name="metrics.prom", use_container_width=True)
+        if c2.button("寫入檔案", use_container_width=True):
+            metrics.export(force=True)
+            st.caption(f"已寫入 {os.path.join(METRICS_DIR, 'metrics.prom')} / metrics.json")
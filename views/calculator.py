@@ -1,105 +1,56 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta, timezone
-from utils import SHEET_URL, get_connection
-from streamlit_gsheets import GSheetsConnection
+from utils import active_group, get_store
+from metrics import get_metrics
+from scheduler import is_rate_limited
+from scoring import DEFAULT_RULESET, base_money, score_hand
+from sheets import HAND_ID_COL, StaleRowError, daily_header
 
 def get_hong_kong_time():
     """獲取當前香港時間 (UTC+8)"""
     return datetime.now(timezone(timedelta(hours=8)))
 
 def get_base_money_updated(fan):
-    fan_map = {3: 16, 4: 32, 5: 48, 6: 64, 7: 96, 8: 128, 9: 192, 10: 256}
-    return fan_map.get(fan, 256 if fan > 10 else 0)
-
-def show_calculator(players):
-    st.markdown("<h2 style='text-align: center;'>🧮 快速計分 (HKT)</h2>", unsafe_allow_html=True)
-    
-    # 1. 獲取香港日期與時間
-    hk_now = get_hong_kong_time()
-    today_tab_name = hk_now.strftime("%Y-%m-%d")
-    
-    conn = st.connection("gsheets", type=GSheetsConnection)
-
-    # --- 2. API 節流：使用 Session State 避免頻繁檢查 Tab ---
-    if 'last_checked_tab' not in st.session_state:
-        st.session_state.last_checked_tab = None
-
-    def ensure_today_tab():
-        # 如果本回合已經確認過當天分頁，直接跳過 API 請求
-        if st.session_state.last_checked_tab == today_tab_name:
-            return True
-        try:
-            gc = get_connection()
-            sh = gc.open_by_url(SHEET_URL)
-            try:
-                sh.worksheet(today_tab_name)
-                st.session_state.last_checked_tab = today_tab_name
-                return True
-            except:
-                header = ["Date"] + players + ["Winner", "Loser", "Method", "Fan", "Remark"]
-                new_ws = sh.add_worksheet(title=today_tab_name, rows="500", cols="15")
-                new_ws.append_row(header)
-                st.session_state.last_checked_tab = today_tab_name
-                st.toast(f"✨ 已建立今日香港分頁: {today_tab_name}")
-                return True
-        except Exception as e:
-            if "429" in str(e):
-                st.error("🚨 Google API 讀取太頻繁，請等候約 30 秒再試。")
-            else:
-                st.error(f"連線失敗: {e}")
-            return False
-
-    tab_ready = ensure_today_tab()
-
-    # --- 3. 數據讀取 (加上 5 秒緩存減少 API 調用) ---
-    df_today = pd.DataFrame()
-    if tab_ready:
-        try:
-            # ttl=5 表示 5 秒內刷新頁面不會重新請求 Google
-            df_today = conn.read(spreadsheet=SHEET_URL, worksheet=today_tab_name, ttl=5)
-            if not df_today.empty:
-                df_today[players] = df_today[players].apply(pd.to_numeric, errors='coerce').fillna(0)
-        except:
-            df_today = pd.DataFrame(columns=["Date"] + players + ["Winner", "Loser", "Method", "Fan", "Remark"])
-
-    # --- 4. 今日累計 Summary ---
-    if not df_today.empty and len(df_today) > 0:
-        today_sums = df_today[players].sum()
-        st.markdown("#### 📅 今日累計 (HKT)")
-        cols = st.columns(4)
-        for i, p in enumerate(players):
-            val = today_sums[p]
-            color = "#1e8e3e" if val > 0 else "#d93025" if val < 0 else "#5f6368"
-            cols[i].markdown(f"""
-                <div style="text-align:center; background-color:#f8f9fa; padding:8px 2px; border-radius:8px; border-bottom:4px solid {color};">
-                    <p style="margin:0; font-size:12px; color:#666;">{p}</p>
-                    <p style="margin:0; font-size:24px; font-weight:900; color:{color}; line-height:1.2;">{int(val):+d}</p>
-                </div>
-            """, unsafe_allow_html=True)
-    else:
-        st.info(f"🐣 香港時間 {today_tab_name} 尚未有紀錄")
-
-    st.divider()
-
-    # --- 5. 錄入界面 ---
-    if 'winner' not in st.session_state: st.session_state.winner = players[0]
-    if 'loser' not in st.session_state: st.session_state.loser = players[1]
+    return base_money(fan, "current")
+
+def refresh_today(players, today_tab_name):
+    """令下一次執行重新讀今日分頁"""
+    get_store(tuple(players)).invalidate(today_tab_name)
+    st.session_state.pop('today_cache', None)
+
+def _pick(role, player):
+    st.session_state[role] = player
+
+@st.fragment
+def entry_panel(players, today_tab_name, seated=None):
+    """
+    贏家 / 方式 / 輸家 / 番數 / 預覽：獨立 fragment，互動時只重算本地 res 預覽，唔會讀 Google。
+    seated 係今局落枱嘅玩家 (輪流上枱嘅枱)；計分同紀錄只包括佢哋。
+    """
+    # 每次互動 (fragment 重跑) 嘅 server 端時間，見效能面板 / benchmarks/bench_entry_panel.py
+    with get_metrics().timer("entry_panel_seconds"):
+        _entry_panel(players, today_tab_name, seated)
+
+def _entry_panel(players, today_tab_name, seated):
+    roster, players = players, list(seated or players)
+    if st.session_state.get('winner') not in players: st.session_state.winner = players[0]
+    if st.session_state.get('loser') not in players: st.session_state.loser = players[1]
 
     st.markdown("🏆 **誰贏了？**")
-    w_cols = st.columns(4)
+    w_cols = st.columns(len(players))
     for i, p in enumerate(players):
         is_selected = (st.session_state.winner == p)
-        if w_cols[i].button(p, key=f"win_{p}", use_container_width=True, type="primary" if is_selected else "secondary"):
-            st.session_state.winner = p
-            st.rerun()
+        # on_click 喺 fragment 重跑之前改好 session state，唔使再 st.rerun()
+        w_cols[i].button(p, key=f"win_{p}", use_container_width=True, type="primary" if is_selected else "secondary",
+                         on_click=_pick, args=("winner", p))
 
     mode = st.radio("🎲 **方式**", ["出統", "自摸", "包自摸"], horizontal=True)
     
     loser_display = "三家"
     if mode in ["出統", "包自摸"]:
         st.markdown(f"💸 **誰{'付錢' if mode=='出統' else '包牌'}？**")
-        l_cols = st.columns(4)
+        l_cols = st.columns(len(players))
         if st.session_state.loser == st.session_state.winner:
             st.session_state.loser = [p for p in players if p != st.session_state.winner][0]
 
@@ -108,30 +59,18 @@ def show_calculator(players):
                 l_cols[players.index(p)].button(p, key=f"lose_dis_{p}", use_container_width=True, disabled=True)
             else:
                 is_selected = (st.session_state.loser == p)
-                if l_cols[players.index(p)].button(p, key=f"lose_{p}", use_container_width=True, type="primary" if is_selected else "secondary"):
-                    st.session_state.loser = p
-                    st.rerun()
+                l_cols[players.index(p)].button(p, key=f"lose_{p}", use_container_width=True, type="primary" if is_selected else "secondary",
+                                                on_click=_pick, args=("loser", p))
         loser_display = st.session_state.loser
         
     fan = st.select_slider("🔥 **番數**", options=list(range(3, 14)), value=3)
     
-    # 計算得分
-    base = get_base_money_updated(fan)
-    res = {p: 0 for p in players}
-    if mode == "出統":
-        res[st.session_state.winner], res[st.session_state.loser] = int(base), int(-base)
-    elif mode == "自摸":
-        each_pay = base / 2
-        res[st.session_state.winner] = int(each_pay * 3)
-        for p in players:
-            if p != st.session_state.winner: res[p] = int(-each_pay)
-    elif mode == "包自摸":
-        total_pay = (base / 2) * 3
-        res[st.session_state.winner], res[st.session_state.loser] = int(total_pay), int(-total_pay)
+    # 計算得分 (規則見 scoring.py)
+    res = score_hand(st.session_state.winner, st.session_state.loser, mode, fan, players, DEFAULT_RULESET)
 
     # 變動預覽
     st.markdown("#### ⚡ 變動預覽")
-    p_cols = st.columns(4)
+    p_cols = st.columns(len(players))
     for i, p in enumerate(players):
         val = res[p]
         bg = "#e6f4ea" if val > 0 else "#fce8e6" if val < 0 else "#f1f3f4"
@@ -152,37 +91,132 @@ def show_calculator(players):
             }
             new_entry.update(res)
             try:
-                # 重新讀取以獲取最新列表進行合併
-                df_latest = conn.read(spreadsheet=SHEET_URL, worksheet=today_tab_name, ttl=0)
-                if df_latest.empty: updated_df = pd.DataFrame([new_entry])
-                else: updated_df = pd.concat([df_latest, pd.DataFrame([new_entry])], ignore_index=True)
-                
-                conn.update(spreadsheet=SHEET_URL, worksheet=today_tab_name, data=updated_df)
+                # 單行 append：唔再讀成張表再寫返，兩部手機同時交都唔會互相覆蓋
+                hand_id, row = get_store(tuple(roster)).append(today_tab_name, new_entry)
+                st.session_state.setdefault('hand_rows', {})[hand_id] = row
+                refresh_today(roster, today_tab_name)
                 st.success("✅ 紀錄成功")
+                # 今日累計要更新，所以呢度先重跑成頁
                 st.rerun()
             except Exception as e: st.error(f"上傳失敗: {e}")
 
+def show_calculator(players):
+    st.markdown("<h2 style='text-align: center;'>🧮 快速計分 (HKT)</h2>", unsafe_allow_html=True)
+    
+    # 1. 獲取香港日期與時間
+    hk_now = get_hong_kong_time()
+    today_tab_name = hk_now.strftime("%Y-%m-%d")
+    
+    # --- 2. API 節流：分頁 handle 由全 process 共用嘅 registry 快取，熱咗之後唔使 call API ---
+    # 儲存後端 (Google Sheets / 本地 SQLite) 由 utils.get_store 決定
+    store = get_store(tuple(players))
+    group = active_group(players)
+
+    def ensure_today_tab():
+        try:
+            created = store.ensure_day(today_tab_name)
+            if created:
+                st.toast(f"✨ 已建立今日香港分頁: {today_tab_name}")
+            return True
+        except Exception as e:
+            if is_rate_limited(e):
+                st.error("🚨 Google API 讀取太頻繁 (已自動重試)，請等候約 30 秒再試。")
+            else:
+                st.error(f"連線失敗: {e}")
+            return False
+
+    tab_ready = ensure_today_tab()
+
+    # --- 3. 數據讀取：結果存喺 session，只有上傳 / 撤銷 / 手動刷新先會再讀 Google ---
+    df_today = pd.DataFrame()
+    if tab_ready:
+        cached = st.session_state.get('today_cache')
+        # 轉咗枱都要重新讀 (key 包埋枱名)
+        cache_key = (group.name, today_tab_name)
+        if cached is None or cached[0] != cache_key:
+            try:
+                # 上傳 / 撤銷之後 read_worksheet 嘅快取會即刻失效，讀到最新
+                # 後端已經轉好標準型別 (分數 int32、Date datetime64)
+                df_today = store.day_frame(today_tab_name, ttl=5)
+            except:
+                df_today = pd.DataFrame(columns=daily_header(players))
+            st.session_state.today_cache = (cache_key, df_today)
+        df_today = st.session_state.today_cache[1]
+
+    # --- 4. 今日累計 Summary ---
+    if not df_today.empty and len(df_today) > 0:
+        # 直接加總下面清單嗰啲行 (一日只係幾十局)：物化統計表可能未追到其他機寫入嘅局，會同清單對唔上
+        today_sums = df_today[players].sum()
+        st.markdown("#### 📅 今日累計 (HKT)")
+        cols = st.columns(len(players))
+        for i, p in enumerate(players):
+            val = today_sums[p]
+            color = "#1e8e3e" if val > 0 else "#d93025" if val < 0 else "#5f6368"
+            cols[i].markdown(f"""
+                <div style="text-align:center; background-color:#f8f9fa; padding:8px 2px; border-radius:8px; border-bottom:4px solid {color};">
+                    <p style="margin:0; font-size:12px; color:#666;">{p}</p>
+                    <p style="margin:0; font-size:24px; font-weight:900; color:{color}; line-height:1.2;">{int(val):+d}</p>
+                </div>
+            """, unsafe_allow_html=True)
+    else:
+        st.info(f"🐣 香港時間 {today_tab_name} 尚未有紀錄")
+
+    if st.button("🔄 重新整理", use_container_width=True):
+        refresh_today(players, today_tab_name)
+        st.rerun()
+
+    st.divider()
+
+    # --- 5. 錄入界面 (fragment：撳掣只會重跑呢一部分，唔會重跑成個 app) ---
+    seated = players
+    if group.seats < len(players):
+        # 名單多過一張枱：先揀今局落枱嘅人 (記住上一局嘅揀法)
+        st.session_state.setdefault("seated", players[:group.seats])
+        seated = st.multiselect("🪑 **今局落枱**", players, key="seated", max_selections=group.seats)
+    if len(seated) == group.seats:
+        entry_panel(players, today_tab_name, seated)
+    else:
+        st.info(f"請揀 {group.seats} 位落枱玩家")
+
     st.divider()
 
     # --- 6. 管理今日數據 ---
     if not df_today.empty and len(df_today) > 0:
         st.markdown("#### ⚙️ 今日對局清單 (按時間倒序)")
         display_df = df_today.copy().sort_index(ascending=False)
+        display_df['Date'] = display_df['Date'].dt.strftime("%H:%M")
         st.dataframe(display_df[["Date", "Winner", "Loser", "Method", "Fan"] + players], hide_index=True)
 
+        # 最後一局嘅定位資料：一定按 HandID 搵；行號只係呢部機自己寫入時記低嘅提示，用嚟少讀一欄
+        last = df_today.iloc[-1]
+        last_id = str(last[HAND_ID_COL]) if HAND_ID_COL in df_today.columns and pd.notna(last[HAND_ID_COL]) else ""
+        last_row = st.session_state.get('hand_rows', {}).get(last_id)
+        expected = {c: last[c] for c in players + ["Winner", "Loser", "Method", "Fan"] if c in df_today.columns}
+        expected[HAND_ID_COL] = last_id
+
+        if not last_id:
+            st.caption("最後一局冇 HandID (舊版或者手動加嘅行)，唔可以喺度撤銷 / 修改，請直接喺 Google Sheet 改。")
         col_undo, col_edit = st.columns(2)
         with col_undo:
-            if st.button("🗑️ 撤銷最後一局 (Undo)", use_container_width=True):
-                updated_df = df_today.drop(df_today.index[-1])
-                conn.update(spreadsheet=SHEET_URL, worksheet=today_tab_name, data=updated_df)
-                st.toast("已刪除最後一筆紀錄")
-                st.rerun()
+            if st.button("🗑️ 撤銷最後一局 (Undo)", use_container_width=True, disabled=not last_id):
+                try:
+                    store.delete(today_tab_name, last_id, hint=last_row, expected=expected)
+                    refresh_today(players, today_tab_name)
+                    st.toast("已刪除最後一筆紀錄")
+                    st.rerun()
+                except StaleRowError:
+                    refresh_today(players, today_tab_name)
+                    st.error("⚠️ 最後一局已被其他裝置改動，請重新整理後再試。")
         
         with col_edit:
             with st.expander("📝 修正備註"):
-                last_remark = str(df_today.iloc[-1]['Remark']) if 'Remark' in df_today.columns else ""
+                last_remark = str(last['Remark']) if 'Remark' in df_today.columns else ""
                 new_remark = st.text_input("修正最後一局備註", value=last_remark)
-                if st.button("💾 更新", use_container_width=True):
-                    df_today.at[df_today.index[-1], 'Remark'] = new_remark
-                    conn.update(spreadsheet=SHEET_URL, worksheet=today_tab_name, data=df_today)
-                    st.rerun()
+                if st.button("💾 更新", use_container_width=True, disabled=not last_id):
+                    try:
+                        store.update_cell(today_tab_name, "Remark", new_remark, last_id, hint=last_row, expected=expected)
+                        refresh_today(players, today_tab_name)
+                        st.rerun()
+                    except StaleRowError:
+                        refresh_today(players, today_tab_name)
+                        st.error("⚠️ 最後一局已被其他裝置改動，請重新整理後再試。")
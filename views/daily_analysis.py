@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta, timezone
-from utils import SHEET_URL
-from streamlit_gsheets import GSheetsConnection
+from transfers import get_transfers
+from utils import get_store
 
 def get_hkt():
     return datetime.now(timezone(timedelta(hours=8)))
@@ -10,26 +10,28 @@ def get_hkt():
 def show_daily_analysis(players):
     st.markdown("<h2 style='text-align: center;'>🔍 今日戰局深度復盤</h2>", unsafe_allow_html=True)
     
-    conn = st.connection("gsheets", type=GSheetsConnection)
     hkt_now = get_hkt()
     today_tab_name = hkt_now.strftime("%Y-%m-%d")
 
+    store = get_store(tuple(players))
     try:
         # 分析頁面建議 TTL 設長一點，節省 API 配額
-        df = conn.read(spreadsheet=SHEET_URL, worksheet=today_tab_name, ttl=20)
+        df = store.day_frame(today_tab_name, ttl=20, kind="analytics")
         if df.empty or len(df) == 0:
             st.info("🐣 今日尚無對局數據。")
             return
-        for p in players:
-            df[p] = pd.to_numeric(df[p], errors='coerce').fillna(0)
     except Exception as e:
         st.warning(f"尚未建立今日 ({today_tab_name}) 的數據表或連線受限。")
         return
 
     # 1. Metrics
     st.subheader("🏆 今日英雄榜")
+    # 總分 / 贏牌 / 放銃 由今日分頁嗰啲行計 (同下面圖表 / 流向同一份數據)；
+    # 物化統計表可能未追到其他機寫入嘅局
     sums = df[players].sum()
-    m_cols = st.columns(4)
+    count = lambda s: s.astype(str).value_counts().reindex(players, fill_value=0)
+    today = pd.DataFrame({"wins": count(df['Winner']), "feeds": count(df.loc[df['Method'] == "出統", 'Loser'])})
+    m_cols = st.columns(len(players))
     for i, p in enumerate(players):
         m_cols[i].metric(label=p, value=f"{int(sums[p]):+d}")
 
@@ -42,15 +44,21 @@ def show_daily_analysis(players):
 
     # 3. Stats
     st.subheader("⚔️ 行為分析")
-    stats = []
-    for p in players:
-        wins = len(df[df['Winner'] == p])
-        feeds = len(df[(df['Loser'] == p) & (df['Method'] == '出統')])
-        stats.append({"玩家": p, "贏牌": wins, "放銃": feeds})
-    st.bar_chart(pd.DataFrame(stats).set_index("玩家"))
+    stats = today[["wins", "feeds"]].rename(columns={"wins": "贏牌", "feeds": "放銃"}).rename_axis("玩家")
+    st.bar_chart(stats)
+
+    # 邊個俾錢邊個 (付款 → 收款)，同 dashboard 用同一個引擎
+    st.subheader("💸 今日資金流向")
+    money, count = get_transfers(df, players).matrix()
+    st.dataframe(money.astype(str) + " (" + count.astype(str) + "局)", use_container_width=True)
 
     # 4. Big Hands
     st.subheader("🔥 大牌回顧 (>= 5番)")
-    df['Fan'] = pd.to_numeric(df['Fan'], errors='coerce').fillna(0)
-    big = df[df['Fan'] >= 5][["Date", "Winner", "Loser", "Method", "Fan"]]
+    if store.kind == "sqlite":
+        # SQLite：直接用 (fan, ts) 索引查
+        day_start = datetime.strptime(today_tab_name, "%Y-%m-%d")
+        big = store.query(start=day_start, end=day_start + timedelta(days=1), min_fan=5)
+    else:
+        big = df[df['Fan'] >= 5]
+    big = big[["Date", "Winner", "Loser", "Method", "Fan"]].assign(Date=big['Date'].dt.strftime("%H:%M"))
     st.dataframe(big, hide_index=True, use_container_width=True)
@@ -1,6 +1,25 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
+from indicators import get_indicators, minmax_points
+from ratings import get_ratings
+from simulation import DRAWDOWN, get_projection, projection_error
+from scoring import METHODS
+from transfers import BAND_LABELS, get_transfers
+
+def show_projection_pending(df_master, players, threshold):
+    # 模擬喺背景計緊：fragment 每秒睇一次，計好 (或者失敗) 就成頁重畫 (之後唔再 poll)
+    error = projection_error(df_master, players)
+    if error is not None:
+        st.error(f"Monte Carlo 模擬失敗：{error}")
+        return
+
+    @st.fragment(run_every=1)
+    def poll():
+        if get_projection(df_master, players, threshold=threshold) is not None \
+                or projection_error(df_master, players) is not None:
+            st.rerun()
+        st.caption("⏳ Monte Carlo 模擬中...")
+    poll()
 
 def show_dashboard(df_master, players):
     st.markdown("<h2 style='text-align: center; color: #1C2833;'>📊 雀壇全方位量化數據儀表板</h2>", unsafe_allow_html=True)
@@ -12,25 +31,33 @@ def show_dashboard(df_master, players):
     # --- 1. 個人化動態指標卡 (KPI Metrics Cards) ---
     st.subheader("🎯 即時戰力監控與近期走勢 (Real-time Form)")
     
+    # 所有指標一次過由共用引擎計 (按數據版本快取)
+    ind = get_indicators(df_master, players)
+    summary = ind["summary"]
+    # Monte Carlo 預測 (按數據版本快取；未計好就返回 None，唔阻住 render)
+    threshold = st.session_state.get("mc_threshold", DRAWDOWN)
+    proj = get_projection(df_master, players, threshold=threshold)
+
     for p in players:
         # 數據提取
-        series = pd.to_numeric(df_master[p], errors='coerce').fillna(0)
-        current_total = series.sum()
-        last_val = series.iloc[-1]
+        row = summary.loc[p]
+        if row["hands"] == 0:
+            # 輪流上枱：名單上未落過枱嘅玩家
+            st.markdown(f"#### 👤 {p}")
+            st.caption("未有落枱記錄")
+            continue
+        current_total = row["total"]
+        last_val = row["last"]
         
         # 近 5 場表現紀錄 (Form Guide: WWLLW)
-        last_5 = series.tail(5).tolist()
+        last_5 = ind["form"][p].dropna().tolist()
         form_str = "".join(["<span style='color:#28B463;font-weight:bold;'>W</span>" if x > 0 else 
                             "<span style='color:#E74C3C;font-weight:bold;'>L</span>" if x < 0 else 
                             "<span style='color:#BDC3C7;font-weight:bold;'>D</span>" for x in last_5])
         
-        # 動量計算 (Momentum)
-        short_ma = series.tail(3).mean()
-        long_ma = series.mean()
-        momentum_idx = short_ma - long_ma
-        
-        # 下場預測 (Next Game Expected)
-        expected_next = long_ma + (momentum_idx * 0.3)
+        # 動量計算 (Momentum) 同 下場預測 (Next Game Expected)
+        momentum_idx = row["momentum"]
+        expected_next = row["expected_next"]
 
         # UI 排版
         with st.container():
@@ -39,13 +66,21 @@ def show_dashboard(df_master, players):
             
             c1, c2, c3, c4 = st.columns(4)
             with c1:
-                st.metric("Current Score", f"{int(current_total)}", delta=f"{int(series.mean())} (Avg)")
+                st.metric("Current Score", f"{int(current_total)}", delta=f"{int(row['mean'])} (Avg)")
             with c2:
                 # 顯示上一場相較於前一場的增減
-                diff = int(last_val - series.iloc[-2]) if len(series)>1 else 0
+                diff = int(last_val - row["prev"])
                 st.metric("Last Game", f"{int(last_val)}", delta=f"{diff:+} pts")
             with c3:
-                st.metric("Next Game Exp.", f"{expected_next:+.1f}", help="基於近期動能與歷史期望值的加權預測")
+                if proj is not None:
+                    sim = proj.loc[p]
+                    # 模擬係成場 (每場 = 每日局數中位數)，唔係單局
+                    st.metric("Next Session Exp.", f"{sim['expected']:+.0f}",
+                              delta=f"{sim['p5']:+.0f} ~ {sim['p95']:+.0f}", delta_color="off",
+                              help=f"下一場 ({proj.attrs['hands']} 局) 嘅期望盈虧；Monte Carlo："
+                                   f"{proj.attrs['sessions']} 場模擬，90% 區間")
+                else:
+                    st.metric("Next Game Exp.", f"{expected_next:+.1f}", help="基於近期動能與歷史期望值的加權預測")
             with c4:
                 m_label = "🔥 強勢" if momentum_idx > 10 else "🧊 轉冷" if momentum_idx < -10 else "⚖️ 平穩"
                 st.metric("Momentum", m_label, delta=f"{momentum_idx:+.1f}")
@@ -56,42 +91,70 @@ def show_dashboard(df_master, players):
     st.subheader("📋 全方位量化數據矩陣 (Indicators Matrix)")
     
     summary_data = {}
-    min_periods = 5 
-    
     for p in players:
-        series = pd.to_numeric(df_master[p], errors='coerce').fillna(0)
-        price_series = series.cumsum()
-        wins = series[series > 0]
-        losses = series[series < 0]
-        
-        # 技術指標
-        gain = (series.where(series > 0, 0)).rolling(window=min_periods, min_periods=1).mean()
-        loss = (-series.where(series < 0, 0)).rolling(window=min_periods, min_periods=1).mean()
-        rs = gain / loss
-        rsi = (100 - (100 / (1 + rs))).iloc[-1]
-        
-        # 財務指標
-        win_rate = (len(wins) / len(series)) * 100 if len(series) > 0 else 0
-        running_max = price_series.cummax()
-        mdd = (price_series - running_max).min()
-        pl_ratio = (wins.mean() / abs(losses.mean())) if not losses.empty and losses.mean() != 0 else 0
-        sharpe = (series.mean() / series.std()) if series.std() > 0 else 0
-        
+        row = summary.loc[p]
         summary_data[p] = {
-            "RSI 動能": f"{rsi:.1f}",
-            "勝率 %": f"{win_rate:.1f}%",
-            "最大回撤 MDD": f"{mdd:.0f}",
-            "盈虧比 P/L": f"{pl_ratio:.2f}",
-            "夏普比率 Sharpe": f"{sharpe:.2f}",
-            "波動率 σ": f"{series.std():.1f}"
+            "RSI 動能": f"{row['rsi']:.1f}",
+            "勝率 %": f"{row['win_rate']:.1f}%",
+            "最大回撤 MDD": f"{row['mdd']:.0f}",
+            "盈虧比 P/L": f"{row['pl_ratio']:.2f}",
+            "夏普比率 Sharpe": f"{row['sharpe']:.2f}",
+            "波動率 σ": f"{row['std']:.1f}"
         }
 
     st.table(pd.DataFrame(summary_data))
 
-    # --- 3. 資本曲線圖表 ---
+    # --- 3. Monte Carlo 下場模擬 ---
+    st.divider()
+    st.subheader("🎲 下場模擬 (Monte Carlo)")
+    st.number_input("回撤警戒線 (分)", min_value=100, max_value=10000, value=DRAWDOWN, step=100, key="mc_threshold")
+    if proj is None:
+        show_projection_pending(df_master, players, threshold)
+    else:
+        st.table(pd.DataFrame({p: {
+            "期望盈虧": f"{proj.loc[p, 'expected']:+.0f}",
+            "P5 / P50 / P95": f"{proj.loc[p, 'p5']:+.0f} / {proj.loc[p, 'p50']:+.0f} / {proj.loc[p, 'p95']:+.0f}",
+            "贏錢機率": f"{proj.loc[p, 'p_win']:.0%}",
+            f"回撤 > {threshold} 機率": f"{proj.loc[p, 'p_drawdown']:.0%}",
+        } for p in players}))
+        st.caption(f"由 {len(df_master)} 局歷史有放回抽樣，模擬 {proj.attrs['sessions']} 場 × {proj.attrs['hands']} 局 (每日局數中位數)")
+
+    # --- 4. 對戰資金流向 (Head-to-Head) ---
+    st.divider()
+    st.subheader("🤝 對戰資金流向 (Head-to-Head)")
+    first, last = df_master['Date'].min().date(), df_master['Date'].max().date()
+    f1, f2, f3 = st.columns([2, 1, 1])
+    span = f1.date_input("日期範圍", value=(first, last), min_value=first, max_value=last, key="h2h_span")
+    method = f2.selectbox("方式", ["全部"] + METHODS, key="h2h_method")
+    band = f3.selectbox("番數", ["全部"] + BAND_LABELS, key="h2h_band")
+    # 未揀完結束日期嗰陣 date_input 只得一個值
+    start, end = (span[0], span[-1]) if span else (first, last)
+    money, count = get_transfers(df_master, players).matrix(
+        start, end, None if method == "全部" else method, None if band == "全部" else band)
+    h1, h2 = st.columns(2)
+    h1.markdown("**付款 → 收款 金額**")
+    h1.dataframe(money, use_container_width=True)
+    h2.markdown("**局數**")
+    h2.dataframe(count, use_container_width=True)
+    st.caption("行係付款人、欄係收款人；自摸時三家各自計一筆。淨額 = 欄總和 − 行總和。")
+
+    # --- 5. 實力評分 (Glicko) ---
+    st.divider()
+    st.subheader("⭐ 實力評分 (Glicko)")
+    rating, traj, _ = get_ratings(df_master, players)
+    r_cols = st.columns(len(players))
+    for i, p in enumerate(players):
+        with r_cols[i]:
+            st.metric(p, f"{rating.loc[p, 'rating']:.0f}", f"±{2 * rating.loc[p, 'rd']:.0f}", delta_color="off")
+    if len(traj):
+        st.line_chart(traj.iloc[minmax_points(traj.to_numpy())])
+    st.caption("每局同其他三家逐個比較分數高低 (唔理贏幾多)，一日 = 一個評分期；± 係兩個 RD，即九成五把握嘅範圍。")
+
+    # --- 6. 資本曲線圖表 ---
     st.subheader("📈 歷史資本累積曲線 (Equity Curve)")
-    df_cumulative = df_master[players].cumsum()
+    # 降採樣版本 (每條線最多 CHART_POINTS 點，保留頂位同谷底)
+    df_cumulative = ind["charts"]["equity"].copy()
     # 確保日期索引正確
     if 'Date' in df_master.columns:
-        df_cumulative.index = pd.to_datetime(df_master['Date'])
+        df_cumulative.index = pd.to_datetime(df_master['Date'].iloc[df_cumulative.index])
     st.line_chart(df_cumulative)
@@ -1,25 +1,74 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from partitions import PAGE_SIZE
+from reports import FORMATS, cached_report, get_report, is_pending, periods, report_error
+from scoring import compare_rulesets
+from utils import get_aggregates
 
-def show_history(df_master, players):
+def show_report_pending(history, players, period, fmt):
+    # 報告喺 process pool 畫緊：fragment 每秒睇一次，畫好 (或者失敗) 就成頁重畫
+    @st.fragment(run_every=1)
+    def poll():
+        if get_report(history, players, period, fmt) is not None or report_error(history, period, fmt):
+            st.rerun()
+        st.caption("⏳ 報告生成中...")
+    poll()
+
+def show_report_export(history, players):
+    st.subheader("🖨️ 匯出報告 (PNG / PDF)")
+    c1, c2 = st.columns([2, 1])
+    period = c1.selectbox("期間", periods(history), key="report_period")
+    fmt = c2.radio("格式", FORMATS, horizontal=True, key="report_fmt", format_func=str.upper)
+    # 已經畫過 (同一期間 + 數據版本) 就直接讀檔；否則要撳掣先排隊畫
+    path = cached_report(history, period, fmt)
+    error = report_error(history, period, fmt) if path is None else None
+    if error is not None:
+        st.error(f"報告生成失敗：{error}")
+        if st.button("重試", key="report_retry"):
+            path = get_report(history, players, period, fmt, retry=True)
+    elif path is None and not is_pending(history, period, fmt) and st.button("產生報告", key="report_go"):
+        path = get_report(history, players, period, fmt)
+    if path is not None:
+        with open(path, "rb") as f:
+            st.download_button(f"⬇️ 下載 {period} 報告", f.read(), file_name=f"mahjong_{period}.{fmt}",
+                               mime="application/pdf" if fmt == "pdf" else "image/png")
+    elif is_pending(history, period, fmt):
+        show_report_pending(history, players, period, fmt)
+
+RULESET_LABELS = {"classic": "舊番數表", "current": "現行番數表"}
+
+def show_ruleset_compare(history, players):
+    st.subheader("🔁 換規則重新計分")
+    st.caption("用另一套番數表將成個歷史一次過重新計，睇每人總分點變 (唔會改數據)")
+    # 要讀晒所有月份：撳掣先計，結果按數據版本記喺 session
+    key = history.meta()["version"]
+    cached = st.session_state.get("ruleset_compare")
+    if (cached is None or cached[0] != key) and st.button("重新計分", key="ruleset_go"):
+        cached = (key, compare_rulesets(history.frame(), players, tuple(RULESET_LABELS)))
+        st.session_state.ruleset_compare = cached
+    if cached is not None and cached[0] == key:
+        table = cached[1].astype(int)
+        table["差額"] = table["classic"] - table["current"]
+        st.dataframe(table.rename(columns=RULESET_LABELS), use_container_width=True,
+                     column_config={c: st.column_config.NumberColumn(c, format="$%d")
+                                    for c in list(RULESET_LABELS.values()) + ["差額"]})
+
+def show_history(history, players):
     st.markdown("<h2 style='text-align: center;'>📜 歷史紀錄</h2>", unsafe_allow_html=True)
     
-    if df_master.empty:
+    # history 係 partitions.HistoryPartitions (年 / 月分區)；年度統計查物化統計表
+    agg = get_aggregates(tuple(players))
+    total_rows = history.total_rows()
+    if total_rows == 0:
         st.warning("目前尚無歷史數據。")
         return
 
     # --- 1. 年度總結 ---
     st.subheader("📅 年度戰績總結")
     
-    df_yearly = df_master.copy()
-    df_yearly['Year'] = df_yearly['Date'].dt.year
-    
-    # 算各人年度總分
-    yearly_summary = df_yearly.groupby('Year')[players].sum().sort_index(ascending=False)
-    
-    # 修正對局天數：計算該年度不重複日期
-    yearly_days = df_yearly.groupby('Year')['Date'].apply(lambda x: x.dt.date.nunique())
+    # 各人年度總分 (預先計好)
+    yearly_summary = agg.table("year").rename(index=int).rename_axis('Year')
     
     # 格式化：贏家加皇冠
     def add_winner_emoji_after(row):
@@ -31,17 +80,21 @@ def show_history(df_master, players):
         return formatted
 
     display_yearly = yearly_summary.apply(add_winner_emoji_after, axis=1)
-    display_yearly['天數'] = yearly_days
+    # 對局天數：該年度不重複日期
+    display_yearly['天數'] = agg.table("year", "days").rename(index=int)
     
     # 顯示年度表格
-    st.dataframe(display_yearly, width='stretch')
+    st.dataframe(display_yearly, use_container_width=True)
 
     st.divider()
 
-    # --- 2. 每日對局明細 (移除 Remark) ---
+    # --- 2. 每日明細 (移除 Remark) ---
     st.subheader("📝 每日明細 (倒序)")
-    
-    history_display = df_master.copy().sort_values(by="Date", ascending=False)
+
+    # 分區已經按時間排好，每頁只讀涉及嘅月份，唔使成個歷史複製再排序
+    pages = max((total_rows + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+    page_no = st.number_input(f"頁數 (共 {pages} 頁，{total_rows:,} 局)", min_value=1, max_value=pages, value=1, step=1)
+    history_display = history.page(int(page_no) - 1)
     # iPhone 顯示精簡化：只留 月/日 時:分
     history_display['日期'] = history_display['Date'].dt.strftime('%m/%d %H:%M')
     
@@ -50,7 +103,7 @@ def show_history(df_master, players):
     
     st.dataframe(
         final_display,
-        width='stretch',
+        use_container_width=True,
         column_config={
             # 縮窄每一欄，確保 iPhone 直屏能顯示更多內容
             **{p: st.column_config.NumberColumn(p, width="small", format="$%d") for p in players}
@@ -60,15 +113,23 @@ def show_history(df_master, players):
     # --- 3. 年度之最 ---
     st.divider()
     current_year = datetime.now().year
-    this_year_data = df_yearly[df_yearly['Year'] == current_year]
     
-    if not this_year_data.empty:
+    if current_year in yearly_summary.index:
+        this_year = agg.lookup("year", str(current_year))
         st.subheader(f"🏆 {current_year} 年度之最")
         c1, c2 = st.columns(2)
         with c1:
-            big_winner = this_year_data[players].sum().idxmax()
+            big_winner = this_year["total"].idxmax()
             st.metric("年度金主", big_winner)
         with c2:
-            max_single = this_year_data[players].max().max()
-            lucky_guy = this_year_data[players].max().idxmax()
+            max_single = this_year["max"].max()
+            lucky_guy = this_year["max"].idxmax()
             st.metric("最強單局", lucky_guy, f"${max_single:,.0f}")
+
+    # --- 4. 換規則重新計分 ---
+    st.divider()
+    show_ruleset_compare(history, players)
+
+    # --- 5. 匯出報告 ---
+    st.divider()
+    show_report_export(history, players)